@@ -3,31 +3,63 @@
 #
 # InfluxDB に記録された外気温と室内気温に基づいて
 # 換気扇を自動制御します．
+#
+# この Pi で計測している値 (室内気温やバッテリー電圧) は，InfluxDB に
+# 問い合わせずに /dev/shm のリングバッファ (lib/ring.py) から読みます．
+# InfluxDB を使うのは，他のホスト (外気温) の値と，ローカルに値が無い場合だけです．
 
-import subprocess
 import sys
+import time
+import json
+import socket
 import logging
 import logging.handlers
 import gzip
+import signal
 import pathlib
+import argparse
+import threading
 import yaml
 import os
 import influxdb_client
 
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lib"))
+
+import ring
+import gpio
+
+# NOTE: 3 分毎の平均の 3 点の移動平均を求めるので，範囲は 15 分あれば足りる．
+# 全ての値を 1 回のクエリで取得し，系列毎の最後の値だけ返す
 FLUX_QUERY = """
 from(bucket: "{bucket}")
     |> range(start: -{period})
-    |> filter(fn:(r) => r._measurement == "{measure}")
-    |> filter(fn: (r) => r.hostname == "{hostname}")
-    |> filter(fn: (r) => r["_field"] == "{param}")
+    |> filter(fn: (r) => {cond})
     |> aggregateWindow(every: 3m, fn: mean, createEmpty: false)
     |> exponentialMovingAverage(n: 3)
-    |> sort(columns: ["_time"], desc: true)
-    |> limit(n: 1)
+    |> last()
 """
+FLUX_COND = '(r._measurement == "{measure}" and r.hostname == "{hostname}" and r._field == "{param}")'
+FLUX_PERIOD = "15m"
 
 CONFIG_PATH = "./config.yml"
 
+# NOTE: FLUX_QUERY (3 分毎の平均の 3 点の移動平均) に合わせて，
+# ローカルの値は直近 9 分間の平均にする
+LOCAL_PERIOD = 9 * 60
+
+# InfluxDB から取得できなかった場合に，前回の値を使う期間 [sec]
+CACHE_PATH = "/dev/shm/fan_control_cache.json"
+CACHE_TTL = 30 * 60
+
+# 常駐モードで，リングバッファの新しい計測値を確認する間隔 [sec]
+POLL_INTERVAL = 2
+# 常駐モードで，この Pi の値として使う計測値の最大の古さ [sec]
+LOCAL_MAX_AGE = 10 * 60
+# 常駐モードで，他のホストの値を InfluxDB に問い合わせる間隔 [sec]
+REMOTE_INTERVAL = 3 * 60
+
+_client = None
+
 
 def load_config():
     path = str(pathlib.Path(os.path.dirname(__file__), CONFIG_PATH))
@@ -67,48 +99,160 @@ def get_logger():
     return logger
 
 
-def get_db_value(
-    config,
-    hostname,
-    measure,
-    param,
-):
-    client = influxdb_client.InfluxDBClient(
-        url=config["influxdb"]["url"],
-        token=config["influxdb"]["token"],
-        org=config["influxdb"]["org"],
-    )
+# NOTE: 接続を使い回すように，クライアントは 1 つだけ作る
+def get_client(config):
+    global _client
+
+    if _client is None:
+        _client = influxdb_client.InfluxDBClient(
+            url=config["influxdb"]["url"],
+            token=config["influxdb"]["token"],
+            org=config["influxdb"]["org"],
+        )
+    return _client
+
+
+def close_client():
+    global _client
+
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def load_cache():
+    try:
+        with open(CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    tmp_path = "{}.{}".format(CACHE_PATH, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError:
+        pass
+
 
-    query_api = client.query_api()
+def get_cache_key(hostname, measure, param):
+    return "{}/{}/{}".format(hostname, measure, param)
 
-    table_list = query_api.query(
-        query=FLUX_QUERY.format(
-            bucket=config["influxdb"]["bucket"],
-            measure=measure,
-            hostname=hostname,
-            param=param,
-            period="1h",
+
+# target_list の (hostname, measure, param) の値を 1 回のクエリで取得して，
+# { (hostname, measure, param): 値 } を返します．取得できなかった値は，
+# CACHE_TTL 以内に取得したものがあればそれを使い，無ければ None にします．
+def get_db_value_map(config, target_list):
+    cache = load_cache()
+    value_map = {}
+
+    try:
+        table_list = (
+            get_client(config)
+            .query_api()
+            .query(
+                query=FLUX_QUERY.format(
+                    bucket=config["influxdb"]["bucket"],
+                    period=FLUX_PERIOD,
+                    cond=" or ".join(
+                        FLUX_COND.format(
+                            hostname=hostname, measure=measure, param=param
+                        )
+                        for (hostname, measure, param) in target_list
+                    ),
+                )
+            )
         )
-    )
 
-    return table_list[0].records[0].get_value()
+        for table in table_list:
+            for record in table.records:
+                target = (
+                    record.values.get("hostname"),
+                    record.get_measurement(),
+                    record.get_field(),
+                )
+                value_map[target] = record.get_value()
+                cache[get_cache_key(*target)] = [
+                    record.get_value(),
+                    record.get_time().timestamp(),
+                ]
+        save_cache(cache)
+    except Exception as e:
+        logger.warning("Failed to query InfluxDB: {}".format(e))
+
+    for target in target_list:
+        if target in value_map:
+            continue
+        cached = cache.get(get_cache_key(*target))
+        if (cached is not None) and ((time.time() - cached[1]) < CACHE_TTL):
+            logger.warning("Using cached value for {}".format(get_cache_key(*target)))
+            value_map[target] = cached[0]
+        else:
+            value_map[target] = None
+
+    return value_map
+
+
+# この Pi のリングバッファから値を読みます．直近に記録が無い場合は None です．
+def get_local_value(param):
+    slot_list = ring.find_history(param, time.time() - LOCAL_PERIOD)
+    if len(slot_list) == 0:
+        return None
+
+    return sum(value for (timestamp, value) in slot_list) / len(slot_list)
+
+
+# target_list の (hostname, measure, param) の値を返します．この Pi の値は
+# リングバッファから読み，それ以外はまとめて InfluxDB に問い合わせます．
+def get_value_map(config, target_list):
+    value_map = {}
+    remote_list = []
+    for target in target_list:
+        hostname, measure, param = target
+        if hostname == socket.gethostname():
+            value = get_local_value(param)
+            if value is not None:
+                value_map[target] = value
+                continue
+            logger.warning(
+                "No recent local value for {}, querying InfluxDB".format(param)
+            )
+        remote_list.append(target)
+
+    if len(remote_list) != 0:
+        value_map.update(get_db_value_map(config, remote_list))
+
+    return value_map
+
+
+class Fan:
+    def __init__(self, config):
+        self.config = config
+        self.pwm = gpio.create_pwm(
+            config["pwm"].get("chip", 0), config["pwm"].get("channel", 0)
+        )
+        self.sw = gpio.create_output(config["gpio"]["sw"])
+
+    # NOTE: 今の状態と異なる設定だけ書き込むので，毎回呼んでも出力は乱れない
+    def set(self, mode, duty=None):
+        if duty is None:
+            duty = self.config["pwm"]["duty_on"]
+        # NOTE: 出力回路で反転するので，duty を 100 から引く
+        self.pwm.set(self.config["pwm"]["khz"] * 1000, 100 - duty)
+        self.sw.set(1 if mode else 0)
+
+    def close(self):
+        self.pwm.close()
+        self.sw.close()
 
 
 def fan_ctrl(config, mode):
-    subprocess.call("sudo gpio mode 1 pwm", shell=True)
-    subprocess.call("sudo gpio pwm-ms", shell=True)
-    subprocess.call(
-        "sudo gpio pwmc {}".format(int(19200 / 100 / config["pwm"]["khz"])), shell=True
-    )
-    subprocess.call("sudo gpio pwmr 100", shell=True)
-    subprocess.call(
-        "sudo gpio pwm 1 {}".format(100 - config["pwm"]["duty_on"]), shell=True
-    )
-    subprocess.call("sudo gpio -g mode {} out".format(config["gpio"]["sw"]), shell=True)
-    subprocess.call(
-        "sudo gpio -g write {} {}".format(config["gpio"]["sw"], 1 if mode else 0),
-        shell=True,
-    )
+    fan = Fan(config)
+    fan.set(mode)
+    fan.close()
 
 
 def judge_fan_state(temp_out, temp_room, volt_batt):
@@ -129,26 +273,214 @@ def judge_fan_state(temp_out, temp_room, volt_batt):
     return False
 
 
-config = load_config()
-logger = get_logger()
+# 常駐モード用の判定です．judge_fan_state() の閾値にヒステリシスを持たせ，
+# 状態を変えてから一定時間は元に戻さないことで，閾値付近での ON/OFF の
+# 繰り返しを防ぎます．ただし，バッテリー電圧が低い場合はすぐに止めます．
+#
+# 設定は config.yml の control (CONTROL_DEFAULT を参照) で変えられます．
+# duty は config.yml の pwm の duty_min から duty_max の間で，閾値を
+# 超えた温度に比例させます (duty_span [K] 超えたら duty_max)．
+CONTROL_DEFAULT = {
+    "temp_on": 35.0,  # 室温がこれを超えたら ON
+    "temp_off": 33.0,  # 室温がこれを下回ったら OFF
+    "delta_on": 5.0,  # 室温と外気温の差がこれを超えたら ON
+    "delta_off": 3.0,  # 室温と外気温の差がこれを下回ったら OFF
+    "batt_off": 13.0,  # バッテリー電圧がこれを下回ったらすぐに OFF
+    "batt_on": 13.2,  # バッテリー電圧がこれを超えるまで ON にしない
+    "min_on": 300,  # ON にしてから OFF にするまでの最小時間 [sec]
+    "min_off": 300,  # OFF にしてから ON にするまでの最小時間 [sec]
+    "duty_span": 5.0,
+}
+
+
+class FanJudge:
+    def __init__(self, config):
+        self.param = dict(CONTROL_DEFAULT, **config.get("control", {}))
+        self.duty_min = config["pwm"].get("duty_min", config["pwm"]["duty_on"])
+        self.duty_max = config["pwm"].get("duty_max", config["pwm"]["duty_on"])
+        self.state = False
+        self.changed_at = None
+        self.is_batt_low = False
+
+    # (ON/OFF, duty) を返します．now は time.monotonic() の値です．
+    def judge(self, temp_out, temp_room, volt_batt, now):
+        param = self.param
+
+        if (temp_room is None) or (volt_batt is None):
+            return self.__change(False, now, True)
+
+        if volt_batt < param["batt_off"]:
+            self.is_batt_low = True
+        elif volt_batt > param["batt_on"]:
+            self.is_batt_low = False
+        if self.is_batt_low:
+            return self.__change(False, now, True)
+
+        delta = None if temp_out is None else temp_room - temp_out
+        if self.state:
+            state = (temp_room >= param["temp_off"]) or (
+                (delta is not None) and (delta >= param["delta_off"])
+            )
+        else:
+            state = (temp_room > param["temp_on"]) or (
+                (delta is not None) and (delta > param["delta_on"])
+            )
+
+        state, duty = self.__change(state, now, False)
+        if state:
+            # NOTE: ON の閾値をどれだけ超えているかに比例させる
+            excess = temp_room - param["temp_on"]
+            if delta is not None:
+                excess = max(excess, delta - param["delta_on"])
+            ratio = min(max(excess / param["duty_span"], 0.0), 1.0)
+            duty = int(round(self.duty_min + (self.duty_max - self.duty_min) * ratio))
+
+        return (state, duty)
+
+    def __change(self, state, now, force):
+        if state != self.state:
+            dwell = self.param["min_on"] if self.state else self.param["min_off"]
+            if force or (self.changed_at is None) or ((now - self.changed_at) >= dwell):
+                self.state = state
+                self.changed_at = now
+
+        return (self.state, self.duty_min)
+
+
+def log_state(state, duty, temp_out, temp_room, volt_batt):
+    logger.info(
+        "FAN: {} (duty: {}, temp_out: {:.2f}, temp_room: {:.2f}, volt_batt: {:.2f})".format(
+            "ON" if state else "OFF",
+            duty,
+            temp_out if temp_out is not None else 0.0,
+            temp_room if temp_room is not None else 0.0,
+            volt_batt if volt_batt is not None else 0.0,
+        )
+    )
+
+
+# この Pi の値は，リングバッファに新しい値が記録される度に判定し直します．
+# 他のホストの値は REMOTE_INTERVAL 毎に InfluxDB に問い合わせます．
+def run_daemon(config, interval):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+
+    target_list = [TEMP_OUT, TEMP_ROOM, VOLT_BATT]
+    local_list = [target for target in target_list if target[0] == socket.gethostname()]
+    remote_list = [target for target in target_list if target not in local_list]
+
+    judge = FanJudge(config)
+    fan = Fan(config)
+    value_map = {target: None for target in target_list}
+    timestamp_map = {}
+    remote_at = None
+    fallback_set = set()
+    last = None
 
-temp_out = get_db_value(config, "ESP32-outdoor-1", "sensor.esp32", "temp")
-temp_room = get_db_value(config, "rasp-storeroom", "sensor.rasp", "temp")
-volt_batt = get_db_value(config, "rasp-storeroom", "sensor.rasp", "battery_voltage")
+    while not stop_event.is_set():
+        now = time.monotonic()
+        is_updated = False
 
-if len(sys.argv) == 1:
-    state = judge_fan_state(temp_out, temp_room, volt_batt)
-else:
-    state = sys.argv[1].lower() == "on"
+        for target in local_list:
+            latest = ring.find_latest(target[2], LOCAL_MAX_AGE)
+            timestamp = None if latest is None else latest[0]
+            if timestamp != timestamp_map.get(target):
+                timestamp_map[target] = timestamp
+                value_map[target] = None if latest is None else latest[1]
+                is_updated = True
 
-fan_ctrl(config, state)
+        # NOTE: この Pi の値でもリングバッファに直近の記録が無い場合は
+        # (sense_* が止まっている等)，1 回ずつ起動する場合と同じく InfluxDB の
+        # 値を使う．新たに記録が無くなった場合はすぐに問い合わせ，それ以外は
+        # 他のホストの値と一緒に REMOTE_INTERVAL 毎に問い合わせる
+        fallback_list = [
+            target for target in local_list if timestamp_map.get(target) is None
+        ]
+        query_list = remote_list + fallback_list
+        if (len(query_list) != 0) and (
+            (remote_at is None)
+            or ((now - remote_at) >= REMOTE_INTERVAL)
+            or not set(fallback_list).issubset(fallback_set)
+        ):
+            for target in set(fallback_list) - fallback_set:
+                logger.warning(
+                    "No recent local value for {}, querying InfluxDB".format(target[2])
+                )
+            value_map.update(get_db_value_map(config, query_list))
+            fallback_set = set(fallback_list)
+            remote_at = now
+            is_updated = True
+
+        # NOTE: 値が変わらなくても，最小時間が過ぎたら状態が変わりうるので毎回判定する
+        state, duty = judge.judge(
+            value_map[TEMP_OUT], value_map[TEMP_ROOM], value_map[VOLT_BATT], now
+        )
+        if (state, duty) != last:
+            fan.set(state, duty)
+            log_state(
+                state,
+                duty,
+                value_map[TEMP_OUT],
+                value_map[TEMP_ROOM],
+                value_map[VOLT_BATT],
+            )
+            last = (state, duty)
+        elif is_updated:
+            logger.debug("No change (state: {}, duty: {})".format(state, duty))
 
-print("FAN is {}".format("ON" if state else "OFF"))
+        stop_event.wait(interval)
 
-logger.info(
-    "FAN: {} (temp_out: {:.2f}, temp_room: {:.2f})".format(
-        "ON" if state else "OFF",
-        temp_out if temp_out is not None else 0.0,
-        temp_room if temp_room is not None else 0.0,
+    fan.close()
+    close_client()
+
+
+TEMP_OUT = ("ESP32-outdoor-1", "sensor.esp32", "temp")
+TEMP_ROOM = ("rasp-storeroom", "sensor.rasp", "temp")
+VOLT_BATT = ("rasp-storeroom", "sensor.rasp", "battery_voltage")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="換気扇を自動制御します．")
+    parser.add_argument(
+        "state",
+        nargs="?",
+        choices=["on", "off"],
+        type=str.lower,
+        help="強制的に ON/OFF する",
+    )
+    parser.add_argument(
+        "-d", "--daemon", action="store_true", help="常駐して新しい計測値の度に制御する"
     )
-)
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=POLL_INTERVAL,
+        help="常駐モードで計測値を確認する間隔 [sec]",
+    )
+    args = parser.parse_args()
+
+    config = load_config()
+    logger = get_logger()
+
+    if args.daemon:
+        run_daemon(config, args.interval)
+        sys.exit(0)
+
+    value_map = get_value_map(config, [TEMP_OUT, TEMP_ROOM, VOLT_BATT])
+    close_client()
+
+    temp_out = value_map[TEMP_OUT]
+    temp_room = value_map[TEMP_ROOM]
+    volt_batt = value_map[VOLT_BATT]
+
+    if args.state is None:
+        state = judge_fan_state(temp_out, temp_room, volt_batt)
+    else:
+        state = args.state == "on"
+
+    fan_ctrl(config, state)
+
+    print("FAN is {}".format("ON" if state else "OFF"))
+
+    log_state(state, config["pwm"]["duty_on"], temp_out, temp_room, volt_batt)
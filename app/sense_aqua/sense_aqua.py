@@ -12,95 +12,114 @@ import os
 import sys
 import time
 import json
-import subprocess
-import re
-from pathlib import Path
 
 json.encoder.FLOAT_REPR = lambda f: ("%.2f" % f)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib'))
 
-import sensor.ezo_rtd
-import sensor.ezo_ph
-import sensor.ezo_do
-import sensor.grove_tds
-import sensor.fd_q10c
+import shm
+import i2cbus
+import wifi
+import collector
+import sensor.detect
+import sensor.scheduler
+import sensor.registry
 
 I2C_ARM_BUS = 0x1       # Raspberry Pi のデフォルトの I2C バス番号
 I2C_VC_BUS  = 0x0       # dtparam=i2c_vc=on で有効化される I2C のバス番号
 RETRY       = 3         # デバイスをスキャンするときのリトライ回数
-
-def check_time_interval(path, interval):
-    file = Path(path)
-
-    if file.is_file() and ((time.time() - file.stat().st_mtime) < interval):
-        expired = False
-    else:
-        expired = True
-        file.touch()
-
-    return expired
-
-def detect_sensor():
-    candidate_list = [
-        sensor.ezo_rtd.EZO_RTD(I2C_ARM_BUS),
-        sensor.ezo_ph.EZO_PH(I2C_ARM_BUS),
-        sensor.ezo_do.EZO_DO(I2C_ARM_BUS),
-        sensor.grove_tds.GROVE_TDS(I2C_ARM_BUS),
-        sensor.fd_q10c.FD_Q10C(),
+CACHE_PATH  = shm.get_path('sense_aqua_sensor.json') # 検出したセンサのキャッシュ
+INTERVAL    = 20        # デーモンモードでの計測間隔 [sec]
+SCHEDULE_PATH = shm.get_path('sense_aqua_schedule.json') # センサ毎の計測周期の状態
+CYCLE_BUDGET_RATIO = 0.75 # 計測間隔のうち，計測に使ってよい割合
+
+# センサ毎の (計測周期, 最小間隔) [sec]．指定の無いセンサは毎回計測する．
+SENSOR_INTERVAL = {
+    'EZO-DO': (5*60, 0),
+}
+
+# センサ毎の 1 回の呼び出しの持ち時間 [sec]．指定の無いセンサは Scheduler.BUDGET．
+SENSOR_BUDGET = {}
+
+# NOTE: ドライバは検出できたセンサの分だけ import する
+def create_candidate():
+    return [
+        sensor.registry.Candidate('EZO-RTD', I2C_ARM_BUS),
+        sensor.registry.Candidate('EZO-pH', I2C_ARM_BUS),
+        sensor.registry.Candidate('EZO-DO', I2C_ARM_BUS),
+        sensor.registry.Candidate('GROVE-TDS', I2C_ARM_BUS),
+        sensor.registry.Candidate('FD-Q10C'),
     ]
-    sensor_list = []
-    for dev in candidate_list:
-        for i in range(RETRY):
-            if dev.ping():
-                sensor_list.append(dev)
-                break
-            time.sleep(0.1)
 
-    return sensor_list
+def detect_sensor(candidate_list):
+    return sensor.detect.detect_cached(candidate_list, CACHE_PATH, RETRY)
+
+# 時間切れで前回の値を使ったセンサを記録します．
+def mark_stale(scheduler, value_map):
+    if len(scheduler.stale_list) != 0:
+        value_map['stale'] = ','.join(dev.NAME for dev in scheduler.stale_list)
 
-def scan_sensor(sensor_list):
+def scan_sensor(scheduler, sensor_list):
     value_map = {}
-    temp = 25 # TDS の温度補正用
-    for sensor in sensor_list:
+    failed = False
+
+    # NOTE: 変換待ちが重なるように，先にまとめて計測する．
+    # 周期が来ていないセンサは前回の値が返ってくる
+    result_map = scheduler.measure(sensor_list)
+    for dev in sensor_list:
         for i in range(RETRY):
             try:
-                if sensor.NAME == 'GROVE-TDS':
-                    val = sensor.get_value_map(temp)
-                elif sensor.NAME == 'EZO-DO':
-                    if (check_time_interval('/dev/shm/ezo-do', 5*60)):
-                        val = sensor.get_value_map()
-                    else:
-                        val = {}
+                # NOTE: 1 回目はまとめて計測した結果を使う
+                if (i == 0) and (dev in result_map):
+                    val = result_map[dev]
                 else:
-                    val = sensor.get_value_map()
+                    val = scheduler.get_value_map(dev)
 
                 value_map.update(val)
-
-                if sensor.NAME == 'EZO-RTD':
-                    temp = val['temp']
+                break
+            except TimeoutError:
+                # NOTE: 持ち時間を使い切ったセンサはリトライしない
                 break
             except:
                 pass
             time.sleep(0.1)
+        else:
+            # NOTE: センサが外れた可能性があるので，次回は検出からやり直す
+            failed = True
+
+    # NOTE: TDS は 25℃ として計測しておき，後から水温で補正する
+    for dev in sensor_list:
+        if (dev.NAME == 'GROVE-TDS') and ('tds' in value_map) and ('temp' in value_map):
+            value_map['tds'] = round(dev.compensate(value_map['tds'], value_map['temp']), 3)
+
+    if failed:
+        sensor.detect.invalidate_cache(CACHE_PATH)
+
+    mark_stale(scheduler, value_map)
 
     return value_map
 
-sensor_list = detect_sensor()
-value_map = scan_sensor(sensor_list)
+def sense(scheduler, candidate_list):
+    lock_wait = i2cbus.get_lock_wait()
 
-wifi_rssi = subprocess.check_output("sudo iwconfig 2>/dev/null | grep 'Signal level' | sed 's/.*Signal level=\\(.*\\) dBm.*/\\1/'", shell=True)
-wifi_rssi = wifi_rssi.rstrip().decode()
+    sensor_list = detect_sensor(candidate_list)
+    value_map = scan_sensor(scheduler, sensor_list)
+    value_map['i2c_lock_wait'] = round(i2cbus.get_lock_wait() - lock_wait, 3)
+    value_map.update(wifi.get_stat())
+
+    return value_map
 
-wifi_ch = subprocess.check_output("sudo iwlist wlan0 channel | grep Current | sed -r 's/^.*Channel ([0-9]+)\)/\\1/'", shell=True)
-try:
-    wifi_ch = int(wifi_ch.rstrip().decode())
-except:
-    # 5GHz
-    wifi_ch = 0
+if __name__ == '__main__':
+    args = collector.parse_args(INTERVAL, '水槽センシング')
 
-if re.compile('-\d+').search(wifi_rssi):
-    value_map['wifi_rssi'] = int(wifi_rssi)
-    value_map['wifi_ch'] = wifi_ch
+    # NOTE: 他のスクリプトと同時にバスにアクセスしても大丈夫なようにする
+    i2cbus.set_flock(True)
 
-print(json.dumps(value_map))
+    # NOTE: デーモンモードでは，同じドライバ (初期化状態) を使い続ける
+    # NOTE: fluentd の exec の間隔を超えないように，計測全体に締め切りを設ける
+    scheduler = sensor.scheduler.Scheduler(
+        SCHEDULE_PATH, SENSOR_INTERVAL, SENSOR_BUDGET,
+        args.interval * CYCLE_BUDGET_RATIO
+    )
+    candidate_list = create_candidate()
+    collector.main(lambda: sense(scheduler, candidate_list), args)
@@ -15,93 +15,126 @@ import os
 import sys
 import time
 import json
-import subprocess
-import re
 
 json.encoder.FLOAT_REPR = lambda f: ("%.2f" % f)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib'))
 
-import sensor.hdc1050
-import sensor.sht31
-import sensor.sht21
-import sensor.lps25h
-import sensor.lps22hb
-import sensor.tsl2561
-import sensor.apds9250
-import sensor.ccs811
-import sensor.k30
-import sensor.veml6075
-import sensor.veml7700
-import sensor.scd4x
+import shm
+import i2cbus
+import wifi
+import collector
+import sensor.detect
+import sensor.scheduler
+import sensor.registry
 
 I2C_ARM_BUS = 0x1       # Raspberry Pi のデフォルトの I2C バス番号
 I2C_VC_BUS  = 0x0       # dtparam=i2c_vc=on で有効化される I2C のバス番号
 RETRY       = 3         # デバイスをスキャンするときのリトライ回数
+CACHE_PATH  = shm.get_path('sense_env_sensor.json') # 検出したセンサのキャッシュ
 CO2_MAX     = 5000      # CO2 濃度の最大値 (時々異常値を返すのでその対策)
+INTERVAL    = 20        # デーモンモードでの計測間隔 [sec]
+SCHEDULE_PATH = shm.get_path('sense_env_schedule.json') # センサ毎の計測周期の状態
+CYCLE_BUDGET_RATIO = 0.75 # 計測間隔のうち，計測に使ってよい割合
 
-def detect_sensor():
-    candidate_list = [
-        sensor.k30.K30(I2C_ARM_BUS),
-        sensor.k30.K30(I2C_VC_BUS),
-        sensor.hdc1050.HDC1050(I2C_ARM_BUS),
-        sensor.sht31.SHT31(I2C_ARM_BUS),
-        sensor.sht21.SHT21(I2C_ARM_BUS),
-        sensor.lps25h.LPS25H(I2C_ARM_BUS),
-        sensor.lps22hb.LPS22HB(I2C_ARM_BUS),
-        sensor.tsl2561.TSL2561(I2C_ARM_BUS),
-        sensor.apds9250.APDS9250(I2C_ARM_BUS),
-        sensor.ccs811.CCS811(I2C_ARM_BUS),
-        sensor.scd4x.SCD4x(I2C_ARM_BUS),
-        sensor.veml7700.VEML7700(I2C_ARM_BUS),
-        sensor.veml6075.VEML6075(I2C_VC_BUS),
+# センサ毎の (計測周期, 最小間隔) [sec]．指定の無いセンサは毎回計測する．
+SENSOR_INTERVAL = {
+    'SCD4x': (0, 5), # 5 秒毎にしか値が更新されない
+}
+
+# センサ毎の 1 回の呼び出しの持ち時間 [sec]．指定の無いセンサは Scheduler.BUDGET．
+SENSOR_BUDGET = {
+    'K30': 3, # 処理中は NACK を返すので，リトライが長引く
+    'SCD4x': 15, # 計測を開始していない場合，最初のデータが出るまで約 11 秒かかる
+}
+
+# NOTE: ドライバは検出できたセンサの分だけ import する
+def create_candidate():
+    return [
+        sensor.registry.Candidate('K30', I2C_ARM_BUS),
+        sensor.registry.Candidate('K30', I2C_VC_BUS),
+        sensor.registry.Candidate('HDC1050', I2C_ARM_BUS),
+        sensor.registry.Candidate('SHT-31', I2C_ARM_BUS),
+        sensor.registry.Candidate('SHT-21', I2C_ARM_BUS),
+        sensor.registry.Candidate('LPS25H', I2C_ARM_BUS),
+        sensor.registry.Candidate('LPS22HB', I2C_ARM_BUS),
+        sensor.registry.Candidate('TSL2561', I2C_ARM_BUS),
+        sensor.registry.Candidate('APDS9250', I2C_ARM_BUS),
+        sensor.registry.Candidate('CCS811', I2C_ARM_BUS),
+        sensor.registry.Candidate('SCD4x', I2C_ARM_BUS),
+        sensor.registry.Candidate('VEML7700', I2C_ARM_BUS),
+        sensor.registry.Candidate('VEML6075', I2C_VC_BUS),
     ]
-    sensor_list = []
-    for dev in candidate_list:
-        for i in range(RETRY):
-            if dev.ping():
-                sensor_list.append(dev)
-                break
-            time.sleep(0.1)
 
-    return sensor_list
+def detect_sensor(candidate_list):
+    return sensor.detect.detect_cached(candidate_list, CACHE_PATH, RETRY)
+
+# 時間切れで前回の値を使ったセンサを記録します．
+def mark_stale(scheduler, value_map):
+    if len(scheduler.stale_list) != 0:
+        value_map['stale'] = ','.join(dev.NAME for dev in scheduler.stale_list)
 
-def scan_sensor(sensor_list):
+def scan_sensor(scheduler, sensor_list):
     value_map = {}
-    for sensor in sensor_list:
+    failed = False
+    # NOTE: 変換待ちが重なるように，先にまとめて計測する．
+    # 周期が来ていないセンサは前回の値が返ってくる
+    result_map = scheduler.measure(sensor_list)
+    for dev in sensor_list:
         for i in range(RETRY):
             try:
-                val = sensor.get_value_map()
-                if sensor.NAME == 'K30' and val['co2'] > CO2_MAX:
+                # NOTE: 1 回目はまとめて計測した結果を使う
+                if (i == 0) and (dev in result_map):
+                    val = result_map[dev]
+                else:
+                    val = scheduler.get_value_map(dev)
+                if dev.NAME == 'K30' and val['co2'] > CO2_MAX:
                     continue
-                if sensor.NAME == 'HDC1050' and val['humi'] == 100:
+                if dev.NAME == 'HDC1050' and val['humi'] == 100:
                     continue
-                if (sensor.NAME == 'LPS22HB' or sensor.NAME == 'LPS25H') and \
+                if (dev.NAME == 'LPS22HB' or dev.NAME == 'LPS25H') and \
                    (val['press'] < 900 or val['press'] > 1100):
                     continue
                 value_map.update(val)
                 break
+            except TimeoutError:
+                # NOTE: 持ち時間を使い切ったセンサはリトライしない
+                break
             except:
                 pass
             time.sleep(0.1)
+        else:
+            # NOTE: センサが外れた可能性があるので，次回は検出からやり直す
+            failed = True
+
+    if failed:
+        sensor.detect.invalidate_cache(CACHE_PATH)
+
+    mark_stale(scheduler, value_map)
 
     return value_map
 
-sensor_list = detect_sensor()
-value_map = scan_sensor(sensor_list)
+def sense(scheduler, candidate_list):
+    lock_wait = i2cbus.get_lock_wait()
 
-wifi_rssi = subprocess.check_output("sudo iwconfig 2>/dev/null | grep 'Signal level' | sed 's/.*Signal level=\\(.*\\) dBm.*/\\1/'", shell=True)
-wifi_rssi = wifi_rssi.rstrip().decode()
+    sensor_list = detect_sensor(candidate_list)
+    value_map = scan_sensor(scheduler, sensor_list)
+    value_map['i2c_lock_wait'] = round(i2cbus.get_lock_wait() - lock_wait, 3)
+    value_map.update(wifi.get_stat())
+
+    return value_map
 
-wifi_ch = subprocess.check_output("sudo iwlist wlan0 channel | grep Current | sed -r 's/^.*Channel ([0-9]+)\)/\\1/'", shell=True)
-try:
-    wifi_ch = int(wifi_ch.rstrip().decode())
-except:
-    # 5GHz
-    wifi_ch = 0
+if __name__ == '__main__':
+    args = collector.parse_args(INTERVAL, '環境センシング')
 
-if re.compile('-\d+').search(wifi_rssi):
-    value_map['wifi_rssi'] = int(wifi_rssi)
-    value_map['wifi_ch'] = wifi_ch
+    # NOTE: 他のスクリプトと同時にバスにアクセスしても大丈夫なようにする
+    i2cbus.set_flock(True)
 
-print(json.dumps(value_map))
+    # NOTE: デーモンモードでは，同じドライバ (初期化状態) を使い続ける
+    # NOTE: fluentd の exec の間隔を超えないように，計測全体に締め切りを設ける
+    scheduler = sensor.scheduler.Scheduler(
+        SCHEDULE_PATH, SENSOR_INTERVAL, SENSOR_BUDGET,
+        args.interval * CYCLE_BUDGET_RATIO
+    )
+    candidate_list = create_candidate()
+    collector.main(lambda: sense(scheduler, candidate_list), args)
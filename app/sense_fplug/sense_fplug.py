@@ -18,6 +18,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "l
 from pyfplug import *
 from fplug_list import *
 from bt_rssi import *
+import ring
 
 
 class GZipRotator:
@@ -54,6 +55,7 @@ def get_logger():
 
 def fetch_data():
     is_all_fail = True
+    sample_ring = ring.open_writer("sense_fplug")
     for i, dev in enumerate(DEVICE_LIST[os.uname()[1]]):
         try:
             logger.info("DEVICE: {0} {1}".format(dev["name"], dev["addr"]))
@@ -70,16 +72,23 @@ def fetch_data():
             rssi = btrssi.request_rssi()[0]
             fplug = FPlugDevice(dev_file, comm_wait=0.2)
 
-            result = json.dumps(
+            value_map = {
+                "hostname": dev["name"],
+                "power": fplug.get_power_realtime(),
+                "temp": fplug.get_temperature(),
+                "humi": fplug.get_humidity(),
+                "rssi": rssi,
+                "self_time": 0,
+            }
+            result = json.dumps(value_map, ensure_ascii=False)
+
+            # NOTE: 複数のプラグの値を記録するので，項目名にプラグの名前を付ける
+            ring.record(
+                sample_ring,
                 {
-                    "hostname": dev["name"],
-                    "power": fplug.get_power_realtime(),
-                    "temp": fplug.get_temperature(),
-                    "humi": fplug.get_humidity(),
-                    "rssi": rssi,
-                    "self_time": 0,
+                    "{0}/{1}".format(dev["name"], key): value
+                    for (key, value) in value_map.items()
                 },
-                ensure_ascii=False,
             )
 
             logger.info(result)
@@ -12,11 +12,11 @@ import traceback
 import logging
 import logging.handlers
 import gzip
-import subprocess
-import re
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib'))
 
+import wifi
+import ring
 from dev.bp35a1 import BP35A1
 from meter.echonetenergy import EchonetEnergy
 from meter.echonetenergy import get_pan_info
@@ -89,19 +89,9 @@ if power > 10000:
 
 value_map = { 'power': power }
 
-wifi_rssi = subprocess.check_output("sudo iwconfig 2>/dev/null | grep 'Signal level' | sed 's/.*Signal level=\\(.*\\) dBm.*/\\1/'", shell=True)
-wifi_rssi = wifi_rssi.rstrip().decode()
+value_map.update(wifi.get_stat())
 
-wifi_ch = subprocess.check_output("sudo iwlist wlan0 channel | grep Current | sed -r 's/^.*Channel ([0-9]+)\)/\\1/'", shell=True)
-try:
-    wifi_ch = int(wifi_ch.rstrip().decode())
-except:
-    # 5GHz
-    wifi_ch = 0
-
-if re.compile('-\d+').search(wifi_rssi):
-    value_map['wifi_rssi'] = int(wifi_rssi)
-    value_map['wifi_ch'] = wifi_ch
+ring.record(ring.open_writer('sense_power'), value_map)
 
 print(json.dumps(value_map))
 logger.info('[SUCCESS] Power: {}'.format(power))
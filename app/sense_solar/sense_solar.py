@@ -13,22 +13,22 @@
 
 import os
 import sys
-import re
 import time
 import json
-import subprocess
 import logging
 import logging.handlers
 import gzip
 import traceback
 
-import RPi.GPIO as GPIO
-GPIO.setmode(GPIO.BCM)
-
 json.encoder.FLOAT_REPR = lambda f: ("%.2f" % f)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib'))
 
+import shm
+import i2cbus
+import wifi
+import collector
+import sensor.scheduler
 import sensor.sht35
 import sensor.ina226
 import sensor.sps30
@@ -43,6 +43,17 @@ SHT35_DEV_ADDR          = 0x44 # SHT-35 の I2C デバイスアドレス
 INA226_PANEL_DEV_ADDR   = 0x40 # 発電電力計測用 INA226 の I2C デバイスアドレス
 INA226_CHARGE_DEV_ADDR  = 0x41 # 充電電力計測用 INA226 の I2C デバイスアドレス
 INA226_BATTERY_DEV_ADDR = 0x42 # 出力電力計測用 INA226 の I2C デバイスアドレス
+INTERVAL                = 20   # デーモンモードでの計測間隔 [sec]
+SCHEDULE_PATH           = shm.get_path('sense_solar_schedule.json') # センサ毎の計測周期の状態
+CYCLE_BUDGET_RATIO      = 0.75 # 計測間隔のうち，計測に使ってよい割合
+
+# センサ毎の (計測周期, 最小間隔) [sec]．指定の無いセンサは毎回計測する．
+SENSOR_INTERVAL = {
+    'SPS30': (60, 0),
+}
+
+# センサ毎の 1 回の呼び出しの持ち時間 [sec]．指定の無いセンサは Scheduler.BUDGET．
+SENSOR_BUDGET = {}
 
 class GZipRotator:
     def namer(name):
@@ -57,7 +68,7 @@ class GZipRotator:
 def get_logger():
     logger = logging.getLogger()
     log_handler = logging.handlers.RotatingFileHandler(
-        '/dev/shm/sense_solar.log',
+        shm.get_path('sense_solar.log'),
         encoding='utf8', maxBytes=1*1024*1024, backupCount=10,
     )
     log_handler.formatter = logging.Formatter(
@@ -72,99 +83,111 @@ def get_logger():
 
     return logger
 
-def scan_sensor(sensor_list):
+# 時間切れで前回の値を使ったセンサを記録します．
+def mark_stale(scheduler, value_map):
+    if len(scheduler.stale_list) != 0:
+        value_map['stale'] = ','.join(dev.NAME for dev in scheduler.stale_list)
+
+def scan_sensor(scheduler, sensor_list):
     value_map = {}
-    for sensor in sensor_list:
+    # NOTE: 周期が来ていないセンサは前回の値が返ってくる
+    result_map = scheduler.measure(sensor_list)
+    for dev in sensor_list:
         for i in range(RETRY):
             try:
-                val = sensor.get_value_map()
+                # NOTE: 1 回目はまとめて計測した結果を使う
+                if (i == 0) and (dev in result_map):
+                    val = result_map[dev]
+                else:
+                    val = scheduler.get_value_map(dev)
                 value_map.update(val)
                 break
+            except TimeoutError:
+                # NOTE: 持ち時間を使い切ったセンサはリトライしない
+                break
             except:
                 pass
             time.sleep(0.1)
 
-    return value_map
-
-def i2c_bus_reset():
-    logger.warning('Reset I2C bus')
-
-    # NOTE: 状況を記録しておく
-    logger.warning('sudo gpio readall')
-    logger.warning(subprocess.check_output('sudo gpio readall', shell=True).decode())
-    logger.warning('sudo i2cdetect -y 1')
-    logger.warning(subprocess.check_output('sudo i2cdetect -y 1', shell=True).decode())
-
-    GPIO.setwarnings(False)
-    GPIO.setup(2, GPIO.IN)
-    GPIO.setup(3, GPIO.OUT)
-    if GPIO.input(2) == GPIO.LOW:
-        logger.warning('increment SCL')
-        for i in range(20):
-            GPIO.output(3, GPIO.LOW)
-            time.sleep(0.001)
-            GPIO.output(3, GPIO.HIGH)
-            time.sleep(0.001)
-
-            if (GPIO.input(2) == GPIO.HIGH):
-                break
-    subprocess.run('sudo gpio -g mode 2 alt0', shell=True)
-    subprocess.run('sudo gpio -g mode 3 alt0', shell=True)
+    mark_stale(scheduler, value_map)
 
-logger = get_logger()
+    return value_map
 
-value_map = scan_sensor(
-    [
+def create_sensor_list():
+    return [
         sensor.sht35.SHT35(I2C_VC_BUS, SHT35_DEV_ADDR),
-        sensor.ina226.INA226(I2C_ARM_BUS, INA226_PANEL_DEV_ADDR, 'panel_'),
-        sensor.ina226.INA226(I2C_ARM_BUS, INA226_CHARGE_DEV_ADDR, 'charge_'),
-        sensor.ina226.INA226(I2C_ARM_BUS, INA226_BATTERY_DEV_ADDR, 'battery_'),
+        # NOTE: 変換効率の計算に使うので，3 つの INA226 は同時に読み出す
+        sensor.ina226.INA226Group([
+            sensor.ina226.INA226(I2C_ARM_BUS, INA226_PANEL_DEV_ADDR, 'panel_'),
+            sensor.ina226.INA226(I2C_ARM_BUS, INA226_CHARGE_DEV_ADDR, 'charge_'),
+            sensor.ina226.INA226(I2C_ARM_BUS, INA226_BATTERY_DEV_ADDR, 'battery_'),
+        ]),
         sensor.sps30.SPS30(I2C_VC_BUS),
         sensor.ads1015.ADS1015(I2C_VC_BUS),
     ]
-)
-
-logger.info(json.dumps(value_map))
-
-try:
-    mvolt = value_map['mvolt']
-    del value_map['mvolt']
-
-    solar_rad = round(mvolt / 6.98 * 1000, 2)
-    if solar_rad < 0:
-        solar_rad = 0.0
-
-    if solar_rad < 1:
-        power_efficiency = 0.0
-    else:
-        power_efficiency = 100.0 * value_map['panel_power'] / (solar_rad * (0.455-0.05)*(0.510-0.05)*2)
-        power_efficiency = round(power_efficiency, 2)
-
-    charge_efficiency = 0.0
-    if (value_map['panel_power'] > 0):
-        charge_efficiency = 100.0 * value_map['charge_power'] / value_map['panel_power']
-        if charge_efficiency > 100:
-            charge_efficiency = 100.0
-
-    value_map['solar_rad'] = round(solar_rad, 2)
-    value_map['power_efficiency'] = round(power_efficiency, 2)
-    value_map['charge_efficiency'] = round(charge_efficiency, 2)
-except Exception as e:
-    logger.warning(traceback.format_exc())
-    i2c_bus_reset()
-
-wifi_rssi = subprocess.check_output("sudo iwconfig 2>/dev/null | grep 'Signal level' | sed 's/.*Signal level=\\(.*\\) dBm.*/\\1/'", shell=True)
-wifi_rssi = wifi_rssi.rstrip().decode()
-
-wifi_ch = subprocess.check_output("sudo iwlist wlan0 channel | grep Current | sed -r 's/^.*Channel ([0-9]+)\)/\\1/'", shell=True)
-try:
-    wifi_ch = int(wifi_ch.rstrip().decode())
-except:
-    # 5GHz
-    wifi_ch = 0
-
-if re.compile('-\d+').search(wifi_rssi):
-    value_map['wifi_rssi'] = int(wifi_rssi)
-    value_map['wifi_ch'] = wifi_ch
-
-print(json.dumps(value_map))
+
+def get_recover_count():
+    return sum(i2cbus.get_bus(bus).recover_count for bus in [I2C_ARM_BUS, I2C_VC_BUS])
+
+def calc_efficiency(value_map):
+    try:
+        mvolt = value_map['mvolt']
+        del value_map['mvolt']
+
+        solar_rad = round(mvolt / 6.98 * 1000, 2)
+        if solar_rad < 0:
+            solar_rad = 0.0
+
+        if solar_rad < 1:
+            power_efficiency = 0.0
+        else:
+            power_efficiency = 100.0 * value_map['panel_power'] / (solar_rad * (0.455-0.05)*(0.510-0.05)*2)
+            power_efficiency = round(power_efficiency, 2)
+
+        charge_efficiency = 0.0
+        if (value_map['panel_power'] > 0):
+            charge_efficiency = 100.0 * value_map['charge_power'] / value_map['panel_power']
+            if charge_efficiency > 100:
+                charge_efficiency = 100.0
+
+        value_map['solar_rad'] = round(solar_rad, 2)
+        value_map['power_efficiency'] = round(power_efficiency, 2)
+        value_map['charge_efficiency'] = round(charge_efficiency, 2)
+    except Exception as e:
+        # NOTE: バスが固まった場合のリカバリは i2cbus が行う
+        logger.warning(traceback.format_exc())
+
+def sense(scheduler, sensor_list):
+    lock_wait = i2cbus.get_lock_wait()
+    recover_count = get_recover_count()
+
+    value_map = scan_sensor(scheduler, sensor_list)
+    value_map['i2c_lock_wait'] = round(i2cbus.get_lock_wait() - lock_wait, 3)
+
+    recover_count = get_recover_count() - recover_count
+    if recover_count != 0:
+        logger.warning('I2C bus recovered %d time(s)' % recover_count)
+
+    logger.info(json.dumps(value_map))
+
+    calc_efficiency(value_map)
+    value_map.update(wifi.get_stat())
+
+    return value_map
+
+if __name__ == '__main__':
+    args = collector.parse_args(INTERVAL, '太陽光発電センシング')
+
+    logger = get_logger()
+
+    # NOTE: 他のスクリプトと同時にバスにアクセスしても大丈夫なようにする
+    i2cbus.set_flock(True)
+
+    # NOTE: デーモンモードでは，同じドライバ (初期化状態) を使い続ける
+    # NOTE: fluentd の exec の間隔を超えないように，計測全体に締め切りを設ける
+    scheduler = sensor.scheduler.Scheduler(
+        SCHEDULE_PATH, SENSOR_INTERVAL, SENSOR_BUDGET,
+        args.interval * CYCLE_BUDGET_RATIO
+    )
+    sensor_list = create_sensor_list()
+    collector.main(lambda: sense(scheduler, sensor_list), args)
@@ -7,70 +7,67 @@ import os
 import sys
 import time
 import json
-import subprocess
-import re
 from pathlib import Path
 
 json.encoder.FLOAT_REPR = lambda f: ("%.2f" % f)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "lib"))
 
-import sensor.max31856
+import shm
+import wifi
+import collector
+import sensor.detect
+import sensor.registry
 
 RETRY = 3  # デバイスをスキャンするときのリトライ回数
+CACHE_PATH = shm.get_path("sense_thermo_sensor.json")  # 検出したセンサのキャッシュ
+INTERVAL = 20  # デーモンモードでの計測間隔 [sec]
 
 
-def detect_sensor():
-    candidate_list = [
-        sensor.max31856.MAX31856(),
+# NOTE: ドライバは検出できたセンサの分だけ import する
+def create_candidate():
+    return [
+        sensor.registry.Candidate("MAX31856"),
     ]
-    sensor_list = []
-    for dev in candidate_list:
-        for i in range(RETRY):
-            if dev.ping():
-                sensor_list.append(dev)
-                break
-            time.sleep(0.1)
 
-    return sensor_list
+
+def detect_sensor(candidate_list):
+    return sensor.detect.detect_cached(candidate_list, CACHE_PATH, RETRY)
 
 
 def scan_sensor(sensor_list):
     value_map = {}
-    for sensor in sensor_list:
+    failed = False
+    for dev in sensor_list:
         for i in range(RETRY):
             try:
-                val = sensor.get_value_map()
+                val = dev.get_value_map()
                 value_map.update(val)
                 break
             except:
                 pass
             time.sleep(0.1)
+        else:
+            # NOTE: センサが外れた可能性があるので，次回は検出からやり直す
+            failed = True
+
+    if failed:
+        sensor.detect.invalidate_cache(CACHE_PATH)
 
     return value_map
 
 
-sensor_list = detect_sensor()
-value_map = scan_sensor(sensor_list)
+def sense(candidate_list):
+    sensor_list = detect_sensor(candidate_list)
+    value_map = scan_sensor(sensor_list)
+    value_map.update(wifi.get_stat())
 
-wifi_rssi = subprocess.check_output(
-    "sudo iwconfig 2>/dev/null | grep 'Signal level' | sed 's/.*Signal level=\\(.*\\) dBm.*/\\1/'",
-    shell=True,
-)
-wifi_rssi = wifi_rssi.rstrip().decode()
+    return value_map
 
-wifi_ch = subprocess.check_output(
-    "sudo iwlist wlan0 channel | grep Current | sed -r 's/^.*Channel ([0-9]+)\)/\\1/'",
-    shell=True,
-)
-try:
-    wifi_ch = int(wifi_ch.rstrip().decode())
-except:
-    # 5GHz
-    wifi_ch = 0
 
-if re.compile("-\d+").search(wifi_rssi):
-    value_map["wifi_rssi"] = int(wifi_rssi)
-    value_map["wifi_ch"] = wifi_ch
+if __name__ == "__main__":
+    args = collector.parse_args(INTERVAL, "熱電対ロギング")
 
-print(json.dumps(value_map))
+    # NOTE: デーモンモードでは，同じドライバ (初期化状態) を使い続ける
+    candidate_list = create_candidate()
+    collector.main(lambda: sense(candidate_list), args)
@@ -1,19 +1,30 @@
 import warnings
 warnings.simplefilter('ignore')
 
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'lib'))
+
 import pywemo
 import json
+import ring
 
+sample_ring = ring.open_writer('sense_wemo')
 devices = pywemo.discover_devices()
 
 for dev in devices:
     if dev.__class__ is not pywemo.ouimeaux_device.insight.Insight:                                                                                                              
         continue
 
+    power = int(dev.insight_params['currentpower']/1000)
+    # NOTE: 複数のプラグの値を記録するので，項目名にプラグの名前を付ける
+    ring.record(sample_ring, { '%s/power' % dev.name: power })
+
     print(
         json.dumps({
             'hostname': dev.name,
-            'power': int(dev.insight_params['currentpower']/1000),
+            'power': power,
             'self_time': 0,
         }, ensure_ascii=False)
     )
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# I2C シミュレータ上で各センシングスクリプトを実行し，
+# 1 回の計測にかかる時間を測定します．
+# 実機が無い環境 (CI 等) での性能劣化の検出に使います．
+#
+#   $ python3 app/sim_bench/sim_bench.py -n 5 --limit sense_env=10
+#
+# --startup を指定すると，起動時のコスト (モジュールの import にかかった時間と
+# import されたドライバ，最初の計測結果が出るまでの時間) も測定します．
+# --cold を指定すると，毎回キャッシュや状態を消してから起動します．
+#
+# キャッシュや状態は /dev/shm ではなく，実行毎に作る一時ディレクトリに置くので
+# (lib/shm.py を参照)，実機のスクリプトの状態には影響しません．
+#
+#   $ python3 app/sim_bench/sim_bench.py --startup --cold -a sense_env
+
+import os
+import re
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# アプリ名と，使用する I2C シミュレータのプロファイル
+APP_PROFILE = {
+    "sense_env": "env",
+    "sense_solar": "solar",
+    "sense_aqua": "aqua",
+}
+
+# python -X importtime の出力 (子のモジュールは名前の前に字下げされる)
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+# import にかかった時間 [msec]，import されたモジュール，残りの stderr を返します．
+def parse_import_time(stderr):
+    import_time = 0
+    module_list = []
+    line_list = []
+    for line in stderr.splitlines():
+        m = IMPORT_TIME_RE.match(line)
+        if m is None:
+            if not line.startswith("import time:"):
+                line_list.append(line)
+            continue
+        if m.group(3) == "":
+            import_time += int(m.group(2))
+        module_list.append(m.group(4))
+
+    return (import_time / 1000.0, module_list, "\n".join(line_list))
+
+
+# アプリが残したキャッシュや状態を消します．
+# NOTE: センサの初期化状態 (sensor/init_state.py) はアプリ間で共有しているが，
+# 残っていると初期化が省略されるので，ディレクトリごと全て消す
+def clear_state(state_dir):
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.makedirs(state_dir, mode=0o700)
+
+
+def run_app(app, profile, state_dir, startup=False, cold=False):
+    env = dict(os.environ, I2C_SIM=profile, I2C_SIM_DIR=state_dir)
+    if startup:
+        env["PYTHONPROFILEIMPORTTIME"] = "1"
+    if cold:
+        clear_state(state_dir)
+
+    start = time.monotonic()
+    proc = subprocess.run(
+        [sys.executable, os.path.join(APP_DIR, app, app + ".py")],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = time.monotonic() - start
+
+    output = None
+    if proc.returncode == 0:
+        try:
+            output = json.loads(proc.stdout.decode().strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            pass
+
+    import_time, module_list, stderr = parse_import_time(proc.stderr.decode())
+
+    return {
+        "elapsed": elapsed,
+        "returncode": proc.returncode,
+        "output": output,
+        "stderr": stderr[-1000:],
+        "import_time": import_time,
+        "module_list": module_list,
+    }
+
+
+def bench_startup(result_list):
+    import_list = [result["import_time"] for result in result_list]
+    module_list = result_list[-1]["module_list"]
+
+    return {
+        "import_mean": round(statistics.mean(import_list), 1),
+        "import_min": round(min(import_list), 1),
+        "import_max": round(max(import_list), 1),
+        "module_count": len(module_list),
+        "sensor_module": sorted(
+            module for module in module_list if module.startswith("sensor.")
+        ),
+        # NOTE: 1 回目は --cold でなくても前回の実行の状態が残っている場合がある
+        "first_sample": round(result_list[0]["elapsed"], 3),
+    }
+
+
+def bench_app(app, profile, state_dir, count, startup=False, cold=False):
+    result_list = [
+        run_app(app, profile, state_dir, startup, cold) for i in range(count)
+    ]
+    elapsed_list = [result["elapsed"] for result in result_list]
+    failed_list = [result for result in result_list if result["output"] is None]
+
+    result = {
+        "profile": profile,
+        "count": count,
+        "mean": round(statistics.mean(elapsed_list), 3),
+        "min": round(min(elapsed_list), 3),
+        "max": round(max(elapsed_list), 3),
+        "failed": len(failed_list),
+        "error": failed_list[0]["stderr"] if len(failed_list) != 0 else None,
+        "output": result_list[-1]["output"],
+    }
+    if startup:
+        result["startup"] = bench_startup(result_list)
+
+    return result
+
+
+def parse_limit(limit_list):
+    limit_map = {}
+    for limit in limit_list:
+        app, sec = limit.split("=")
+        limit_map[app] = float(sec)
+    return limit_map
+
+
+parser = argparse.ArgumentParser(
+    description="I2C シミュレータ上での計測時間ベンチマーク"
+)
+parser.add_argument("-n", "--count", type=int, default=3, help="アプリ毎の実行回数")
+parser.add_argument(
+    "-a",
+    "--app",
+    action="append",
+    choices=APP_PROFILE.keys(),
+    help="対象のアプリ (省略時は全て)",
+)
+parser.add_argument(
+    "--limit",
+    action="append",
+    default=[],
+    metavar="APP=SEC",
+    help="平均実行時間の上限．超えた場合は終了コード 1 を返す",
+)
+parser.add_argument(
+    "--startup",
+    action="store_true",
+    help="import にかかる時間等の起動時のコストも測定する",
+)
+parser.add_argument(
+    "--cold", action="store_true", help="毎回キャッシュや状態を消して起動する"
+)
+args = parser.parse_args()
+
+limit_map = parse_limit(args.limit)
+result_map = {}
+is_success = True
+state_dir = tempfile.mkdtemp(prefix="sim_bench_")
+try:
+    for app in args.app if args.app else APP_PROFILE.keys():
+        result = bench_app(
+            app, APP_PROFILE[app], state_dir, args.count, args.startup, args.cold
+        )
+        result_map[app] = result
+
+        if result["failed"] != 0:
+            is_success = False
+        if (app in limit_map) and (result["mean"] > limit_map[app]):
+            is_success = False
+finally:
+    shutil.rmtree(state_dir, ignore_errors=True)
+
+print(json.dumps(result_map, indent=2, ensure_ascii=False))
+
+sys.exit(0 if is_success else 1)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# センシング用スクリプトを常駐させるためのライブラリです．
+#
+# fluentd の exec で毎回スクリプトを起動すると，インタプリタの起動，
+# モジュールの import，センサの検出や初期化を毎回行うことになるので，
+# デーモンモードでは一度起動したら同じドライバを使い続け，一定間隔で
+# 計測した値を JSON Lines で出力します．
+#
+# fluent:// を指定すると，Fluent Forward プロトコル (msgpack) で fluentd に
+# 直接送るので，exec も JSON のパースも不要になります．複数の計測値を
+# まとめて送り (batch)，fluentd からの ack で届いたことを確認します．
+#
+#   $ python3 app/sense_env/sense_env.py                  (1 回だけ計測)
+#   $ python3 app/sense_env/sense_env.py -d -i 20         (標準出力へ)
+#   $ python3 app/sense_env/sense_env.py -d -o tcp://localhost:24230
+#   $ python3 app/sense_env/sense_env.py -d -o 'fluent://localhost:24224?batch=3'
+#   $ python3 app/sense_env/sense_env.py -d -o fluent+unix:///var/run/fluentd.sock
+#
+# fluentd の in_unix は ack を返さないので，fluent+unix の場合は ack を使いません．
+#
+# influx:// を指定すると，fluentd を使わずに InfluxDB に直接書き込みます．
+# トークンは ps で見えないように環境変数 INFLUXDB_TOKEN で渡します．
+#
+#   $ python3 app/sense_env/sense_env.py -d -o 'influx://localhost:8086?org=home&bucket=sensor&batch=6'
+#
+# fluentd 側の設定例は etc/fluent.conf.daemon を参照．
+#
+# どの出力先の場合も，計測値は /dev/shm/<スクリプト名>.ring のリング
+# バッファにも記録するので，同じ Pi の他のプロセスから直近の値を読めます
+# (lib/ring.py を参照)．
+
+import os
+import re
+import sys
+import json
+import time
+import math
+import uuid
+import base64
+import signal
+import socket
+import logging
+import argparse
+import threading
+import collections
+import urllib.parse
+
+import shm
+import ring
+
+INTERVAL = 20 # 計測間隔のデフォルト [sec]
+
+logger = logging.getLogger(__name__)
+
+# 標準出力に 1 行ずつ出力します．fluentd の exec (run_interval 無し) 向け．
+class StdoutOutput:
+    def write(self, record):
+        sys.stdout.write(json.dumps(record) + '\n')
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+# TCP で 1 行ずつ送信します．fluentd の in_tcp 向け．
+class TCPOutput:
+    TIMEOUT = 5
+
+    def __init__(self, host, port):
+        self.addr = (host, port)
+        self.sock = None
+
+    def write(self, record):
+        data = (json.dumps(record) + '\n').encode()
+        # NOTE: 切断されていた場合に備えて，1 回だけ接続し直す
+        for i in range(2):
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection(self.addr, self.TIMEOUT)
+                self.sock.sendall(data)
+                return
+            except OSError:
+                self.close()
+
+        logger.warning('Failed to send to %s:%d', *self.addr)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+# Fluent Forward プロトコルで送信します．fluentd の in_forward 向け．
+#
+# batch 個溜まったら Forward モード ([tag, [[time, record], ...], option])
+# で送ります．ack を有効にすると，chunk の ID が返ってくるまで送信済みに
+# しません．送れなかった分は BUFFER_MAX 個まで残しておき，次回に再送します．
+class ForwardOutput:
+    TIMEOUT     = 5
+    PORT        = 24224
+    BUFFER_MAX  = 1000 # 送れなかった計測値を残しておく最大数
+
+    # addr: (HOST, PORT) か UNIX ドメインソケットのパス
+    def __init__(self, addr, tag='sensor', batch=1, ack=True, hostname=True):
+        # NOTE: msgpack はこの出力を使う場合だけ必要
+        import msgpack
+
+        self.msgpack = msgpack
+        self.addr = addr
+        self.tag = tag
+        self.batch = batch
+        self.ack = ack
+        self.sock = None
+        self.buffer = collections.deque(maxlen=self.BUFFER_MAX)
+        # NOTE: exec で起動した場合に record_transformer で付けていた hostname を付ける
+        self.hostname = socket.gethostname() if hostname else None
+
+    def write(self, record):
+        if (self.hostname is not None) and ('hostname' not in record):
+            record = dict(record, hostname=self.hostname)
+
+        if len(self.buffer) == self.buffer.maxlen:
+            logger.warning('Forward buffer is full, dropping the oldest record')
+        self.buffer.append([int(time.time()), record])
+
+        if len(self.buffer) >= self.batch:
+            self.flush()
+
+    # 溜まっている計測値を送ります．送れた場合は True を返します．
+    def flush(self):
+        if len(self.buffer) == 0:
+            return True
+
+        entry_list = list(self.buffer)
+        # NOTE: 切断されていた場合に備えて，1 回だけ接続し直す
+        for i in range(2):
+            try:
+                self.__send(entry_list)
+                for j in range(len(entry_list)):
+                    self.buffer.popleft()
+                return True
+            except (OSError, ValueError) as e:
+                logger.debug('Failed to forward: %s', e)
+                self.__disconnect()
+
+        logger.warning('Failed to forward to %s (%d record(s) pending)',
+                       self.addr, len(self.buffer))
+        return False
+
+    def close(self):
+        self.flush()
+        self.__disconnect()
+
+    def __send(self, entry_list):
+        option = {'size': len(entry_list)}
+        if self.ack:
+            chunk = base64.b64encode(uuid.uuid4().bytes).decode()
+            option['chunk'] = chunk
+
+        data = self.msgpack.packb([self.tag, entry_list, option], use_bin_type=True)
+
+        if self.sock is None:
+            self.__connect()
+        self.sock.sendall(data)
+
+        if self.ack:
+            unpacker = self.msgpack.Unpacker(raw=False)
+            while True:
+                buf = self.sock.recv(1024)
+                if len(buf) == 0:
+                    raise ValueError('Connection closed before ack')
+                unpacker.feed(buf)
+                for resp in unpacker:
+                    if isinstance(resp, dict) and (resp.get('ack') == chunk):
+                        return
+                    raise ValueError('Unexpected response: %s' % resp)
+
+    def __connect(self):
+        if isinstance(self.addr, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.TIMEOUT)
+            try:
+                sock.connect(self.addr)
+            except OSError:
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection(self.addr, self.TIMEOUT)
+        self.sock = sock
+
+    def __disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+# 出力先の指定から出力を作ります．
+#   -                       標準出力
+#   tcp://HOST:PORT         JSON Lines を TCP で送信
+#   fluent://HOST[:PORT]    Fluent Forward プロトコルで送信
+#   fluent+unix://PATH      同上 (UNIX ドメインソケット)
+#   influx://HOST:PORT      InfluxDB に line protocol で書き込み (influxs は HTTPS)
+# fluent の場合は ?tag=sensor&batch=1&ack=1 でタグ，まとめて送る数，
+# ack の有無を指定できます．fluent+unix は ack に対応していないので，
+# ?tag= と ?batch= だけ指定できます．influx の場合は ?org=&bucket= が必須で，
+# measurement=，batch=，spool= (スプールファイルのパス) も指定できます．
+def create_output(spec):
+    if spec in ('-', 'stdout'):
+        return StdoutOutput()
+
+    m = re.match(r'^tcp://(.+):(\d+)$', spec)
+    if m:
+        return TCPOutput(m.group(1), int(m.group(2)))
+
+    url = urllib.parse.urlsplit(spec)
+    if url.scheme in ('fluent', 'fluent+unix'):
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.scheme == 'fluent':
+            addr = (url.hostname, url.port or ForwardOutput.PORT)
+            ack = query.get('ack', '1') != '0'
+        else:
+            # NOTE: in_unix は ack を返さないので，ack を待つと毎回タイムアウトして
+            # 再送を繰り返す
+            addr = url.path
+            ack = query.get('ack', '0') != '0'
+            if ack:
+                raise ValueError('fluent+unix does not support ack: %s' % spec)
+        return ForwardOutput(
+            addr,
+            tag=query.get('tag', 'sensor'),
+            batch=int(query.get('batch', 1)),
+            ack=ack,
+        )
+
+    if url.scheme in ('influx', 'influxs'):
+        # NOTE: urllib.request の import は重いので，使う場合だけ import する
+        import influx
+
+        query = dict(urllib.parse.parse_qsl(url.query))
+        app = get_app_name()
+        return influx.InfluxWriter(
+            '%s://%s' % ('https' if url.scheme == 'influxs' else 'http', url.netloc),
+            os.environ.get('INFLUXDB_TOKEN', ''),
+            query['org'],
+            query['bucket'],
+            measurement=query.get('measurement', influx.MEASUREMENT),
+            spool_path=query.get('spool', shm.get_path('%s_influx.spool' % app)),
+            batch=int(query.get('batch', influx.BATCH)),
+        )
+
+    raise ValueError('Unknown output: %s' % spec)
+
+def get_app_name():
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0]
+
+class Collector:
+    def __init__(self, sense, interval, output, sample_ring=None):
+        self.sense = sense
+        self.interval = interval
+        self.output = output
+        self.sample_ring = sample_ring
+        self.stop_event = threading.Event()
+        self.overrun_count = 0 # 計測が間隔内に終わらなかった回数
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+    # stop() が呼ばれるか，count 回計測するまで繰り返します．
+    def run(self, count=None):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        next_time = time.monotonic()
+        while not self.stop_event.is_set():
+            self.collect()
+
+            if count is not None:
+                count -= 1
+                if count == 0:
+                    break
+
+            # NOTE: 計測が間隔を超えた場合は，間に合わなかった回を飛ばして
+            # 開始時刻の間隔を一定に保つ
+            next_time += self.interval
+            now = time.monotonic()
+            if next_time < now:
+                skip = math.ceil((now - next_time) / self.interval)
+                next_time += skip * self.interval
+                self.overrun_count += skip
+                logger.warning('Sensing overran the interval (%d skipped)', skip)
+
+            self.stop_event.wait(next_time - now)
+
+        self.output.close()
+
+    def collect(self):
+        try:
+            value_map = self.sense()
+        except Exception:
+            logger.exception('Failed to sense')
+            return
+
+        ring.record(self.sample_ring, value_map)
+        if value_map:
+            self.output.write(value_map)
+
+def parse_args(interval=INTERVAL, description=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help='常駐して一定間隔で計測する')
+    parser.add_argument('-i', '--interval', type=float, default=interval,
+                        help='デーモンモードでの計測間隔 [sec]')
+    parser.add_argument('-o', '--output', default='-',
+                        help='出力先 (-，tcp://HOST:PORT，fluent://HOST:PORT，'
+                             'fluent+unix://PATH，influx://HOST:PORT?org=&bucket=)')
+
+    return parser.parse_args()
+
+# コマンドライン引数に従って，1 回だけ計測するか常駐して計測します．
+def main(sense, args):
+    output = create_output(args.output)
+    sample_ring = ring.open_writer(get_app_name())
+    if args.daemon:
+        Collector(sense, args.interval, output, sample_ring).run()
+    else:
+        value_map = sense()
+        ring.record(sample_ring, value_map)
+        output.write(value_map)
+        output.close()
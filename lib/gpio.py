@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# GPIO の出力と PWM をカーネルのインターフェースで直接制御するライブラリです．
+#
+# 以前は sudo gpio (WiringPi) を設定項目毎に起動していましたが，
+# - GPIO: キャラクタデバイス (/dev/gpiochipN) の ioctl
+# - PWM: /sys/class/pwm (/boot/config.txt に dtoverlay=pwm が必要)
+# を使い，今の状態を読んで異なる項目だけ書き込みます．既に同じ設定の
+# PWM を設定し直して，出力が一瞬乱れることもありません．
+#
+# 環境変数 GPIO_SIM=1 を指定すると，実機の代わりに sim/gpio.py の
+# 偽物を使います．
+#
+#   pwm = gpio.create_pwm(0, 0)
+#   pwm.set(25000, 70)           # 25kHz，duty 70%
+#   gpio.create_output(15).set(1)
+
+import os
+import time
+import fcntl
+import struct
+import logging
+
+PWM_PATH        = '/sys/class/pwm/pwmchip%d'
+GPIO_CHIP_PATH  = '/dev/gpiochip%d'
+EXPORT_RETRY    = 20  # export 直後に書き込めるようになるまでの再試行回数
+EXPORT_WAIT     = 0.1 # 再試行の間隔 [sec]
+
+# linux/gpio.h (v1 ABI)
+GPIOHANDLES_MAX                     = 64
+GPIOHANDLE_REQUEST_INPUT            = 1 << 0
+GPIOHANDLE_REQUEST_OUTPUT           = 1 << 1
+GPIOLINE_FLAG_IS_OUT                = 1 << 1
+GPIO_GET_LINEINFO_IOCTL             = 0xC048B402
+GPIO_GET_LINEHANDLE_IOCTL           = 0xC16CB403
+GPIOHANDLE_GET_LINE_VALUES_IOCTL    = 0xC040B408
+GPIOHANDLE_SET_LINE_VALUES_IOCTL    = 0xC040B409
+# struct gpiohandle_request
+#   { u32 lineoffsets[64]; u32 flags; u8 default_values[64]; char consumer_label[32]; u32 lines; int fd; }
+HANDLE_REQUEST  = struct.Struct('=%dII%dB32sIi' % (GPIOHANDLES_MAX, GPIOHANDLES_MAX))
+# struct gpioline_info { u32 line_offset; u32 flags; char name[32]; char consumer[32]; }
+LINE_INFO       = struct.Struct('=II32s32s')
+HANDLE_DATA     = struct.Struct('=%dB' % GPIOHANDLES_MAX)
+CONSUMER        = b'rasp-python'
+
+logger = logging.getLogger(__name__)
+
+# /sys/class/pwm のチャンネルです．値は全て ns 単位です．
+class SysfsPWMBackend:
+    def __init__(self, chip, channel):
+        chip_path = PWM_PATH % chip
+        self.path = os.path.join(chip_path, 'pwm%d' % channel)
+        self.is_exported = False
+
+        if not os.path.exists(self.path):
+            with open(os.path.join(chip_path, 'export'), 'w') as f:
+                f.write('%d' % channel)
+            self.is_exported = True
+
+    def read(self, name):
+        with open(os.path.join(self.path, name), 'r') as f:
+            return int(f.read())
+
+    def write(self, name, value):
+        for i in range(EXPORT_RETRY):
+            try:
+                with open(os.path.join(self.path, name), 'w') as f:
+                    f.write('%d' % value)
+                return
+            except PermissionError:
+                # NOTE: export 直後は udev が権限を変えるまで書けないので，少し待つ
+                if not self.is_exported or (i == (EXPORT_RETRY - 1)):
+                    raise
+                time.sleep(EXPORT_WAIT)
+
+# GPIO キャラクタデバイスの 1 本の出力です．
+#
+# NOTE: ハンドルを閉じても (プロセスが終了しても)，Raspberry Pi では
+# 出力の状態はそのまま残る
+class CdevOutputBackend:
+    def __init__(self, line, chip=0):
+        self.line = line
+        self.chip_fd = os.open(GPIO_CHIP_PATH % chip, os.O_RDWR)
+        self.handle_fd = None
+        self.is_requested = False # 出力として取得済みかどうか
+
+    # 出力に設定されているかどうかを返します．
+    def is_output(self):
+        if self.is_requested:
+            return True
+        info = bytearray(LINE_INFO.pack(self.line, 0, b'', b''))
+        fcntl.ioctl(self.chip_fd, GPIO_GET_LINEINFO_IOCTL, info, True)
+        return (LINE_INFO.unpack(info)[1] & GPIOLINE_FLAG_IS_OUT) != 0
+
+    def read(self):
+        if self.handle_fd is None:
+            # NOTE: 向きを変えないように，INPUT も OUTPUT も指定しない
+            self.__request(0, 0)
+        buf = bytearray(HANDLE_DATA.size)
+        fcntl.ioctl(self.handle_fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL, buf, True)
+        return buf[0]
+
+    def write(self, value):
+        if not self.is_requested:
+            # NOTE: 出力として取得し直すと同時に値も設定される
+            self.__release()
+            self.__request(GPIOHANDLE_REQUEST_OUTPUT, value)
+            self.is_requested = True
+            return
+        fcntl.ioctl(self.handle_fd, GPIOHANDLE_SET_LINE_VALUES_IOCTL,
+                    HANDLE_DATA.pack(value, *([0] * (GPIOHANDLES_MAX - 1))))
+
+    def close(self):
+        self.__release()
+        os.close(self.chip_fd)
+
+    def __request(self, flags, value):
+        req = bytearray(HANDLE_REQUEST.pack(
+            self.line, *([0] * (GPIOHANDLES_MAX - 1)),
+            flags,
+            value, *([0] * (GPIOHANDLES_MAX - 1)),
+            CONSUMER, 1, 0
+        ))
+        fcntl.ioctl(self.chip_fd, GPIO_GET_LINEHANDLE_IOCTL, req, True)
+        self.handle_fd = HANDLE_REQUEST.unpack(req)[-1]
+
+    def __release(self):
+        if self.handle_fd is not None:
+            os.close(self.handle_fd)
+            self.handle_fd = None
+            self.is_requested = False
+
+class PWM:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # 周波数 [Hz] と duty [%] を設定して出力を有効にします．
+    # 今の設定と異なる項目だけ書き込み，書き込んだ項目のリストを返します．
+    def set(self, freq, duty):
+        period = int(round(1000000000.0 / freq))
+        duty_cycle = int(round(period * duty / 100.0))
+
+        cur_period = self.backend.read('period')
+        cur_duty_cycle = self.backend.read('duty_cycle')
+        cur_enable = self.backend.read('enable')
+
+        # NOTE: duty_cycle は period 以下でないと書き込めないので，
+        # period を短くする場合は duty_cycle を先に書く
+        write_list = []
+        if period < cur_duty_cycle:
+            write_list.append(('duty_cycle', duty_cycle))
+        if period != cur_period:
+            write_list.append(('period', period))
+        if (duty_cycle != cur_duty_cycle) and (period >= cur_duty_cycle):
+            write_list.append(('duty_cycle', duty_cycle))
+        if cur_enable != 1:
+            write_list.append(('enable', 1))
+
+        for (name, value) in write_list:
+            logger.info('PWM: %s = %d', name, value)
+            self.backend.write(name, value)
+
+        return [name for (name, value) in write_list]
+
+    def close(self):
+        pass
+
+class Output:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # 出力を設定します．出力になっていないか，今の値と異なる場合だけ書き込み，
+    # 書き込んだら True を返します．
+    # NOTE: GPIO15 (UART の RX) 等は起動時に入力なので，値が同じでも出力にする
+    def set(self, value):
+        value = 1 if value else 0
+        if self.backend.is_output() and (self.backend.read() == value):
+            return False
+
+        logger.info('GPIO: %d', value)
+        self.backend.write(value)
+        return True
+
+    def close(self):
+        self.backend.close()
+
+def is_sim():
+    return os.environ.get('GPIO_SIM', '0') == '1'
+
+def create_pwm(chip=0, channel=0):
+    if is_sim():
+        import sim.gpio
+        return PWM(sim.gpio.SimPWMBackend(chip, channel))
+    return PWM(SysfsPWMBackend(chip, channel))
+
+# line は gpiochip のライン番号です．Raspberry Pi の gpiochip0 では BCM の番号と同じです．
+def create_output(line, chip=0):
+    if is_sim():
+        import sim.gpio
+        return Output(sim.gpio.SimOutputBackend(line, chip))
+    return Output(CdevOutputBackend(line, chip))
+
+if __name__ == '__main__':
+    # TEST Code
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+
+    pwm = create_pwm()
+    print('PWM: %s' % pwm.set(25000, 70))
+    print('PWM: %s' % pwm.set(25000, 70))
+
+    output = create_output(int(sys.argv[1]) if len(sys.argv) > 1 else 15)
+    print('GPIO: %s' % output.set(1))
+    print('GPIO: %s' % output.set(1))
+    output.close()
@@ -7,17 +7,27 @@
 # ので自作．
 
 import io
+import os
 import fcntl
 import ctypes
 import posix
 import struct
+import threading
+import contextlib
+import atexit
+import time
+import errno
+import json
+
+import shm
 
 class I2CMsg(ctypes.Structure):
+    # NOTE: buf は使い回すバッファの途中を指せるように，アドレスで持つ
     _fields_ = [
         ('addr', ctypes.c_uint16),
         ('flags', ctypes.c_ushort),
         ('len', ctypes.c_short),
-        ('buf', ctypes.POINTER(ctypes.c_char))
+        ('buf', ctypes.c_void_p)
     ]
     
 class I2CRdWrData(ctypes.Structure):
@@ -25,6 +35,108 @@ class I2CRdWrData(ctypes.Structure):
         ('msgs', ctypes.POINTER(I2CMsg)),
         ('nmsgs', ctypes.c_int)]
 
+# /dev/i2c-N に対して ioctl を発行するバックエンド．
+class DevBackend:
+    I2C_RDWR 		= 0x0707
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.fd = posix.open('/dev/i2c-%i' % bus, posix.O_RDWR)
+        self.recovery = None
+
+    def rdwr(self, rdwr_data):
+        fcntl.ioctl(self.fd, self.I2C_RDWR, rdwr_data)
+
+    # SDA が Low に張り付いていたら SCL にクロックを送って復旧させます．
+    # 復旧を試みた場合は True を返します．
+    def recover(self):
+        if self.recovery is None:
+            # NOTE: 滅多に使わないので，必要になるまで import しない
+            import i2crecovery
+            self.recovery = i2crecovery.BusRecovery(self.bus)
+        return self.recovery.recover()
+
+    def close(self):
+        if self.recovery is not None:
+            self.recovery.close()
+        posix.close(self.fd)
+
+# NOTE: 環境変数 I2C_SIM にプロファイル名 (sim/i2c.py の PROFILE_MAP を参照) を
+# 指定すると，実機の代わりにシミュレータ上のデバイスモデルにアクセスする．
+def create_backend(bus):
+    if _backend_factory is not None:
+        return _backend_factory(bus)
+
+    profile = os.environ.get('I2C_SIM')
+    if profile:
+        import sim.i2c
+        return sim.i2c.SimBackend(bus, profile)
+
+    return DevBackend(bus)
+
+_backend_factory = None
+
+# バックエンドを生成する関数 (引数はバス番号) を差し替えます．
+# None を指定すると元に戻ります．
+def set_backend_factory(factory):
+    global _backend_factory
+    _backend_factory = factory
+
+# NOTE: 複数のプロセスから同じバスにアクセスする場合に，一連のアクセスが
+# 混ざらないように flock でロックする．環境変数 I2C_BUS_LOCK=1 か
+# set_flock(True) で有効になる．
+FLOCK_PATH = os.path.join(shm.get_dir(), 'i2c-%d.lock')
+
+_use_flock = os.environ.get('I2C_BUS_LOCK', '0') == '1'
+
+# NOTE: 環境変数 I2C_STAT にファイルパスを指定すると，デバイス毎の統計を
+# 記録し，終了時にそのファイルへ JSON で追記 (加算) する．
+_stat_path = os.environ.get('I2C_STAT')
+
+# デバイス毎のアクセス統計．
+class I2CStat:
+    # レイテンシのヒストグラムの区切り [sec]
+    LATENCY_BUCKET = [
+        0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1
+    ]
+    ERRNO_LABEL = {
+        errno.ENXIO: 'nack',
+        errno.EREMOTEIO: 'nack',
+        errno.ETIMEDOUT: 'timeout',
+        errno.EAGAIN: 'arbitration',
+    }
+
+    def __init__(self):
+        self.count = 0
+        self.byte = 0
+        self.error = {}
+        self.latency = [0] * (len(self.LATENCY_BUCKET) + 1)
+
+    def record(self, byte, latency, error_no=None):
+        self.count += 1
+        self.byte += byte
+        if error_no is not None:
+            label = self.ERRNO_LABEL.get(error_no, errno.errorcode.get(error_no, str(error_no)))
+            self.error[label] = self.error.get(label, 0) + 1
+
+        for (i, limit) in enumerate(self.LATENCY_BUCKET):
+            if latency < limit:
+                self.latency[i] += 1
+                break
+        else:
+            self.latency[-1] += 1
+
+    def dump(self):
+        label_list = ['<%gms' % (limit * 1000) for limit in self.LATENCY_BUCKET]
+        label_list.append('>=%gms' % (self.LATENCY_BUCKET[-1] * 1000))
+
+        return {
+            'count': self.count,
+            'byte': self.byte,
+            'error': dict(self.error),
+            'latency': dict(zip(label_list, self.latency)),
+        }
+
 class I2CBus:
     # ioctl 用 (Linux の i2c-dev.h の定義から引用)
     I2C_SLAVE		= 0x0703
@@ -32,49 +144,501 @@ class I2CBus:
     
     I2C_M_RD    	= 0x0001 
     I2C_M_IGNORE_NAK    = 0x1000
+
+    I2C_RDWR_MAX_MSGS   = 42 # I2C_RDWR_IOCTL_MAX_MSGS
+
+    BUF_POOL_SIZE       = 64 # SPS30 の 60 byte が収まるサイズ
+
+    SCAN_ADDR_FIRST     = 0x03 # i2cdetect と同じく予約アドレスは除く
+    SCAN_ADDR_LAST      = 0x77
+
+    # NOTE: バスが固まると ETIMEDOUT か EREMOTEIO が続くので，ETIMEDOUT なら
+    # すぐに，EREMOTEIO ならこの回数続いたらバスの状態を確認してリカバリする
+    RECOVER_ERROR_COUNT = 3
+
+    # NOTE: 打ち切られたスレッドがロックを持ったまま固まっても，他のスレッドが
+    # 待ち続けないように，プロセス内のロックを待つ時間は限る [sec]
+    LOCK_TIMEOUT        = 10
     
-    def __init__(self, bus):
-        self.fd = posix.open('/dev/i2c-%i' % bus, posix.O_RDWR)
+    def __init__(self, bus, backend=None):
+        self.bus = bus
+        self.backend = backend if backend is not None else create_backend(bus)
+        self.lock = threading.RLock()
+
+        self.use_flock = _use_flock
+        self.lock_count = 0 # flock を獲得した回数
+        self.lock_wait = 0.0 # flock の獲得待ちに費やした時間 [sec]
+        self.__flock_fd = None
+        self.__flock_depth = 0 # transaction() 中 (sleep() で待っている間も含む) の数
+        self.__flock_held = False
+        self.__flock_mutex = threading.Lock() # __flock_depth 等を守る
+        self.__local = threading.local() # スレッド毎の transaction() の深さ等
+
+        # NOTE: 無効時は None にしておき，判定 1 回分のコストで済ませる
+        self.stat_map = {} if _stat_path is not None else None
+
+        self.error_count = 0 # 同じアドレスで EREMOTEIO が連続した回数
+        self.error_addr = None # EREMOTEIO が続いているアドレス
+        self.probe_depth = 0 # probe() 中は NACK が普通の応答なので数えない
+        self.recover_count = 0 # バスのリカバリを行った回数
+
+        # NOTE: 呼び出し毎に ctypes のオブジェクトを作らなくて済むように，
+        # メッセージとバッファはバス毎に確保して使い回す
+        self.__msg_pool = (I2CMsg * self.I2C_RDWR_MAX_MSGS)()
+        self.__rdwr_data = I2CRdWrData(msgs=self.__msg_pool, nmsgs=0)
+        self.__alloc_buf_pool(self.BUF_POOL_SIZE)
        
     def read(self, dev_addr, count, reg_addr=None):
-        read_buf = ctypes.create_string_buffer(count)
-        read_msg = I2CMsg(
-            addr=dev_addr, flags=self.I2C_M_RD,
-            len=count, buf=read_buf
-        )
-        msgs = None
-        if (reg_addr == None):
-            msgs = (read_msg,)
-        else:
-            write_dat = bytes(bytearray([reg_addr]))
-            write_msg = self.__create_write_msg(dev_addr, write_dat)
-            msgs = (write_msg, read_msg)
+        return self.transfer([(dev_addr, reg_addr, count)])[0]
+
+    # buf (bytearray や memoryview 等の書き込み可能なバッファ) に直接読み出します．
+    # 読み出したバイト数を返します．
+    def read_into(self, dev_addr, buf, reg_addr=None):
+        view = memoryview(buf).cast('B')
+        count = len(view)
+        read_buf = (ctypes.c_char * count).from_buffer(view)
+
+        with self.transaction():
+            nmsgs = 0
+            if (reg_addr != None):
+                self.__buf_pool[0] = reg_addr
+                self.__set_msg(nmsgs, dev_addr, 0x0, 1, self.__buf_addr)
+                nmsgs += 1
+            self.__set_msg(nmsgs, dev_addr, self.I2C_M_RD, count, ctypes.addressof(read_buf))
+            nmsgs += 1
+
+            self.__send(nmsgs)
+
+        return count
+
+    # 複数の読み書きを，できるだけ少ない I2C_RDWR の呼び出しで実行します．
+    # req_list の各要素は，読み出しなら (dev_addr, reg_addr, count)，
+    # 書き込みなら (dev_addr, data) のタプルで指定します．reg_addr が
+    # None の場合はレジスタを指定せずに読み出します．
+    # 読み出した結果を，要求した順にリストで返します．
+    def transfer(self, req_list):
+        data_list = []
+        batch = []
+        nmsgs = 0
+        buf_size = 0
+        for req in req_list:
+            (req_nmsgs, req_buf_size) = self.__req_size(req)
+
+            # NOTE: レジスタ指定と読み出しの間で I2C_RDWR が分かれないように，
+            # リクエスト単位で分割する．バッファは足りなければ広げるので，
+            # 分割するのはメッセージ数の上限を超える場合だけ
+            if (nmsgs + req_nmsgs) > self.I2C_RDWR_MAX_MSGS:
+                data_list.extend(self.__transfer_batch(batch, buf_size))
+                batch = []
+                nmsgs = 0
+                buf_size = 0
+
+            batch.append(req)
+            nmsgs += req_nmsgs
+            buf_size += req_buf_size
+
+        if len(batch) != 0:
+            data_list.extend(self.__transfer_batch(batch, buf_size))
+
+        return data_list
+
+    # 複数のデバイスのレジスタを，1 回の I2C_RDWR でまとめて読み出します．
+    # 異なるデバイスの値をほぼ同時刻にサンプリングしたい場合に使います．
+    # member_list の各要素は，読み出し要求のリストを返す snapshot_req() と，
+    # 読み出した結果を値に変換する parse_snapshot(data_list) を持つオブジェクトです．
+    # 各要素の parse_snapshot() の結果をリストで返します．
+    def snapshot(self, member_list):
+        req_list = []
+        req_count_list = []
+        for member in member_list:
+            member_req_list = member.snapshot_req()
+            req_list.extend(member_req_list)
+            req_count_list.append(len(member_req_list))
+
+        nmsgs = 0
+        buf_size = 0
+        for req in req_list:
+            (req_nmsgs, req_buf_size) = self.__req_size(req)
+            nmsgs += req_nmsgs
+            buf_size += req_buf_size
+
+        if nmsgs > self.I2C_RDWR_MAX_MSGS:
+            raise ValueError('Too many messages for one transaction: %d' % nmsgs)
+
+        data_list = self.__transfer_batch(req_list, buf_size)
+
+        value_list = []
+        for (member, req_count) in zip(member_list, req_count_list):
+            value_list.append(member.parse_snapshot(data_list[0:req_count]))
+            data_list = data_list[req_count:]
 
-        self.__send(*msgs)
-            
-        return b''.join(
-            ctypes.string_at(msg.buf, msg.len)
-            for msg in msgs if (msg.flags & self.I2C_M_RD)
-        )
+        return value_list
+
+    # デバイスが応答 (ACK) するかどうかを調べます．
+    # NOTE: i2cdetect と同じく，EEPROM 等が居る範囲は 1 byte 読み出し，
+    # それ以外は長さ 0 の書き込み (Quick Write) で調べる
+    def probe(self, dev_addr):
+        with self.transaction():
+            self.probe_depth += 1
+            try:
+                if (0x30 <= dev_addr <= 0x37) or (0x50 <= dev_addr <= 0x5F):
+                    self.transfer([(dev_addr, None, 1)])
+                else:
+                    self.transfer([(dev_addr, b'')])
+                return True
+            except OSError:
+                return False
+            finally:
+                self.probe_depth -= 1
+
+    # バス上で応答したデバイスアドレスのリストを返します．
+    def scan(self, addr_list=None):
+        if addr_list is None:
+            addr_list = range(self.SCAN_ADDR_FIRST, self.SCAN_ADDR_LAST + 1)
+
+        with self.transaction():
+            return [dev_addr for dev_addr in addr_list if self.probe(dev_addr)]
 
     def write(self, dev_addr, *param):
-        write_dat = bytes(bytearray(*param))
-        write_msg = self.__create_write_msg(dev_addr, write_dat)
-        self.__send(write_msg)
-        
-    def __send(self, *msgs):
-        nmsgs = len(msgs)
-        rdwr_data = I2CRdWrData(
-            msgs=(I2CMsg*nmsgs)(*msgs),
-            nmsgs=nmsgs
-        )
-        fcntl.ioctl(self.fd, self.I2C_RDWR, rdwr_data)
-        
-    def __create_write_msg(self, dev_addr, write_dat):
-        write_len = len(write_dat)
-        write_buf = ctypes.create_string_buffer(write_dat, write_len)
-        
-        return I2CMsg(
-            addr=dev_addr, flags=0x0,
-            len=write_len, buf=write_buf
-        )
+        self.transfer([(dev_addr, bytes(bytearray(*param)))])
+
+    # 書き込み → 待ち → 読み出し のように複数回に分かれるアクセスを，
+    # 他のスレッドに割り込まれないようにまとめます．
+    # set_flock() で有効にした場合は，flock で他のプロセスも排除します．
+    #   with i2c.transaction():
+    #       i2c.write(...)
+    #       i2c.read(...)
+    # プロセス内のロックを LOCK_TIMEOUT 秒待っても獲得できない場合は，
+    # TimeoutError を投げます．
+    @contextlib.contextmanager
+    def transaction(self):
+        self.__acquire_lock()
+        try:
+            self.__acquire_flock()
+            try:
+                yield self
+            finally:
+                self.__release_flock()
+        finally:
+            self.__release_lock()
+
+    # transaction() の中で，変換時間等を待つ場合に使います．
+    # 待っている間はプロセス内のロックだけを手放して，同じプロセスの他の
+    # センサがバスを使えるようにします．
+    # NOTE: flock は持ったままにして，コマンドの書き込みから応答の読み出し
+    # までの間に，他のプロセスが割り込めないようにする
+    def sleep(self, sec):
+        held = getattr(self.__local, 'held', 0)
+        if held == 0:
+            time.sleep(max(sec, 0))
+            return
+
+        for i in range(held):
+            self.lock.release()
+        self.__local.held = 0
+        try:
+            time.sleep(max(sec, 0))
+        finally:
+            if not self.lock.acquire(timeout=self.LOCK_TIMEOUT):
+                raise TimeoutError('I2C bus %d is busy' % self.bus)
+            for i in range(held - 1):
+                self.lock.acquire()
+            self.__local.held = held
+
+    # プロセス間のロックを有効/無効にします．
+    def set_flock(self, enable):
+        with self.lock:
+            self.use_flock = enable
+
+    # デバイス毎の統計の記録を有効/無効にします．
+    def set_stat(self, enable):
+        with self.lock:
+            if not enable:
+                self.stat_map = None
+            elif self.stat_map is None:
+                self.stat_map = {}
+
+    # デバイスアドレス毎の統計を返します．
+    def dump_stat(self):
+        with self.lock:
+            if self.stat_map is None:
+                return {}
+            return {
+                '0x%02X' % dev_addr: stat.dump()
+                for (dev_addr, stat) in sorted(self.stat_map.items())
+            }
+
+    def get_lock_stat(self):
+        return {
+            'count': self.lock_count,
+            'wait': self.lock_wait,
+        }
+
+    def close(self):
+        # NOTE: 打ち切られたスレッドがロックを持ったまま固まっていても，
+        # 終了時に待ち続けないようにする
+        if not self.lock.acquire(timeout=self.LOCK_TIMEOUT):
+            return
+        try:
+            if self.backend is not None:
+                self.backend.close()
+                self.backend = None
+            if self.__flock_fd is not None:
+                posix.close(self.__flock_fd)
+                self.__flock_fd = None
+        finally:
+            self.lock.release()
+
+    def __acquire_lock(self):
+        if not self.lock.acquire(timeout=self.LOCK_TIMEOUT):
+            raise TimeoutError('I2C bus %d is busy' % self.bus)
+        self.__local.depth = getattr(self.__local, 'depth', 0) + 1
+        self.__local.held = getattr(self.__local, 'held', 0) + 1
+
+    # NOTE: sleep() の後でロックを獲得し直せなかった場合は，手放すロックが無い
+    def __release_lock(self):
+        self.__local.depth -= 1
+        if self.__local.held > self.__local.depth:
+            self.__local.held -= 1
+            self.lock.release()
+
+    def __acquire_flock(self):
+        with self.__flock_mutex:
+            self.__flock_depth += 1
+            if (self.__flock_depth != 1) or not self.use_flock:
+                return
+            self.__lock_flock()
+
+    def __release_flock(self):
+        with self.__flock_mutex:
+            self.__flock_depth -= 1
+            if (self.__flock_depth != 0) or not self.__flock_held:
+                return
+            fcntl.flock(self.__flock_fd, fcntl.LOCK_UN)
+            self.__flock_held = False
+
+    def __lock_flock(self):
+        if self.__flock_fd is None:
+            self.__flock_fd = posix.open(
+                FLOCK_PATH % self.bus, posix.O_RDWR | posix.O_CREAT, 0o666
+            )
+            try:
+                # NOTE: 実行ユーザが異なるプロセス同士でも共有できるようにする
+                os.fchmod(self.__flock_fd, 0o666)
+            except OSError:
+                pass
+
+        start = time.monotonic()
+        fcntl.flock(self.__flock_fd, fcntl.LOCK_EX)
+        self.__flock_held = True
+        self.lock_count += 1
+        self.lock_wait += time.monotonic() - start
+
+    def __req_size(self, req):
+        if len(req) == 3:
+            (dev_addr, reg_addr, count) = req
+            if (reg_addr != None):
+                return (2, 1 + count)
+            else:
+                return (1, count)
+        else:
+            (dev_addr, data) = req
+            return (1, len(data))
+
+    def __transfer_batch(self, batch, buf_size):
+        with self.transaction():
+            return self.__transfer_batch_impl(batch, buf_size)
+
+    def __transfer_batch_impl(self, batch, buf_size):
+        if buf_size > len(self.__buf_pool):
+            self.__alloc_buf_pool(buf_size)
+
+        read_list = []
+        nmsgs = 0
+        offset = 0
+        for req in batch:
+            if len(req) == 3:
+                (dev_addr, reg_addr, count) = req
+                if (reg_addr != None):
+                    self.__buf_pool[offset] = reg_addr
+                    self.__set_msg(nmsgs, dev_addr, 0x0, 1, self.__buf_addr + offset)
+                    nmsgs += 1
+                    offset += 1
+                self.__set_msg(nmsgs, dev_addr, self.I2C_M_RD, count, self.__buf_addr + offset)
+                read_list.append((offset, count))
+                nmsgs += 1
+                offset += count
+            else:
+                (dev_addr, data) = req
+                write_len = len(data)
+                self.__buf_pool[offset:offset + write_len] = bytes(bytearray(data))
+                self.__set_msg(nmsgs, dev_addr, 0x0, write_len, self.__buf_addr + offset)
+                nmsgs += 1
+                offset += write_len
+
+        self.__send(nmsgs)
+
+        return [
+            ctypes.string_at(self.__buf_addr + offset, count)
+            for (offset, count) in read_list
+        ]
+
+    def __alloc_buf_pool(self, size):
+        self.__buf_pool = (ctypes.c_uint8 * size)()
+        self.__buf_addr = ctypes.addressof(self.__buf_pool)
+
+    def __set_msg(self, index, dev_addr, flags, count, buf_addr):
+        msg = self.__msg_pool[index]
+        msg.addr = dev_addr
+        msg.flags = flags
+        msg.len = count
+        msg.buf = buf_addr
+
+    def __send(self, nmsgs):
+        self.__rdwr_data.nmsgs = nmsgs
+        try:
+            self.__rdwr(nmsgs)
+            self.error_count = 0
+        except OSError as e:
+            if not self.__recover(e):
+                raise
+            # NOTE: リカバリできたら，失敗した転送をやり直す
+            self.__rdwr(nmsgs)
+            self.error_count = 0
+
+    def __rdwr(self, nmsgs):
+        if self.stat_map is None:
+            self.backend.rdwr(self.__rdwr_data)
+        else:
+            self.__send_with_stat(nmsgs)
+
+    def __recover(self, error):
+        if error.errno == errno.EREMOTEIO:
+            # NOTE: probe() の NACK は居ないアドレスの普通の応答なので数えない．
+            # また，処理中のデバイスは NACK を返すので，別のアドレスの
+            # NACK が混ざる場合はバスの異常とはみなさない
+            if self.probe_depth != 0:
+                return False
+            dev_addr = self.__msg_pool[0].addr
+            if dev_addr != self.error_addr:
+                self.error_addr = dev_addr
+                self.error_count = 0
+            self.error_count += 1
+            if self.error_count < self.RECOVER_ERROR_COUNT:
+                return False
+        elif error.errno != errno.ETIMEDOUT:
+            return False
+
+        # NOTE: 存在しないデバイスへのアクセス等でも EREMOTEIO は続くので，
+        # バスの状態の確認は RECOVER_ERROR_COUNT 回に 1 回だけにする
+        self.error_count = 0
+        self.error_addr = None
+        recover = getattr(self.backend, 'recover', None)
+        if (recover is None) or not recover():
+            return False
+
+        self.recover_count += 1
+        return True
+
+    def __send_with_stat(self, nmsgs):
+        error_no = None
+        start = time.perf_counter()
+        try:
+            self.backend.rdwr(self.__rdwr_data)
+        except OSError as e:
+            error_no = e.errno
+            raise
+        finally:
+            latency = time.perf_counter() - start
+
+            byte_map = {}
+            for i in range(nmsgs):
+                msg = self.__msg_pool[i]
+                byte_map[msg.addr] = byte_map.get(msg.addr, 0) + msg.len
+
+            for (dev_addr, byte) in byte_map.items():
+                if dev_addr not in self.stat_map:
+                    self.stat_map[dev_addr] = I2CStat()
+                self.stat_map[dev_addr].record(byte, latency, error_no)
+
+
+# NOTE: 同じバスを複数のセンサで使う場合にデバイスファイルを何度も
+# 開かなくて済むように，バス毎に一つの I2CBus をプロセス内で共有する．
+_bus_map = {}
+_bus_map_lock = threading.Lock()
+
+def get_bus(bus):
+    with _bus_map_lock:
+        if bus not in _bus_map:
+            _bus_map[bus] = I2CBus(bus)
+
+        return _bus_map[bus]
+
+# 全てのバスでプロセス間のロックを有効/無効にします．
+# これ以降に作られるバスにも適用されます．
+def set_flock(enable):
+    global _use_flock
+    with _bus_map_lock:
+        _use_flock = enable
+        for i2c in _bus_map.values():
+            i2c.set_flock(enable)
+
+# flock の獲得待ちに費やした時間 [sec] を，全てのバスについて合計して返します．
+def get_lock_wait():
+    with _bus_map_lock:
+        return sum(i2c.lock_wait for i2c in _bus_map.values())
+
+def close_bus(bus):
+    with _bus_map_lock:
+        if bus in _bus_map:
+            _bus_map.pop(bus).close()
+
+# 全てのバスでデバイス毎の統計の記録を有効/無効にします．
+def set_stat(enable):
+    with _bus_map_lock:
+        for i2c in _bus_map.values():
+            i2c.set_stat(enable)
+
+# 全てのバスの統計を {バス番号: {デバイスアドレス: 統計}} の形で返します．
+def dump_stat():
+    with _bus_map_lock:
+        return {
+            str(bus): i2c.dump_stat() for (bus, i2c) in sorted(_bus_map.items())
+        }
+
+# 統計を JSON ファイルに保存します．既存のファイルがある場合は値を加算します．
+def save_stat(path):
+    stat = dump_stat()
+    try:
+        with open(path, 'r') as f:
+            stat = merge_stat(json.load(f), stat)
+    except (OSError, ValueError):
+        pass
+
+    with open(path, 'w') as f:
+        json.dump(stat, f, indent=2)
+
+def merge_stat(base, stat):
+    if isinstance(base, dict) and isinstance(stat, dict):
+        merged = dict(base)
+        for (key, value) in stat.items():
+            merged[key] = merge_stat(base[key], value) if key in base else value
+        return merged
+    elif isinstance(base, (int, float)) and isinstance(stat, (int, float)):
+        return base + stat
+    else:
+        return stat
+
+def close_all():
+    with _bus_map_lock:
+        for i2c in _bus_map.values():
+            i2c.close()
+        _bus_map.clear()
+
+def __save_stat_at_exit():
+    if _stat_path is not None:
+        save_stat(_stat_path)
+
+# NOTE: close_all() より先に統計を保存する (atexit は登録と逆順に実行される)
+atexit.register(close_all)
+atexit.register(__save_stat_at_exit)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# I2C バスのリカバリを行うライブラリです．
+#
+# 通信の途中でマスタがリセットされる等で，スレーブが SDA を Low に
+# したままになると，以降の通信が全て失敗します．この場合，SCL に
+# クロックを送ってスレーブの送信を終わらせ，STOP コンディションを
+# 出すと復旧できます (UM10204 3.1.16 Bus clear)．
+#
+# SDA/SCL のレベルは /dev/gpiomem から読み，クロックの送出には GPIO の
+# キャラクタデバイスを使うので，外部コマンドを起動する必要はありません．
+# 終わったら /dev/gpiomem を使ってピンを I2C の機能 (ALT0) に戻します．
+
+import os
+import time
+import mmap
+import fcntl
+import ctypes
+import struct
+import logging
+
+class GPIOHandleRequest(ctypes.Structure):
+    _fields_ = [
+        ('lineoffsets', ctypes.c_uint32 * 64),
+        ('flags', ctypes.c_uint32),
+        ('default_values', ctypes.c_uint8 * 64),
+        ('consumer_label', ctypes.c_char * 32),
+        ('lines', ctypes.c_uint32),
+        ('fd', ctypes.c_int),
+    ]
+
+class GPIOHandleData(ctypes.Structure):
+    _fields_ = [
+        ('values', ctypes.c_uint8 * 64),
+    ]
+
+class BusRecovery:
+    # ioctl 用 (Linux の gpio.h の定義から引用)
+    GPIO_GET_LINEHANDLE_IOCTL           = 0xC16CB403
+    GPIOHANDLE_GET_LINE_VALUES_IOCTL    = 0xC040B408
+    GPIOHANDLE_SET_LINE_VALUES_IOCTL    = 0xC040B409
+
+    GPIOHANDLE_REQUEST_OUTPUT           = 0x1 << 1
+    GPIOHANDLE_REQUEST_OPEN_DRAIN       = 0x1 << 3
+
+    GPIO_CHIP_PATH      = '/dev/gpiochip0'
+    GPIO_MEM_PATH       = '/dev/gpiomem'
+
+    REG_GPLEV0          = 0x34
+    FSEL_ALT0           = 0b100
+
+    # バス番号 → (SDA, SCL) の GPIO 番号
+    PIN_MAP = {
+        0x1: (2, 3),
+        0x0: (0, 1),    # dtparam=i2c_vc=on
+    }
+
+    CLOCK_COUNT         = 9     # 1 byte + ACK 分のクロックを送れば必ず開放される
+    CLOCK_WAIT          = 0.00005
+    STUCK_SAMPLE        = 3     # SDA が Low に張り付いていると判断するまでの確認回数
+    STUCK_WAIT          = 0.0005
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.pin = self.PIN_MAP.get(bus)
+        self.mem = None
+        self.logger = logging.getLogger(__name__)
+
+    # SDA が Low のままになっているかどうかを返します．
+    def is_stuck(self):
+        if (self.pin is None) or not self.__open_mem():
+            return False
+
+        (sda, scl) = self.pin
+        for i in range(self.STUCK_SAMPLE):
+            if self.__get_level(sda):
+                return False
+            time.sleep(self.STUCK_WAIT)
+        return True
+
+    # バスが固まっていたら復旧させます．復旧を試みた場合は True を返します．
+    def recover(self):
+        if not self.is_stuck():
+            return False
+
+        self.logger.warning('I2C bus %d: SDA stuck low, sending clock on SCL', self.bus)
+        try:
+            self.__clear_bus()
+        except OSError:
+            self.logger.exception('I2C bus %d: failed to recover', self.bus)
+        finally:
+            for pin in self.pin:
+                self.__set_alt0(pin)
+
+        return True
+
+    def close(self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+
+    def __clear_bus(self):
+        (sda, scl) = self.pin
+
+        req = GPIOHandleRequest()
+        req.lineoffsets[0] = sda
+        req.lineoffsets[1] = scl
+        req.flags = self.GPIOHANDLE_REQUEST_OUTPUT | self.GPIOHANDLE_REQUEST_OPEN_DRAIN
+        req.default_values[0] = 1
+        req.default_values[1] = 1
+        req.consumer_label = b'i2c-recovery'
+        req.lines = 2
+
+        fd = os.open(self.GPIO_CHIP_PATH, os.O_RDWR)
+        try:
+            fcntl.ioctl(fd, self.GPIO_GET_LINEHANDLE_IOCTL, req)
+        finally:
+            os.close(fd)
+
+        try:
+            for i in range(self.CLOCK_COUNT):
+                if self.__get_line(req.fd, 0):
+                    break
+                self.__set_line(req.fd, 1, 0)
+                self.__set_line(req.fd, 1, 1)
+
+            # STOP コンディション (SCL が High の間に SDA を Low → High)
+            self.__set_line(req.fd, 0, 0)
+            self.__set_line(req.fd, 0, 1)
+        finally:
+            os.close(req.fd)
+
+    def __get_line(self, fd, index):
+        data = GPIOHandleData()
+        fcntl.ioctl(fd, self.GPIOHANDLE_GET_LINE_VALUES_IOCTL, data)
+        return data.values[index] != 0
+
+    def __set_line(self, fd, index, value):
+        # NOTE: 2 本まとめて設定するので，もう片方は High (開放) にしておく
+        data = GPIOHandleData()
+        data.values[0] = 1
+        data.values[1] = 1
+        data.values[index] = value
+        fcntl.ioctl(fd, self.GPIOHANDLE_SET_LINE_VALUES_IOCTL, data)
+        time.sleep(self.CLOCK_WAIT)
+
+    def __open_mem(self):
+        if self.mem is not None:
+            return True
+        try:
+            fd = os.open(self.GPIO_MEM_PATH, os.O_RDWR | os.O_SYNC)
+            try:
+                self.mem = mmap.mmap(fd, mmap.PAGESIZE)
+            finally:
+                os.close(fd)
+            return True
+        except OSError:
+            return False
+
+    def __get_level(self, pin):
+        offset = self.REG_GPLEV0 + (pin // 32) * 4
+        value = struct.unpack_from('<I', self.mem, offset)[0]
+        return (value >> (pin % 32)) & 0x1 != 0
+
+    def __set_alt0(self, pin):
+        if not self.__open_mem():
+            return
+        offset = (pin // 10) * 4
+        shift = (pin % 10) * 3
+        value = struct.unpack_from('<I', self.mem, offset)[0]
+        value = (value & ~(0b111 << shift)) | (self.FSEL_ALT0 << shift)
+        struct.pack_into('<I', self.mem, offset, value)
+
+if __name__ == '__main__':
+    # TEST Code
+    I2C_BUS = 0x1 # I2C のバス番号 (Raspberry Pi は 0x1)
+
+    logging.basicConfig(level=logging.INFO)
+
+    recovery = BusRecovery(I2C_BUS)
+    print('STUCK: %s' % recovery.is_stuck())
+    print('RECOVER: %s' % recovery.recover())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 計測値を InfluxDB (v2 の /api/v2/write) に直接書き込むライブラリです．
+#
+# fluentd を使わずに済むように，計測値を line protocol に変換して
+# スプールファイルに追記し，batch 個溜まったらまとめて gzip で圧縮して
+# 送信します．サーバに届かない間はスプールに溜めておき (最大 SPOOL_MAX
+# バイト．超えたら古いものから捨てる)，次に送れたときにまとめて送ります．
+#
+# スプールはファイルなので，1 回ずつ起動する場合もプロセスをまたいで
+# まとめて送れます．同時に起動したプロセスとは flock で排他します．
+#
+#   writer = influx.InfluxWriter(
+#       'http://localhost:8086', token, 'org', 'sensor',
+#       spool_path='/dev/shm/sense_env_influx.spool', batch=3,
+#   )
+#   writer.write({ 'temp': 25.0 })
+
+import os
+import gzip
+import time
+import fcntl
+import socket
+import logging
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import shm
+
+MEASUREMENT     = 'sensor.rasp'
+BATCH           = 1
+SPOOL_MAX       = 4*1024*1024 # スプールの最大サイズ [byte]
+SEND_MAX        = 5000 # 1 回の送信で送る最大の行数
+TIMEOUT         = 5
+RETRY_STATUS    = (401, 403, 429) # 再送する HTTP のステータス (5xx も再送する)
+
+logger = logging.getLogger(__name__)
+
+def escape_key(key):
+    return key.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+def escape_measurement(name):
+    return name.replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ')
+
+def format_field(value):
+    # NOTE: bool は int のサブクラスなので先に判定する
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, int):
+        return '%di' % value
+    elif isinstance(value, float):
+        return repr(value)
+    else:
+        return '"%s"' % str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+# 計測値を line protocol の 1 行にします．
+# None の値は書き込めないので除き，値が 1 つも無い場合は None を返します．
+def to_line(measurement, tag_map, field_map, timestamp):
+    field_list = [
+        '%s=%s' % (escape_key(key), format_field(value))
+        for (key, value) in sorted(field_map.items()) if value is not None
+    ]
+    if len(field_list) == 0:
+        return None
+
+    tag_list = [
+        '%s=%s' % (escape_key(key), escape_key(str(value)))
+        for (key, value) in sorted(tag_map.items())
+    ]
+
+    return '%s %s %d' % (
+        ','.join([escape_measurement(measurement)] + tag_list),
+        ','.join(field_list),
+        timestamp,
+    )
+
+# 行単位で追記・取り出しができるスプールファイルです．
+#
+# NOTE: 書き込む度にファイル全体を読んで行数を数えなくて済むように，
+# 行数を覚えておく．他のプロセスが書き換えた場合は (inode, サイズ) が
+# 変わるので，その場合だけ数え直す
+class Spool:
+    def __init__(self, path, size_max=SPOOL_MAX):
+        self.path = path
+        self.size_max = size_max
+        self.lock_fd = None
+        self.line_count = 0
+        self.stat_key = None
+
+    def __enter__(self):
+        self.lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+        os.close(self.lock_fd)
+        self.lock_fd = None
+
+    def append(self, line):
+        count = self.count()
+        with open(self.path, 'a') as f:
+            f.write(line + '\n')
+        self.__update(count + 1)
+
+        if self.stat_key[1] > self.size_max:
+            self.__trim()
+
+    # スプールの行数を返します．
+    def count(self):
+        if self.__get_stat_key() != self.stat_key:
+            self.__update(len(self.read()))
+        return self.line_count
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
+
+    # 先頭から count 行を取り除きます．
+    def remove(self, count):
+        self.__rewrite(self.read()[count:])
+
+    def __trim(self):
+        line_list = self.read()
+        size = sum(len(line) + 1 for line in line_list)
+        drop = 0
+        while (size > self.size_max) and (drop < len(line_list)):
+            size -= len(line_list[drop]) + 1
+            drop += 1
+
+        logger.warning('Spool is full, dropping %d oldest line(s)', drop)
+        self.__rewrite(line_list[drop:])
+
+    def __rewrite(self, line_list):
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(line + '\n' for line in line_list))
+        os.replace(tmp_path, self.path)
+        self.__update(len(line_list))
+
+    def __get_stat_key(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_ino, stat.st_size)
+        except OSError:
+            return None
+
+    def __update(self, count):
+        self.line_count = count
+        self.stat_key = self.__get_stat_key()
+
+class InfluxWriter:
+    def __init__(self, url, token, org, bucket, measurement=MEASUREMENT,
+                 tag_map=None, spool_path=None, batch=BATCH, spool_max=SPOOL_MAX):
+        query = urllib.parse.urlencode({'org': org, 'bucket': bucket, 'precision': 's'})
+        self.write_url = '%s/api/v2/write?%s' % (url.rstrip('/'), query)
+        self.token = token
+        self.measurement = measurement
+        # NOTE: fluentd 経由の場合と同じく，hostname タグを付ける
+        self.tag_map = {'hostname': socket.gethostname()} if tag_map is None else tag_map
+        self.batch = batch
+
+        if spool_path is None:
+            spool_path = shm.get_path('influx_%s.spool' % os.getpid())
+        self.spool = Spool(spool_path, spool_max)
+
+    def write(self, record, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        line = to_line(self.measurement, self.tag_map, record, timestamp)
+        if line is None:
+            return
+
+        with self.spool:
+            self.spool.append(line)
+            if self.spool.count() >= self.batch:
+                self.__flush()
+
+    # 溜まっている計測値を送ります．全て送れた場合は True を返します．
+    def flush(self):
+        with self.spool:
+            return self.__flush()
+
+    # NOTE: batch 個に満たない分はスプールに残しておき，次のプロセスが送る
+    # (1 回ずつ起動する場合も，プロセスをまたいでまとめて送れる)
+    def close(self):
+        pass
+
+    def __flush(self):
+        while True:
+            line_list = self.spool.read()[0:SEND_MAX]
+            if len(line_list) == 0:
+                return True
+
+            if not self.__send(line_list):
+                logger.warning('Failed to write to InfluxDB (%d line(s) spooled)',
+                               self.spool.count())
+                return False
+            self.spool.remove(len(line_list))
+
+    # 送れたか，送っても無駄 (不正な行) な場合は True を返します．
+    def __send(self, line_list):
+        data = gzip.compress(''.join(line + '\n' for line in line_list).encode())
+        req = urllib.request.Request(self.write_url, data=data, method='POST')
+        req.add_header('Content-Type', 'text/plain; charset=utf-8')
+        req.add_header('Content-Encoding', 'gzip')
+        if self.token:
+            req.add_header('Authorization', 'Token %s' % self.token)
+
+        try:
+            with urllib.request.urlopen(req, timeout=TIMEOUT) as res:
+                return True
+        except urllib.error.HTTPError as e:
+            # NOTE: 認証エラー，流量制限，サーバの異常は，設定や復旧を待って再送する
+            if (e.code in RETRY_STATUS) or (e.code >= 500):
+                logger.debug('InfluxDB returned %d', e.code)
+                return False
+
+            # NOTE: 大き過ぎる場合は分けて送る．後半だけ失敗した場合は前半も
+            # 再送することになるが，InfluxDB では同じ点は上書きになるので問題ない
+            if (e.code == 413) and (len(line_list) > 1):
+                half = len(line_list) // 2
+                return self.__send(line_list[0:half]) and self.__send(line_list[half:])
+
+            # NOTE: 不正な行 (400) や型の不一致・保持期間外 (422) 等は，
+            # 何度送っても受け付けられないので捨てる
+            logger.error('InfluxDB rejected %d line(s) (%d): %s',
+                         len(line_list), e.code, e.read()[0:200])
+            return True
+        except (urllib.error.URLError, OSError) as e:
+            logger.debug('Failed to connect to InfluxDB: %s', e)
+            return False
+
+if __name__ == '__main__':
+    # TEST Code
+    # ローカルの http.server を InfluxDB の代わりにして，まとめて送ること，
+    # 413 の場合に分けて送ること，400/422 の行は捨てて 5xx/429 の行は
+    # スプールに残すことを確認します．
+    #
+    #   $ python3 lib/influx.py
+    import sys
+    import tempfile
+    import threading
+    import http.server
+
+    class StubHandler(http.server.BaseHTTPRequestHandler):
+        status = 204        # 応答するステータス
+        line_max = None     # これより多い行をまとめて送られたら 413 を返す
+        request_list = []   # 受け取った行のリスト
+
+        def do_POST(self):
+            data = self.rfile.read(int(self.headers['Content-Length']))
+            line_list = gzip.decompress(data).decode().splitlines()
+            StubHandler.request_list.append(line_list)
+
+            status = StubHandler.status
+            if (StubHandler.line_max is not None) and (len(line_list) > StubHandler.line_max):
+                status = 413
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    def reset_stub(status=204, line_max=None):
+        StubHandler.status = status
+        StubHandler.line_max = line_max
+        StubHandler.request_list = []
+
+    def check(label, result):
+        print('%-36s %s' % (label, 'OK' if result else 'NG'))
+        return result
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    server = http.server.HTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d' % server.server_port
+
+    is_ok = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def create_writer(name, batch):
+            return InfluxWriter(url, '', 'org', 'bucket', tag_map={},
+                                spool_path=os.path.join(tmp_dir, name), batch=batch)
+
+        # batch 個溜まったら 1 回でまとめて送る
+        reset_stub()
+        writer = create_writer('batch.spool', 3)
+        writer.write({'value': 0}, 1000)
+        writer.write({'value': 1}, 1001)
+        is_ok &= check('batch: hold until full', len(StubHandler.request_list) == 0)
+        writer.write({'value': 2}, 1002)
+        is_ok &= check('batch: send in one request',
+                       [len(req) for req in StubHandler.request_list] == [3])
+        is_ok &= check('batch: spool is empty', writer.spool.count() == 0)
+
+        # 413 の場合は受け付けられる大きさになるまで分けて送る
+        reset_stub(line_max=2)
+        writer = create_writer('split.spool', 5)
+        for i in range(5):
+            writer.write({'value': i}, 1000 + i)
+        # NOTE: 5 行 → 413 → 2 行 + 3 行 → 413 → 1 行 + 2 行
+        is_ok &= check('413: split until accepted',
+                       [len(req) for req in StubHandler.request_list] == [5, 2, 3, 1, 2])
+        accepted_list = [line for req in StubHandler.request_list if len(req) <= 2 for line in req]
+        is_ok &= check('413: all lines delivered', len(set(accepted_list)) == 5)
+        is_ok &= check('413: spool is empty', writer.spool.count() == 0)
+
+        # 400/422 は何度送っても受け付けられないので捨てる
+        for status in (400, 422):
+            reset_stub(status)
+            writer = create_writer('drop_%d.spool' % status, 1)
+            writer.write({'value': 1}, 1000)
+            is_ok &= check('%d: dropped' % status,
+                           (len(StubHandler.request_list) == 1) and (writer.spool.count() == 0))
+
+        # 5xx/429 はスプールに残して，次に送れたときに送る
+        for status in (500, 503, 429):
+            reset_stub(status)
+            writer = create_writer('keep_%d.spool' % status, 1)
+            writer.write({'value': 1}, 1000)
+            is_ok &= check('%d: kept in spool' % status, writer.spool.count() == 1)
+            reset_stub()
+            is_ok &= check('%d: sent after recovery' % status,
+                           writer.flush() and (writer.spool.count() == 0) and
+                           (len(StubHandler.request_list) == 1))
+
+    server.shutdown()
+    sys.exit(0 if is_ok else 1)
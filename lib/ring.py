@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 計測値の履歴を /dev/shm に保持するリングバッファです．
+#
+# センシング用スクリプトが計測する度に追記し，同じ Pi の他のプロセスは
+# 中央の InfluxDB に問い合わせずに直近の値や履歴を読み出せます．
+# ファイルは固定サイズで mmap して使い，項目 (metric) 毎に
+# (時刻, 値) の double の組を SLOT_COUNT 個ずつ並べて持ちます．
+#
+# 書き込みはファイル毎に 1 プロセスだけ (flock で排他) で，読み出し側は
+# ロックを取りません．項目毎のシーケンス番号 (seqlock) が書き込み中を
+# 表す奇数だったり，読んでいる間に変わった場合は読み直します．
+#
+# [ファイルの構成]
+#   ヘッダ      : magic, version, METRIC_MAX, SLOT_COUNT, 項目数   (HEADER_SIZE)
+#   項目の一覧  : 名前, シーケンス番号, 次に書く位置, 件数     (ENTRY_SIZE × METRIC_MAX)
+#   データ      : (時刻, 値) × SLOT_COUNT                   (項目毎)
+
+import os
+import glob
+import mmap
+import time
+import fcntl
+import struct
+import logging
+
+import shm
+
+RING_DIR        = shm.get_dir()
+METRIC_MAX      = 64    # 保持できる項目の数
+SLOT_COUNT      = 1024  # 項目毎に保持する件数 (20 秒毎なら約 5.7 時間分)
+NAME_SIZE       = 64    # 項目名の最大長 [byte]
+READ_RETRY      = 100
+
+MAGIC           = b'RING'
+VERSION         = 1
+HEADER          = struct.Struct('<4sIIII')
+HEADER_SIZE     = 64
+ENTRY           = struct.Struct('<%dsIII' % NAME_SIZE)
+ENTRY_SIZE      = 80
+SEQ             = struct.Struct('<I')
+SEQ_OFFSET      = NAME_SIZE
+POS             = struct.Struct('<II')
+POS_OFFSET      = NAME_SIZE + 4
+SLOT            = struct.Struct('<dd')
+
+logger = logging.getLogger(__name__)
+
+# アプリ毎のリングバッファのパスを返します．
+def get_path(app):
+    return os.path.join(RING_DIR, '%s.ring' % app)
+
+# アプリの計測値を記録するリングバッファを開きます．開けない場合は None です．
+# NOTE: リングバッファは補助的なものなので，開けなくても計測は続ける
+def open_writer(app):
+    try:
+        return Ring(get_path(app), writable=True)
+    except (OSError, ValueError) as e:
+        logger.warning('Failed to open the ring buffer: %s', e)
+        return None
+
+# open_writer() で開いたリングバッファに記録します．記録できなくても例外は投げません．
+def record(ring, value_map, timestamp=None):
+    if (ring is None) or not value_map:
+        return
+    try:
+        ring.append(value_map, timestamp)
+    except (OSError, ValueError) as e:
+        logger.warning('Failed to append to the ring buffer: %s', e)
+
+# 全てのアプリのリングバッファから，name の since 以降の (時刻, 値) を
+# 新しい方から最大 count 件探します．複数のアプリが記録している場合は，
+# 最新の値が新しい方を返します．
+def find_history(name, since=None, count=None, ring_dir=RING_DIR):
+    found_list = []
+    for path in glob.glob(os.path.join(ring_dir, '*.ring')):
+        try:
+            ring = Ring(path)
+        except (OSError, ValueError):
+            continue
+        try:
+            slot_list = ring.history(name, count, since)
+        except IOError:
+            slot_list = []
+        finally:
+            ring.close()
+
+        if (len(slot_list) != 0) and \
+           ((len(found_list) == 0) or (slot_list[-1][0] > found_list[-1][0])):
+            found_list = slot_list
+
+    return found_list
+
+# 全てのアプリのリングバッファから，name の最新の (時刻, 値) を探します．
+# 無い場合や max_age 秒より古い場合は None です．
+def find_latest(name, max_age=None, ring_dir=RING_DIR):
+    since = None if max_age is None else time.time() - max_age
+    slot_list = find_history(name, since, 1, ring_dir)
+    return slot_list[-1] if len(slot_list) != 0 else None
+
+def calc_size(metric_max, slot_count):
+    return HEADER_SIZE + (ENTRY_SIZE + SLOT.size * slot_count) * metric_max
+
+class Ring:
+    # writable でない場合，ファイルが無ければ OSError になります．
+    def __init__(self, path, writable=False, metric_max=METRIC_MAX, slot_count=SLOT_COUNT):
+        self.path = path
+        self.writable = writable
+        self.index_map = {}
+        self.mem = None
+
+        if writable:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                with self.__lock():
+                    self.__prepare(metric_max, slot_count)
+                self.mem = mmap.mmap(self.fd, calc_size(metric_max, slot_count))
+            except:
+                os.close(self.fd)
+                raise
+        else:
+            self.fd = os.open(path, os.O_RDONLY)
+            try:
+                self.mem = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+            except:
+                os.close(self.fd)
+                raise
+
+        (magic, version, self.metric_max, self.slot_count, count) = \
+            HEADER.unpack_from(self.mem, 0)
+        if (magic != MAGIC) or (version != VERSION) or \
+           (len(self.mem) < calc_size(self.metric_max, self.slot_count)):
+            self.close()
+            raise ValueError('Invalid ring buffer: %s' % path)
+
+    def close(self):
+        if self.mem is not None:
+            self.mem.close()
+            self.mem = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # 計測値を追記します．数値以外の値は無視します．
+    def append(self, value_map, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.__lock():
+            for (name, value) in value_map.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                index = self.__get_index(name, True)
+                if index is None:
+                    continue
+                self.__append_slot(index, timestamp, float(value))
+
+    # 記録されている項目名のリストを返します．
+    def metric_list(self):
+        count = HEADER.unpack_from(self.mem, 0)[4]
+        return [self.__read_name(index) for index in range(min(count, self.metric_max))]
+
+    # 最新の (時刻, 値) を返します．記録が無い場合は None です．
+    def latest(self, name):
+        slot_list = self.history(name, 1)
+        return slot_list[0] if len(slot_list) != 0 else None
+
+    # 新しい方から最大 count 件の (時刻, 値) を，古い順に返します．
+    # since を指定すると，その時刻以降のものだけ返します．
+    def history(self, name, count=None, since=None):
+        index = self.__get_index(name, False)
+        if index is None:
+            return []
+
+        entry_offset = HEADER_SIZE + ENTRY_SIZE * index
+        data_offset = self.__data_offset(index)
+
+        for i in range(READ_RETRY):
+            seq = SEQ.unpack_from(self.mem, entry_offset + SEQ_OFFSET)[0]
+            if (seq & 0x1) != 0:
+                # NOTE: 書き込み中なので待つ
+                time.sleep(0)
+                continue
+
+            (head, stored) = POS.unpack_from(self.mem, entry_offset + POS_OFFSET)
+            if count is not None:
+                stored = min(stored, count)
+            slot_list = [
+                SLOT.unpack_from(
+                    self.mem,
+                    data_offset + SLOT.size * ((head - stored + j) % self.slot_count)
+                )
+                for j in range(stored)
+            ]
+
+            if SEQ.unpack_from(self.mem, entry_offset + SEQ_OFFSET)[0] == seq:
+                if since is not None:
+                    slot_list = [slot for slot in slot_list if slot[0] >= since]
+                return slot_list
+
+        raise IOError('Failed to read consistent data: %s' % name)
+
+    def __lock(self):
+        return RingLock(self.fd)
+
+    # ファイルが無いか，構成が違う場合は作り直します．
+    def __prepare(self, metric_max, slot_count):
+        size = calc_size(metric_max, slot_count)
+        try:
+            header = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+            if (header[0:4] == (MAGIC, VERSION, metric_max, slot_count)) and \
+               (os.fstat(self.fd).st_size == size):
+                return
+        except struct.error:
+            pass
+
+        os.ftruncate(self.fd, 0)
+        os.ftruncate(self.fd, size)
+        os.pwrite(self.fd, HEADER.pack(MAGIC, VERSION, metric_max, slot_count, 0), 0)
+
+    def __read_name(self, index):
+        offset = HEADER_SIZE + ENTRY_SIZE * index
+        return bytes(self.mem[offset:offset + NAME_SIZE]).rstrip(b'\0').decode()
+
+    def __get_index(self, name, create):
+        index = self.index_map.get(name)
+        if index is not None:
+            return index
+
+        # NOTE: 他のプロセスが追加した項目もあるので，一覧を読み直す
+        name_list = self.metric_list()
+        for (index, metric) in enumerate(name_list):
+            self.index_map[metric] = index
+        if (name in self.index_map) or not create:
+            return self.index_map.get(name)
+
+        encoded = name.encode()
+        if len(encoded) > NAME_SIZE:
+            logger.warning('Metric name is too long: %s', name)
+            return None
+        index = len(name_list)
+        if index >= self.metric_max:
+            logger.warning('Ring buffer is full, ignoring %s', name)
+            return None
+
+        # NOTE: 項目の内容を書いてから項目数を増やすので，読み出し側が
+        # 書きかけの項目を見ることはない
+        ENTRY.pack_into(self.mem, HEADER_SIZE + ENTRY_SIZE * index, encoded, 0, 0, 0)
+        struct.pack_into('<I', self.mem, HEADER.size - 4, index + 1)
+        self.index_map[name] = index
+
+        return index
+
+    def __data_offset(self, index):
+        return HEADER_SIZE + ENTRY_SIZE * self.metric_max + \
+            SLOT.size * self.slot_count * index
+
+    def __append_slot(self, index, timestamp, value):
+        entry_offset = HEADER_SIZE + ENTRY_SIZE * index
+        seq = SEQ.unpack_from(self.mem, entry_offset + SEQ_OFFSET)[0]
+        (head, stored) = POS.unpack_from(self.mem, entry_offset + POS_OFFSET)
+
+        SEQ.pack_into(self.mem, entry_offset + SEQ_OFFSET, (seq + 1) & 0xFFFFFFFF)
+        SLOT.pack_into(self.mem, self.__data_offset(index) + SLOT.size * head, timestamp, value)
+        POS.pack_into(self.mem, entry_offset + POS_OFFSET,
+                      (head + 1) % self.slot_count, min(stored + 1, self.slot_count))
+        SEQ.pack_into(self.mem, entry_offset + SEQ_OFFSET, (seq + 2) & 0xFFFFFFFF)
+
+# 書き込むプロセスを 1 つにするためのロックです．
+class RingLock:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+if __name__ == '__main__':
+    # TEST Code
+    import sys
+    import datetime
+
+    ring = Ring(get_path(sys.argv[1] if len(sys.argv) > 1 else 'sense_env'))
+    for name in ring.metric_list():
+        (timestamp, value) = ring.latest(name)
+        print('%-24s %s %g' % (
+            name, datetime.datetime.fromtimestamp(timestamp).strftime('%H:%M:%S'), value
+        ))
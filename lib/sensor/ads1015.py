@@ -13,7 +13,6 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import i2cbus
-import pprint
 
 class ADS1015:
     NAME                = 'ADS1015'
@@ -30,9 +29,10 @@ class ADS1015:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.mux = self.REG_CONFIG_MUX_01
         self.pga = self.REG_CONFIG_FSR_0256
+        self.value_buf = bytearray(2)
 
     def init(self):
         os = 1
@@ -55,12 +55,11 @@ class ADS1015:
             return False
 
     def get_value(self):
-        self.init()
-        time.sleep(0.1)
-        self.i2cbus.write(self.dev_addr, [self.REG_VALUE])
-
-        value = self.i2cbus.read(self.dev_addr, 2)
-        raw = int.from_bytes(value, byteorder='big', signed=True)
+        with self.i2cbus.transaction():
+            self.init()
+            self.i2cbus.sleep(0.1)
+            self.i2cbus.read_into(self.dev_addr, self.value_buf, self.REG_VALUE)
+        raw = int.from_bytes(self.value_buf, byteorder='big', signed=True)
         if self.pga == self.REG_CONFIG_FSR_0256:
             mvolt = raw * 7.8125 / 1000
         elif self.pga == self.REG_CONFIG_FSR_2048:
@@ -20,7 +20,7 @@ class APDS9250:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
 
     def ping(self):
         try:
@@ -35,13 +35,14 @@ class APDS9250:
 
     def get_value(self):
         # Resolution = 20bit/400ms, Rate = 1000ms
-        self.i2cbus.write(self.dev_addr, [ 0x04, 0x05 ])
-        # Gain = 1
-        self.i2cbus.write(self.dev_addr, [ 0x05, 0x01 ])
-        # Sensor = active 
-        self.i2cbus.write(self.dev_addr, [ 0x00, 0x02 ])
-
-        data = self.i2cbus.read(self.DEV_ADDR, 6, 0x0A)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, [ 0x04, 0x05 ])
+            # Gain = 1
+            self.i2cbus.write(self.dev_addr, [ 0x05, 0x01 ])
+            # Sensor = active
+            self.i2cbus.write(self.dev_addr, [ 0x00, 0x02 ])
+
+            data = self.i2cbus.read(self.DEV_ADDR, 6, 0x0A)
 
         ir = struct.unpack('<I', data[0:3] + b'\x00')[0]
         als = struct.unpack('<I',data[3:6] + b'\x00')[0]
@@ -16,29 +16,54 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import i2cbus
+import sensor.init_state
 
 class CCS811:
     NAME                = 'CCS811'
     DEV_ADDR		= 0x5A # 7bit
+    MEAS_MODE           = 0x10 # Drive mode 1 (1 秒毎に計測)
+    INIT_WAIT           = 1.1  # 計測を開始してから値が出るまでの時間 [sec]
     
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.is_init = False
+        self.init_state = sensor.init_state.InitState(self.NAME, bus, dev_addr)
 
     def init(self):
-        data = self.i2cbus.read(self.dev_addr, 1, 0x00)
-        data = int.from_bytes(data, byteorder='big')
+        state = self.load_state()
+        if state is None:
+            with self.i2cbus.transaction():
+                data = self.i2cbus.read(self.dev_addr, 1, 0x00)
+                data = int.from_bytes(data, byteorder='big')
 
-        if (data & 0x08) == 0:
-            self.i2cbus.write(self.dev_addr, [0xF4])
-            self.i2cbus.write(self.dev_addr, [0x01, 0x10])
+                if (data & 0x08) == 0:
+                    self.i2cbus.write(self.dev_addr, [0xF4])
+                    self.i2cbus.write(self.dev_addr, [0x01, self.MEAS_MODE])
 
-        time.sleep(1.1)
+            state = self.init_state.save([self.MEAS_MODE])
+
+        self.init_state.wait(state, self.INIT_WAIT)
 
         self.is_init = True
 
+    # 以前のプロセスで計測を開始済みで，チップもアプリケーションモードで
+    # 同じ計測モードになっていれば，初期化状態を返します．
+    def load_state(self):
+        state = self.init_state.load()
+        if (state is None) or (state['config'] != [self.MEAS_MODE]):
+            return None
+
+        with self.i2cbus.transaction():
+            status = self.i2cbus.read(self.dev_addr, 1, 0x00)[0]
+            meas_mode = self.i2cbus.read(self.dev_addr, 1, 0x01)[0]
+
+        if ((status & 0x80) == 0) or (meas_mode != self.MEAS_MODE):
+            return None
+
+        return state
+
     def ping(self):
         try:
             data = self.i2cbus.read(self.dev_addr, 1, 0x20)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# センサを自動検出するライブラリです．
+#
+# 候補のドライバを 1 つずつ ping() すると，存在しないセンサのリトライ
+# (K30 だと 1 回あたり 1 秒以上) に時間がかかるので，まずバス毎に
+# i2cdetect と同じ要領で 1 回だけスキャンし，応答したアドレスに対応する
+# ドライバだけ ping() (チップ ID の確認) を行います．
+#
+# detect_cached() を使うと，検出結果を /dev/shm にキャッシュして，
+# 次回以降はバスにアクセスせずに再利用します．キャッシュは CACHE_TTL が
+# 経過するか，invalidate_cache() で読み出し失敗が通知されると作り直します．
+#
+# 候補には sensor.registry.Candidate も使えます．この場合，ドライバは
+# 存在が確認できたものだけ作るので，不要なモジュールは import しません．
+
+import os
+import time
+import json
+
+if __name__ == '__main__':
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+RETRY           = 3     # ping() のリトライ回数
+RETRY_WAIT      = 0.1   # ping() のリトライ間隔 [sec]
+RESCAN_WAIT     = 0.05  # スキャンで見つからなかったアドレスを再確認するまでの時間 [sec]
+CACHE_TTL       = 10*60 # 検出結果のキャッシュの有効期間 [sec]
+
+# I2C のドライバなら (I2CBus, デバイスアドレス) を返します．
+def i2c_addr(dev):
+    if hasattr(dev, 'i2cbus') and hasattr(dev, 'dev_addr'):
+        return (dev.i2cbus, dev.dev_addr)
+    else:
+        return None
+
+# 候補がドライバを作る前のもの (sensor.registry.Candidate) ならドライバを作ります．
+def resolve(dev):
+    if hasattr(dev, 'create_driver'):
+        return dev.create_driver()
+    else:
+        return dev
+
+def ping(dev, retry=RETRY):
+    for i in range(retry):
+        if dev.ping():
+            return True
+        time.sleep(RETRY_WAIT)
+    return False
+
+# バス毎に 1 回スキャンして，応答したアドレスの set を返します．
+def scan_bus(candidate_list):
+    bus_map = {}
+    for dev in candidate_list:
+        addr = i2c_addr(dev)
+        if addr is None:
+            continue
+        (i2c, dev_addr) = addr
+        bus_map.setdefault(i2c, set()).add(dev_addr)
+
+    ack_map = {}
+    for (i2c, addr_set) in bus_map.items():
+        ack_map[i2c] = set(i2c.scan())
+
+    # NOTE: 処理中のデバイス (K30 等) は一時的に応答しないことがあるので，
+    # 見つからなかった候補のアドレスだけもう一度確認する
+    miss_map = {
+        i2c: sorted(addr_set - ack_map[i2c])
+        for (i2c, addr_set) in bus_map.items()
+        if len(addr_set - ack_map[i2c]) != 0
+    }
+    if len(miss_map) != 0:
+        time.sleep(RESCAN_WAIT)
+        for (i2c, addr_list) in miss_map.items():
+            ack_map[i2c].update(i2c.scan(addr_list))
+
+    return ack_map
+
+# 候補のドライバのうち，存在するものを候補の順番のまま返します．
+def detect(candidate_list, retry=RETRY):
+    ack_map = scan_bus(candidate_list)
+
+    sensor_list = []
+    for dev in candidate_list:
+        addr = i2c_addr(dev)
+        if addr is not None:
+            (i2c, dev_addr) = addr
+            if dev_addr not in ack_map[i2c]:
+                continue
+        try:
+            dev = resolve(dev)
+        except Exception:
+            # NOTE: ドライバが必要とするモジュールが無い場合等は，存在しないものとする
+            continue
+        # NOTE: 同じアドレスのチップ (HDC1050 と INA226 等) は ping() で区別する
+        if ping(dev, retry):
+            sensor_list.append(dev)
+
+    return sensor_list
+
+# キャッシュの中でドライバを識別するためのキーを返します．
+def sensor_key(dev):
+    addr = i2c_addr(dev)
+    if addr is None:
+        return dev.NAME
+    else:
+        (i2c, dev_addr) = addr
+        return '%s:%d:0x%02X' % (dev.NAME, i2c.bus, dev_addr)
+
+def load_cache(path, key_list, ttl=CACHE_TTL):
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+
+        # NOTE: 候補のリストが変わった場合 (スクリプトの更新等) は使わない
+        if cache['candidate'] != key_list:
+            return None
+        if (time.time() - cache['time']) > ttl:
+            return None
+
+        return set(cache['sensor'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def save_cache(path, key_list, sensor_list):
+    cache = {
+        'time': time.time(),
+        'candidate': key_list,
+        'sensor': [sensor_key(dev) for dev in sensor_list],
+    }
+
+    # NOTE: 他のプロセスが書きかけのファイルを読まないように，rename で置き換える
+    tmp_path = '%s.%d' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+# センサから読み出せなかった場合に呼び出して，次回は検出からやり直させます．
+def invalidate_cache(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+# detect() の結果をキャッシュします．キャッシュが有効な間はバスにアクセスしません．
+def detect_cached(candidate_list, cache_path, retry=RETRY, ttl=CACHE_TTL):
+    key_list = [sensor_key(dev) for dev in candidate_list]
+
+    key_set = load_cache(cache_path, key_list, ttl)
+    if key_set is not None:
+        return [
+            resolve(dev) for (dev, key) in zip(candidate_list, key_list) if key in key_set
+        ]
+
+    sensor_list = detect(candidate_list, retry)
+    save_cache(cache_path, key_list, sensor_list)
+
+    return sensor_list
+
+if __name__ == '__main__':
+    # TEST Code
+    import pprint
+    import i2cbus
+    I2C_BUS = 0x1 # I2C のバス番号 (Raspberry Pi は 0x1)
+
+    pprint.pprint(['0x%02X' % dev_addr for dev_addr in i2cbus.get_bus(I2C_BUS).scan()])
@@ -7,7 +7,6 @@ import time
 import struct
 import sys
 import traceback
-import pprint
 
 if __name__ == '__main__':
     import os
@@ -20,11 +19,13 @@ class EZO_DO:
     NAME                = 'EZO-DO'
 
     DEV_ADDR		= 0x68 # 7bit
+    PROC_TIME           = 1 # コマンドの処理時間 [sec]
     
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
+        self.ready_at = None
 
     def ping(self):
         try:
@@ -34,18 +35,37 @@ class EZO_DO:
         except:
             return False
 
-    def get_value(self):
-        value = self.exec_command('R')
+    # 計測を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
+        self.send_command('R')
+
+    def read_result(self):
+        value = self.read_response()
 
         return round(float(value[1:].decode().rstrip('\x00')), 3)
 
+    def get_value(self):
+        with self.i2cbus.transaction():
+            self.start_measurement()
+            self.i2cbus.sleep(max(self.ready_at - time.monotonic(), 0))
+
+            return self.read_result()
+
     def exec_command(self, cmd):
+        with self.i2cbus.transaction():
+            self.send_command(cmd)
+            self.i2cbus.sleep(max(self.ready_at - time.monotonic(), 0))
+
+            return self.read_response()
+
+    # コマンドを送信します．ready_at 以降に read_response() で応答を読み出せます．
+    def send_command(self, cmd):
         command = self.__compose_command(cmd.encode())
 
         self.i2cbus.write(self.dev_addr, command)
+        self.ready_at = time.monotonic() + self.PROC_TIME
 
-        time.sleep(1)
-
+    def read_response(self):
         return self.i2cbus.read(self.DEV_ADDR, 10)
     
     def __compose_command(self, text):
@@ -53,8 +73,9 @@ class EZO_DO:
         return command
     
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return { 'do': value }
     
 if __name__ == '__main__':
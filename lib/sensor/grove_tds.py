@@ -13,14 +13,16 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import sensor.ads1015
-import pprint
 
 class GROVE_TDS:
     NAME                = 'GROVE-TDS'
     DEV_ADDR            = 0x4A # 7bit
 
     def __init__(self, bus, dev_addr=DEV_ADDR):
+        self.bus = bus
+        self.dev_addr = dev_addr
         self.adc = sensor.ads1015.ADS1015(bus, dev_addr)
+        self.i2cbus = self.adc.i2cbus
         self.adc.set_mux(self.adc.REG_CONFIG_MUX_0G)
         self.adc.set_pga(self.adc.REG_CONFIG_FSR_2048)
 
@@ -30,9 +32,12 @@ class GROVE_TDS:
     def get_value(self, temp=25.0):
         volt = self.adc.get_value()[0] / 1000.0
         tds = (133.42*volt*volt*volt - 255.86*volt*volt + 857.39*volt)*0.5
-        tds /= 1 + 0.018 * (temp-25) # 0.018 は実測データから算出
 
-        return [ round(tds, 3) ]
+        return [ round(self.compensate(tds, temp), 3) ]
+
+    # 水温で補正します．25℃ として計測した値を後から補正する場合にも使います．
+    def compensate(self, tds, temp):
+        return tds / (1 + 0.018 * (temp-25)) # 0.018 は実測データから算出
 
     def get_value_map(self, temp=25.0):
         value = self.get_value(temp)
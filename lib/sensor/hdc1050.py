@@ -25,26 +25,32 @@ class HDC1050:
     REG_CONF		= 0x02
     REG_ID		= 0xFF
 
+    CONV_TIME           = 0.05 # 温度と湿度の変換時間 [sec]
+
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
+        self.ready_at = None
 
     def ping(self):
         dev_id = 0
         try:
-            self.i2cbus.write(self.DEV_ADDR, [self.REG_ID])
-            value = self.i2cbus.read(self.DEV_ADDR, 2, self.REG_ID)
-            dev_id = struct.unpack('>H', bytes(value[0:2]))[0]
+            with self.i2cbus.transaction():
+                self.i2cbus.write(self.DEV_ADDR, [self.REG_ID])
+                value = self.i2cbus.read(self.DEV_ADDR, 2, self.REG_ID)
+                dev_id = struct.unpack('>H', bytes(value[0:2]))[0]
         except:
             pass
 
         return dev_id == 0x1050
     
-    def get_value(self):
+    # 変換を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
         self.i2cbus.write(self.dev_addr, [self.REG_TEMP])
-        time.sleep(0.05)
-    
+        self.ready_at = time.monotonic() + self.CONV_TIME
+
+    def read_result(self):
         value = self.i2cbus.read(self.DEV_ADDR, 4)
 
         temp = struct.unpack('>H', bytes(value[0:2]))[0]
@@ -55,9 +61,16 @@ class HDC1050:
 
         return [ temp, humi ]
 
+    def get_value(self):
+        with self.i2cbus.transaction():
+            self.start_measurement()
+            self.i2cbus.sleep(max(self.ready_at - time.monotonic(), 0))
+            return self.read_result()
+
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return { 'temp': value[0], 'humi': value[1] }
 
 
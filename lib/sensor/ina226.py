@@ -16,28 +16,62 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import i2cbus
+import sensor.init_state
 
 class INA226:
     NAME                = 'INA226'
     DEV_ADDR		= 0x40 # 7bit
+    INIT_WAIT           = 1.1 # 設定してから値が安定するまでの時間 [sec]
+    # NOTE: 設定レジスタの bit 14-12 は予約済みで，書き込んだ値に関係なく
+    # 100b が読めるので比較しない
+    REG_MASK            = { 0x00: 0x8FFF }
     
     def __init__(self, bus, dev_addr=DEV_ADDR, prefix=''):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.prefix = prefix
         self.is_init = False
+        self.init_state = sensor.init_state.InitState(self.NAME, bus, dev_addr)
 
     def init(self):
-        # shunt register is 25mohm, and Currenst_LSB is 0.1mA/bit
-        self.i2cbus.write(self.dev_addr, [0x05, 0x08, 0x00])
-
-        # 128 average, 8.2ms, continuous
-        val = (0x04 << 9) | (0x07 << 6) | (0x07 << 3) | 0x07
-        self.i2cbus.write(self.dev_addr, [0x00, (val >> 8) & 0xFF, (val >> 0) & 0xFF])
-        
+        state = self.load_state()
+        if state is None:
+            state = self.configure()
         self.is_init = True
-        time.sleep(1.1)
+        self.init_state.wait(state, self.INIT_WAIT)
+
+    # 書き込む設定 [ [レジスタ, 値], ... ]
+    def config(self):
+        return [
+            # shunt register is 25mohm, and Currenst_LSB is 0.1mA/bit
+            [0x05, 0x0800],
+            # 128 average, 8.2ms, continuous
+            [0x00, (0x04 << 9) | (0x07 << 6) | (0x07 << 3) | 0x07],
+        ]
+
+    # 設定を書き込んで，保存した初期化状態を返します．
+    def configure(self):
+        config = self.config()
+        for (reg, val) in config:
+            self.i2cbus.write(self.dev_addr, [reg, (val >> 8) & 0xFF, (val >> 0) & 0xFF])
+
+        return self.init_state.save(config)
+
+    # 以前のプロセスで設定済みで，レジスタの値も一致していれば初期化状態を返します．
+    def load_state(self):
+        state = self.init_state.load()
+        if (state is None) or (state['config'] != self.config()):
+            return None
+
+        with self.i2cbus.transaction():
+            for (reg, val) in state['config']:
+                data = self.i2cbus.read(self.dev_addr, 2, reg)
+                mask = self.REG_MASK.get(reg, 0xFFFF)
+                if ((data[0] << 8 | data[1]) & mask) != (val & mask):
+                    return None
+
+        return state
 
     def ping(self):
         try:
@@ -51,23 +85,35 @@ class INA226:
         if not self.is_init:
             self.init()
 
-        data = self.i2cbus.read(self.dev_addr, 2, 0x02)
-        volt = (data[0] << 8 | data[1]) * 1.25 / 1000.0
+        # NOTE: 電圧・電流・電力のレジスタを 1 回のトランザクションで読み出す
+        return self.i2cbus.snapshot([self])[0]
+
+    # I2CBus.snapshot() で読み出すレジスタ
+    def snapshot_req(self):
+        return [
+            (self.dev_addr, 0x02, 2),
+            (self.dev_addr, 0x04, 2),
+            (self.dev_addr, 0x03, 2),
+        ]
+
+    def parse_snapshot(self, data_list):
+        (data_volt, data_curr, data_power) = data_list
 
-        data = self.i2cbus.read(self.dev_addr, 2, 0x04)
-        if ((data[0] >> 7) == 1):
-            curr = -1 * (0x10000 - (data[0] << 8 | data[1])) * 0.1 / 1000.0
+        volt = (data_volt[0] << 8 | data_volt[1]) * 1.25 / 1000.0
+
+        if ((data_curr[0] >> 7) == 1):
+            curr = -1 * (0x10000 - (data_curr[0] << 8 | data_curr[1])) * 0.1 / 1000.0
         else:
-            curr = (data[0] << 8 | data[1]) / 1000.0
+            curr = (data_curr[0] << 8 | data_curr[1]) / 1000.0
 
-        data = self.i2cbus.read(self.dev_addr, 2, 0x03)
-        power = (data[0] << 8 | data[1]) * 0.1 * 25 / 1000
+        power = (data_power[0] << 8 | data_power[1]) * 0.1 * 25 / 1000
 
         return [ round(volt, 3), round(curr, 3), round(power, 3) ]
 
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return {
             (self.prefix + 'voltage'): value[0],
             (self.prefix + 'current'): value[1],
@@ -75,6 +121,49 @@ class INA226:
         }
 
 
+# 同じバスにある複数の INA226 を，1 回のトランザクションで同時に読み出します．
+# (パネル・充電・バッテリーの値を同じタイミングで比較したい場合用)
+class INA226Group:
+    NAME                = 'INA226'
+
+    def __init__(self, member_list):
+        if len(set(member.bus for member in member_list)) != 1:
+            raise ValueError('All INA226 in a group must be on the same bus')
+
+        self.member_list = member_list
+        self.bus = member_list[0].bus
+        self.i2cbus = member_list[0].i2cbus
+
+    def init(self):
+        # NOTE: 設定はまとめて書き込み，待ち時間は 1 回で済ませる
+        state_list = []
+        for member in self.member_list:
+            state = member.load_state()
+            if state is None:
+                state = member.configure()
+            member.is_init = True
+            state_list.append(state)
+
+        for (member, state) in zip(self.member_list, state_list):
+            member.init_state.wait(state, member.INIT_WAIT)
+
+    def ping(self):
+        return all(member.ping() for member in self.member_list)
+
+    def get_value(self):
+        if not all(member.is_init for member in self.member_list):
+            self.init()
+
+        return self.i2cbus.snapshot(self.member_list)
+
+    def get_value_map(self):
+        value_map = {}
+        for (member, value) in zip(self.member_list, self.get_value()):
+            value_map.update(member.to_value_map(value))
+
+        return value_map
+
+
 if __name__ == '__main__':
     # TEST Code
     import pprint
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# センサの初期化状態を /dev/shm に保存するライブラリです．
+#
+# 1 回ずつ起動するスクリプトでは，ドライバの is_init がプロセス毎に
+# リセットされるので，INA226 や CCS811 は毎回設定し直して 1 秒以上待つ
+# ことになります．設定した内容と時刻をセンサ毎のファイルに保存しておき，
+# 次のプロセスではチップのレジスタが保存した設定と一致していれば，
+# 初期化を省略して値の読み出しだけを行います．
+#
+# /dev/shm は再起動で消えるので，その場合は初期化し直します．
+# センサだけ電源が切れた場合は，各ドライバのレジスタの確認で検出します．
+
+import os
+import time
+import json
+
+import shm
+
+STATE_DIR = os.path.join(shm.get_dir(), 'sensor_init')
+
+class InitState:
+    def __init__(self, name, bus, dev_addr, state_dir=STATE_DIR):
+        self.path = os.path.join(state_dir, '%s_%d_0x%02X.json' % (name, bus, dev_addr))
+
+    # 保存された状態 { 'config': 設定, 'init_at': 初期化した時刻 } を返します．
+    # 無い場合は None です．
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            if ('config' not in state) or ('init_at' not in state):
+                return None
+            return state
+        except (OSError, ValueError, TypeError):
+            return None
+
+    # 初期化した設定を保存して，保存した状態を返します．
+    # NOTE: 設定は JSON にするので，比較する側もリストで表しておく
+    def save(self, config):
+        # NOTE: time.monotonic() はプロセスをまたいでも比較できる
+        state = {
+            'config': config,
+            'init_at': time.monotonic(),
+        }
+
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+        return state
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    # 初期化してから wait 秒経つまで待ちます．既に経っていればすぐに戻ります．
+    def wait(self, state, wait):
+        time.sleep(max(state['init_at'] + wait - time.monotonic(), 0))
@@ -37,7 +37,7 @@ class K30:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
 
     def ping(self):
         for i in range(self.RETRY_COUNT):
@@ -51,13 +51,14 @@ class K30:
             command = [ self.READ_RAM|0x1, 0x00, self.RAM_FIRM ]
             command = self.__compose_command(command)
 
-            self.i2cbus.write(self.dev_addr, command)
+            with self.i2cbus.transaction():
+                self.i2cbus.write(self.dev_addr, command)
 
-            time.sleep(0.15)
+                self.i2cbus.sleep(0.15)
 
-            value = self.i2cbus.read(self.DEV_ADDR, 3)
+                value = self.i2cbus.read(self.DEV_ADDR, 3)
 
-            time.sleep(0.15)
+                self.i2cbus.sleep(0.15)
 
             return True
         except:
@@ -80,13 +81,14 @@ class K30:
         command = [ self.READ_RAM|0x2, 0x00, self.RAM_CO2 ]
         command = self.__compose_command(command)
 
-        self.i2cbus.write(self.dev_addr, command)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, command)
 
-        time.sleep(0.15)
+            self.i2cbus.sleep(0.15)
 
-        value = self.i2cbus.read(self.DEV_ADDR, 4)
+            value = self.i2cbus.read(self.DEV_ADDR, 4)
 
-        time.sleep(0.15)
+            self.i2cbus.sleep(0.15)
 
         if (value[0] & 0x1) != 0x1:
             raise Exception('command incomplete')
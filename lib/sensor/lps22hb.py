@@ -39,11 +39,14 @@ class LPS22HB:
     LPF_20              = 0x3 << 2
 
     MODE_BYPASS		= 0x0 << 5
+
+    CONV_TIME           = 0.5 # 変換時間 [sec]
     
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
+        self.ready_at = None
 
     def ping(self):
         dev_id = None
@@ -61,18 +64,28 @@ class LPS22HB:
         # 50Hz で変換を行い 20 サンプルの平均を取る
         self.i2cbus.write(self.dev_addr, [self.REG_CTRL1, self.RATE_50HZ | self.LPF_20])
 
-    def get_value(self):
-        self.enable()
-        time.sleep(0.5)
-        
+    # 変換を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
+        with self.i2cbus.transaction():
+            self.enable()
+        self.ready_at = time.monotonic() + self.CONV_TIME
+
+    def read_result(self):
         value = self.i2cbus.read(self.DEV_ADDR, 3, self.REG_PRESS)
         press = struct.unpack('<I', value + b'\0')[0] / 4096
 
         return [ int(press) ]
 
+    def get_value(self):
+        with self.i2cbus.transaction():
+            self.start_measurement()
+            self.i2cbus.sleep(max(self.ready_at - time.monotonic(), 0))
+            return self.read_result()
+
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return { 'press': value[0] }
     
 if __name__ == '__main__':
@@ -18,6 +18,8 @@ if __name__ == "__main__":
 class MAX31856:
     NAME = "MAX31856"
 
+    CONV_TIME = 0.8  # 変換時間 [sec]
+
     def __init__(self):
         spi = spidev.SpiDev()
         spi.open(0, 0)
@@ -25,6 +27,7 @@ class MAX31856:
         spi.mode = 1
 
         self.spi = spi
+        self.ready_at = None
         self.init()
 
     def init(self, avg_sel="ave16", tc_type="T", noise_filter="60Hz"):
@@ -46,7 +49,8 @@ class MAX31856:
         except:
             return False
 
-    def get_value(self):
+    # 変換を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
         avg_sel_map = {
             "ave1": 0b000,
             "ave2": 0b001,
@@ -78,15 +82,23 @@ class MAX31856:
             0x00, (oneshot << 6) | (noise_filter_map[self.noise_filter] << 0)
         )
 
-        time.sleep(0.8)
+        self.ready_at = time.monotonic() + self.CONV_TIME
 
+    def read_result(self):
         return (
             struct.unpack(">i", bytes(self.reg_read(0x0C, 3) + [0x00]))[0] >> 8
         ) / 4096.0
 
+    def get_value(self):
+        self.start_measurement()
+        time.sleep(max(self.ready_at - time.monotonic(), 0))
+
+        return self.read_result()
+
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return {"temp": value}
 
 
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# センサのドライバを遅延して import するためのレジストリです．
+#
+# センシング用スクリプトは起動の度に全ての候補のドライバを import すると，
+# 実際には繋がっていないセンサの分まで時間がかかります (SGP40 は VOC の
+# アルゴリズムも読み込む)．Candidate は名前とアドレスだけを持つ候補で，
+# sensor.detect でスキャンに応答したものだけドライバを import して作ります．
+#
+#   candidate_list = [
+#       sensor.registry.Candidate('K30', I2C_ARM_BUS),
+#       sensor.registry.Candidate('SHT-35', I2C_VC_BUS, 0x44),
+#   ]
+#   sensor_list = sensor.detect.detect_cached(candidate_list, CACHE_PATH)
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
+
+import i2cbus
+
+# NAME: (モジュール名, クラス名, デフォルトの I2C デバイスアドレス)
+# NOTE: アドレスはスキャンに使うので，ドライバの DEV_ADDR と揃えておく．
+# I2C 以外のドライバは None にする．
+DRIVER_MAP = {
+    'ADS1015':      ('sensor.ads1015',      'ADS1015',      0x48),
+    'APDS9250':     ('sensor.apds9250',     'APDS9250',     0x52),
+    'CCS811':       ('sensor.ccs811',       'CCS811',       0x5A),
+    'EZO-DO':       ('sensor.ezo_do',       'EZO_DO',       0x68),
+    'EZO-pH':       ('sensor.ezo_ph',       'EZO_PH',       0x64),
+    'EZO-RTD':      ('sensor.ezo_rtd',      'EZO_RTD',      0x66),
+    'FD-Q10C':      ('sensor.fd_q10c',      'FD_Q10C',      None),
+    'GROVE-TDS':    ('sensor.grove_tds',    'GROVE_TDS',    0x4A),
+    'HDC1050':      ('sensor.hdc1050',      'HDC1050',      0x40),
+    'INA226':       ('sensor.ina226',       'INA226',       0x40),
+    'K30':          ('sensor.k30',          'K30',          0x68),
+    'LPS22HB':      ('sensor.lps22hb',      'LPS22HB',      0x5C),
+    'LPS25H':       ('sensor.lps25h',       'LPS25H',       0x5C),
+    'MAX31856':     ('sensor.max31856',     'MAX31856',     None),
+    'SCD4x':        ('sensor.scd4x',        'SCD4x',        0x62),
+    'SGP40':        ('sensor.sgp40',        'SGP40',        0x59),
+    'SHT-21':       ('sensor.sht21',        'SHT21',        0x40),
+    'SHT-31':       ('sensor.sht31',        'SHT31',        0x44),
+    'SHT-35':       ('sensor.sht35',        'SHT35',        0x44),
+    'SPS30':        ('sensor.sps30',        'SPS30',        0x69),
+    'TSL2561':      ('sensor.tsl2561',      'TSL2561',      0x39),
+    'VEML6075':     ('sensor.veml6075',     'VEML6075',     0x10),
+    'VEML7700':     ('sensor.veml7700',     'VEML7700',     0x10),
+}
+
+# ドライバのクラスを返します．モジュールはここで初めて import されます．
+def get_driver(name):
+    (module_name, class_name, dev_addr) = DRIVER_MAP[name]
+    # NOTE: importlib.import_module() だと python -X importtime に出てこないので，
+    # 起動時間を測れるように __import__() を使う
+    module = __import__(module_name, fromlist=[class_name])
+    return getattr(module, class_name)
+
+# ドライバを作る前の候補です．引数はドライバのコンストラクタと同じで，
+# I2C のドライバなら最初の 2 つがバス番号とデバイスアドレスです．
+class Candidate:
+    def __init__(self, name, *args, **kwargs):
+        if name not in DRIVER_MAP:
+            raise ValueError('Unknown sensor: %s' % name)
+
+        self.NAME = name
+        self.args = args
+        self.kwargs = kwargs
+        self.driver = None
+
+        dev_addr = DRIVER_MAP[name][2]
+        if dev_addr is not None:
+            self.bus = args[0]
+            if len(args) > 1:
+                dev_addr = args[1]
+            self.dev_addr = kwargs.get('dev_addr', dev_addr)
+            self.i2cbus = i2cbus.get_bus(self.bus)
+
+    # ドライバを作って返します．2 回目以降は同じドライバ (初期化状態) を返します．
+    def create_driver(self):
+        if self.driver is None:
+            self.driver = get_driver(self.NAME)(*self.args, **self.kwargs)
+        return self.driver
+
+if __name__ == '__main__':
+    # TEST Code
+    import pprint
+
+    pprint.pprint({name: get_driver(name).DEV_ADDR for name in DRIVER_MAP
+                   if DRIVER_MAP[name][2] is not None})
@@ -9,7 +9,6 @@
 
 import time
 import struct
-import pprint
 
 if __name__ == '__main__':
     import os
@@ -17,16 +16,20 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import i2cbus
+import sensor.init_state
 
 class SCD4x:
     NAME                = 'SCD4x'
     DEV_ADDR		= 0x62 # 7bit
+    PERIOD              = 5.0 # periodic measurement の計測間隔 [sec]
+    POLL_WAIT           = 0.5
     
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.is_init = False
+        self.init_state = sensor.init_state.InitState(self.NAME, bus, dev_addr)
 
     def ping(self):
         try:
@@ -38,11 +41,12 @@ class SCD4x:
 
     def __reset(self):
         # sto_periodic_measurement
-        self.i2cbus.write(self.dev_addr, [0x3f, 0x86])
-        time.sleep(0.5)
-        # reinit
-        self.i2cbus.write(self.dev_addr, [0x36, 0x46])
-        time.sleep(0.02)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, [0x3f, 0x86])
+            self.i2cbus.sleep(0.5)
+            # reinit
+            self.i2cbus.write(self.dev_addr, [0x36, 0x46])
+            self.i2cbus.sleep(0.02)
         
     def __crc(self, msg):
         poly = 0x31
@@ -69,34 +73,49 @@ class SCD4x:
 
     def __get_data_ready(self):
         # get_data_ready_status
-        self.i2cbus.write(self.dev_addr, [0xE4, 0xB8])
-        data = self.i2cbus.read(self.dev_addr, 3)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, [0xE4, 0xB8])
+            data = self.i2cbus.read(self.dev_addr, 3)
         resp = self.__decode_response(data)
 
         return (int.from_bytes(resp[0:2], byteorder='big') & 0x7F) != 0
 
-    def __start_measurement(self):
-        # NOTE: まず待ってみて，それでもデータが準備できないようだったら
-        # 計測が始まっていないと判断する
-        for i in range(10):
+    def __wait_data_ready(self, timeout):
+        for i in range(int(timeout / self.POLL_WAIT)):
             if self.__get_data_ready():
+                return True
+            time.sleep(self.POLL_WAIT)
+        return False
+
+    def __start_measurement(self):
+        state = self.init_state.load()
+        if state is not None:
+            # NOTE: 以前のプロセスで計測を開始済みなので，開始直後なら最初の
+            # データが出るまで待ってから確認する．1 周期待っても準備できない
+            # 場合は，電源が切れる等で計測が止まっている
+            self.init_state.wait(state, self.PERIOD)
+            if self.__wait_data_ready(self.PERIOD + self.POLL_WAIT * 2):
+                return
+        else:
+            # NOTE: まず待ってみて，それでもデータが準備できないようだったら
+            # 計測が始まっていないと判断する
+            if self.__wait_data_ready(self.PERIOD):
+                self.init_state.save([0x21B1])
                 return
-            time.sleep(0.5)
 
         # start_periodic_measurement
         self.i2cbus.write(self.dev_addr, [0x21, 0xB1])
+        self.init_state.save([0x21B1])
 
-        for i in range(10):
-            if self.__get_data_ready():
-                return
-            time.sleep(0.5)
+        self.__wait_data_ready(self.PERIOD + self.POLL_WAIT * 2)
 
     def get_value(self):
         self.__start_measurement()
 
         # read_measurement
-        self.i2cbus.write(self.dev_addr, [0xEC, 0x05])
-        data = self.i2cbus.read(self.dev_addr, 9)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, [0xEC, 0x05])
+            data = self.i2cbus.read(self.dev_addr, 9)
         resp = self.__decode_response(data)
 
 
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 複数のセンサの計測をまとめて行うライブラリです．
+#
+# start_measurement() / ready_at / read_result() に対応したドライバは，
+# 先に全ての変換を開始しておき，変換が終わった順に結果を読み出します．
+# 変換を待っている間には，対応していないドライバの get_value_map() を
+# 実行するので，全体の時間は各センサの変換時間の合計ではなく，
+# おおむね一番遅いセンサの変換時間になります．
+#
+# 別々のバス (I2C_ARM_BUS と I2C_VC_BUS 等) はコントローラも別なので，
+# バス毎にスレッドを分けて並行して計測し，遅いバスが他を待たせないようにします．
+#
+# Scheduler を使うと，センサ毎に計測周期と最小間隔を指定できます．
+# 周期が来ていないセンサは計測せず，前回の値を再利用します．
+# 状態は /dev/shm に保存するので，1 回ずつ起動する場合も周期が保たれます．
+#
+# cycle_budget を指定すると，1 回の計測全体の締め切りを設けます．
+# ドライバの呼び出しはセンサ毎の持ち時間 (budget_map) 内に終わらなければ
+# 打ち切り，そのセンサは前回の値を使って stale_list に入れます．
+# 打ち切った呼び出しは裏で動き続けるので，終わるまでそのセンサは使いません．
+
+import os
+import math
+import time
+import json
+import logging
+import threading
+import functools
+
+import sensor.detect
+
+logger = logging.getLogger(__name__)
+
+def is_two_phase(dev):
+    return hasattr(dev, 'start_measurement') and hasattr(dev, 'read_result')
+
+def read_value_map(dev, two_phase):
+    if two_phase:
+        return dev.to_value_map(dev.read_result())
+    else:
+        return dev.get_value_map()
+
+def call_direct(dev, func):
+    return func()
+
+# ドライバが使う I2C のバス番号を返します．I2C 以外なら None です．
+def bus_of(dev):
+    if hasattr(dev, 'i2cbus'):
+        return dev.i2cbus.bus
+    else:
+        return None
+
+# センサをバス毎に分けます．順番は sensor_list の順のままです．
+def group_by_bus(sensor_list):
+    group_map = {}
+    for dev in sensor_list:
+        group_map.setdefault(bus_of(dev), []).append(dev)
+    return group_map
+
+# センサを計測して，{ ドライバ: get_value_map() と同じ形式の辞書 } を返します．
+# 失敗したドライバは含まれないので，必要なら呼び出し側でリトライします．
+#   call: ドライバの呼び出し方 (Scheduler.call 等)
+#   deadline: time.monotonic() での締め切り．過ぎたら残りのセンサは読まない
+def measure(sensor_list, call=call_direct, deadline=None):
+    group_map = group_by_bus(sensor_list)
+    if len(group_map) <= 1:
+        return measure_bus(sensor_list, call, deadline)
+
+    result_map = {}
+    def run(group):
+        result_map.update(measure_bus(group, call, deadline))
+
+    thread_list = [
+        threading.Thread(target=run, args=(group,), name='bus-%s' % bus, daemon=True)
+        for (bus, group) in group_map.items()
+    ]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+    return result_map
+
+# 同じバスのセンサを計測します．戻り値は measure() と同じです．
+def measure_bus(sensor_list, call=call_direct, deadline=None):
+    result_map = {}
+    pending_list = []
+    sync_list = []
+
+    for dev in sensor_list:
+        if not is_two_phase(dev):
+            sync_list.append(dev)
+            continue
+        try:
+            call(dev, dev.start_measurement)
+            pending_list.append(dev)
+        except Exception:
+            logger.debug('Failed to start measurement: %s', dev.NAME, exc_info=True)
+
+    pending_list.sort(key=lambda dev: dev.ready_at)
+
+    while (len(pending_list) != 0) or (len(sync_list) != 0):
+        now = time.monotonic()
+        if (deadline is not None) and (now >= deadline):
+            break
+
+        if (len(pending_list) != 0) and (pending_list[0].ready_at <= now):
+            (dev, two_phase) = (pending_list.pop(0), True)
+        elif len(sync_list) != 0:
+            (dev, two_phase) = (sync_list.pop(0), False)
+        else:
+            wait_until = pending_list[0].ready_at
+            if deadline is not None:
+                wait_until = min(wait_until, deadline)
+            time.sleep(max(wait_until - now, 0))
+            continue
+
+        try:
+            result_map[dev] = call(dev, functools.partial(read_value_map, dev, two_phase))
+        except Exception:
+            logger.debug('Failed to read: %s', dev.NAME, exc_info=True)
+
+    return result_map
+
+# センサ毎の計測周期と持ち時間を管理します．
+#   interval_map: { センサの NAME: (計測周期 [sec], 最小間隔 [sec]) }
+#   budget_map: { センサの NAME: 1 回の呼び出しの持ち時間 [sec] }
+#   cycle_budget: 1 回の measure() 全体の持ち時間 [sec] (None なら無制限)
+class Scheduler:
+    # NOTE: 起動間隔のずれで 1 周期分遅れないように，これだけ早くても計測する
+    JITTER = 1.0
+    BUDGET = 5.0 # budget_map に指定の無いセンサの持ち時間 [sec]
+
+    def __init__(self, state_path=None, interval_map={}, budget_map={},
+                 cycle_budget=None):
+        self.state_path = state_path
+        self.interval_map = dict(interval_map)
+        self.budget_map = dict(budget_map)
+        self.cycle_budget = cycle_budget
+        self.deadline = None
+        self.busy_map = {}      # 打ち切った呼び出しを実行中のスレッド
+        self.stale_list = []    # 直前の measure() で時間切れになったセンサ
+        (self.state_map, self.overrun_map) = self.__load()
+
+    def set_interval(self, name, interval, min_spacing=0):
+        self.interval_map[name] = (interval, min_spacing)
+
+    def set_budget(self, name, budget):
+        self.budget_map[name] = budget
+
+    # センサ毎の持ち時間を超えた回数を返します．
+    def get_overrun(self):
+        return dict(self.overrun_map)
+
+    # ドライバの呼び出し func() を持ち時間内で実行します．
+    # 持ち時間を超えた場合や，前回打ち切った呼び出しがまだ終わっていない
+    # 場合は TimeoutError を投げます．
+    def call(self, dev, func):
+        key = sensor.detect.sensor_key(dev)
+
+        busy = self.busy_map.get(key)
+        if busy is not None:
+            if busy.is_alive():
+                raise TimeoutError('%s is still busy' % dev.NAME)
+            del self.busy_map[key]
+
+        budget = self.budget_map.get(dev.NAME, self.BUDGET)
+        if self.deadline is not None:
+            budget = min(budget, self.deadline - time.monotonic())
+        if budget <= 0:
+            raise TimeoutError('No time left for %s' % dev.NAME)
+
+        result = {}
+        def run():
+            try:
+                result['value'] = func()
+            except Exception as e:
+                result['error'] = e
+
+        # NOTE: 固まった呼び出しがプロセスの終了を妨げないように daemon にする
+        thread = threading.Thread(target=run, name=key, daemon=True)
+        thread.start()
+        thread.join(budget)
+
+        if thread.is_alive():
+            self.busy_map[key] = thread
+            self.overrun_map[key] = self.overrun_map.get(key, 0) + 1
+            logger.warning('%s overran its budget (%.1f sec, %d time(s) in total)',
+                           key, budget, self.overrun_map[key])
+            raise TimeoutError('%s overran its budget' % dev.NAME)
+
+        if 'error' in result:
+            raise result['error']
+        return result['value']
+
+    # 持ち時間内で get_value_map() を呼び出します．リトライ用．
+    def get_value_map(self, dev):
+        return self.call(dev, dev.get_value_map)
+
+    def is_due(self, dev, now):
+        state = self.state_map.get(sensor.detect.sensor_key(dev))
+        if state is None:
+            return True
+
+        (interval, min_spacing) = self.interval_map.get(dev.NAME, (0, 0))
+
+        return (now >= (state['next_at'] - self.JITTER)) and \
+            (now >= (state['last_at'] + min_spacing))
+
+    # 周期が来たセンサを計測し，来ていないセンサは前回の値を返します．
+    # 時間切れになったセンサも前回の値を返し，stale_list に入れます．
+    # 戻り値の形式は measure() と同じです．
+    def measure(self, sensor_list):
+        now = time.monotonic()
+        if self.cycle_budget is not None:
+            self.deadline = now + self.cycle_budget
+        due_list = [dev for dev in sensor_list if self.is_due(dev, now)]
+
+        result_map = measure(due_list, self.call, self.deadline)
+
+        self.stale_list = []
+        for dev in sensor_list:
+            key = sensor.detect.sensor_key(dev)
+            if dev in result_map:
+                self.__update(key, dev, now, result_map[dev])
+                continue
+            if (dev in due_list) and not self.is_timeout(dev):
+                # NOTE: 時間切れ以外の失敗は，呼び出し側でリトライさせる
+                continue
+            if dev in due_list:
+                self.stale_list.append(dev)
+            if key in self.state_map:
+                result_map[dev] = self.state_map[key]['value']
+
+        self.__save()
+
+        return result_map
+
+    # 締め切りを過ぎたか，打ち切った呼び出しが終わっていないなら True を返します．
+    def is_timeout(self, dev):
+        if (self.deadline is not None) and (time.monotonic() >= self.deadline):
+            return True
+        busy = self.busy_map.get(sensor.detect.sensor_key(dev))
+        return (busy is not None) and busy.is_alive()
+
+    def __update(self, key, dev, now, value_map):
+        (interval, min_spacing) = self.interval_map.get(dev.NAME, (0, 0))
+
+        # NOTE: 時間軸上の一定間隔 (前回の予定時刻 + 周期) で計測する
+        step = max(interval, min_spacing)
+        state = self.state_map.get(key)
+        if (state is None) or (step <= 0):
+            next_at = now + step
+        else:
+            next_at = state['next_at']
+            if next_at <= now:
+                next_at += (math.floor((now - next_at) / step) + 1) * step
+
+        self.state_map[key] = {
+            'last_at': now,
+            'next_at': next_at,
+            'value': value_map,
+        }
+
+    # NOTE: time.monotonic() はシステム全体で共通 (CLOCK_MONOTONIC) なので，
+    # プロセスをまたいでも比較でき，再起動すると /dev/shm と一緒に消える
+    def __load(self):
+        if self.state_path is None:
+            return ({}, {})
+        try:
+            with open(self.state_path, 'r') as f:
+                data = json.load(f)
+            return (data['state'], data['overrun'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return ({}, {})
+
+    def __save(self):
+        if self.state_path is None:
+            return
+
+        tmp_path = '%s.%d' % (self.state_path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'state': self.state_map, 'overrun': self.overrun_map}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            pass
@@ -13,18 +13,18 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import i2cbus
+import shm
 from dfrobot.DFRobot_SGP40_VOCAlgorithm import DFRobot_VOCAlgorithm
-import pprint
 
 class SGP40:
     NAME                = 'SGP40'
     DEV_ADDR		= 0x59 # 7bit
-    DUMP_FILE           = '/dev/shm/voc_algorithm.dump'
+    DUMP_FILE           = shm.get_path('voc_algorithm.dump')
 
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         try:
             if os.path.exists(self.DUMP_FILE):
                 with open(self.DUMP_FILE, 'rb') as f:
@@ -49,9 +49,10 @@ class SGP40:
 
     def ping(self):
         try:
-            self.i2cbus.write(self.dev_addr, [ 0x36, 0x82 ])
-            time.sleep(0.001)
-            data = self.i2cbus.read(self.DEV_ADDR, 9)
+            with self.i2cbus.transaction():
+                self.i2cbus.write(self.dev_addr, [ 0x36, 0x82 ])
+                self.i2cbus.sleep(0.001)
+                data = self.i2cbus.read(self.DEV_ADDR, 9)
 
             self.decode_data(data)
 
@@ -68,12 +69,13 @@ class SGP40:
         return decoded
 
     def get_value(self):
-        self.i2cbus.write(
-            self.dev_addr,
-            [ 0x26, 0x0F, 0x80, 0x00, 0xA2, 0x66, 0x66, 0x93 ]
-        )
-        time.sleep(0.030)
-        data = self.i2cbus.read(self.DEV_ADDR, 3)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(
+                self.dev_addr,
+                [ 0x26, 0x0F, 0x80, 0x00, 0xA2, 0x66, 0x66, 0x93 ]
+            )
+            self.i2cbus.sleep(0.030)
+            data = self.i2cbus.read(self.DEV_ADDR, 3)
         raw = struct.unpack('>H', self.decode_data(data))[0]
 
         voc_index = self.voc_algo.vocalgorithm_process(raw)
@@ -27,7 +27,7 @@ class SHT21:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
 
     def crc(self, data):
         crc = 0x00
@@ -50,18 +50,20 @@ class SHT21:
             return False
     
     def get_value(self):
-        self.i2cbus.write(self.DEV_ADDR, [self.REG_MEASURE_TEMP])
-        time.sleep(0.1)
-        value = self.i2cbus.read(self.DEV_ADDR, 3)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.DEV_ADDR, [self.REG_MEASURE_TEMP])
+            self.i2cbus.sleep(0.1)
+            value = self.i2cbus.read(self.DEV_ADDR, 3)
 
         if (self.crc(value[0:2]) != value[2]):
             raise IOError("ERROR: CRC unmatch.")
         
         temp = -46.85 + 175.72 * int.from_bytes(value[0:2], byteorder='big') / pow(2, 16)
 
-        self.i2cbus.write(self.DEV_ADDR, [self.REG_MEASURE_HUMI])
-        time.sleep(0.1)
-        value = self.i2cbus.read(self.DEV_ADDR, 3)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.DEV_ADDR, [self.REG_MEASURE_HUMI])
+            self.i2cbus.sleep(0.1)
+            value = self.i2cbus.read(self.DEV_ADDR, 3)
 
         if (self.crc(value[0:2]) != value[2]):
             raise IOError("ERROR: CRC unmatch.")
@@ -23,11 +23,14 @@ class SHT31:
     REG_MEASURE		= [0x24, 0x00]
     REG_STATUS		= [0xF3, 0x2D]
     REG_RESET		= [0x30, 0xA2]
+
+    CONV_TIME           = 0.05 # 変換時間 [sec]
     
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
+        self.ready_at = None
 
     def crc(self, msg):
         poly = 0x31
@@ -47,20 +50,24 @@ class SHT31:
     def ping(self):
         data = b'   '
         try:
-            self.i2cbus.write(self.dev_addr, self.REG_STATUS)
-            data = self.i2cbus.read(self.DEV_ADDR, 3)
+            with self.i2cbus.transaction():
+                self.i2cbus.write(self.dev_addr, self.REG_STATUS)
+                data = self.i2cbus.read(self.DEV_ADDR, 3)
         except:
             pass
 
         return data[2] == self.crc(data[0:2])
     
-    def get_value(self):
-        self.i2cbus.write(self.dev_addr, self.REG_RESET)
-        time.sleep(0.01)
+    # 変換を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, self.REG_RESET)
+            self.i2cbus.sleep(0.01)
 
-        self.i2cbus.write(self.dev_addr, self.REG_MEASURE)
-        time.sleep(0.05)
+            self.i2cbus.write(self.dev_addr, self.REG_MEASURE)
+        self.ready_at = time.monotonic() + self.CONV_TIME
 
+    def read_result(self):
         data = self.i2cbus.read(self.DEV_ADDR, 6)
 
         if (self.crc(data[0:2]) != data[2]) or (self.crc(data[3:5]) != data[5]):
@@ -71,10 +78,17 @@ class SHT31:
 
         return [ round(temp, 4), round(humi, 1) ]
 
+    def get_value(self):
+        with self.i2cbus.transaction():
+            self.start_measurement()
+            self.i2cbus.sleep(max(self.ready_at - time.monotonic(), 0))
+            return self.read_result()
+
     def get_value_map(self):
-        data = self.get_value()
+        return self.to_value_map(self.get_value())
 
-        return { 'temp': data[0], 'humi': data[1] }
+    def to_value_map(self, value):
+        return { 'temp': value[0], 'humi': value[1] }
 
 
 if __name__ == '__main__':
@@ -15,7 +15,7 @@ if __name__ == '__main__':
     import sys
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
-import smbus
+import i2cbus
 
 class SHT35:
     NAME                = 'SHT-35'
@@ -24,12 +24,12 @@ class SHT35:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = smbus.SMBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.is_init = False
 
     def init(self):
         # periodic, 1mps, repeatability high
-        self.i2cbus.write_byte_data(self.dev_addr, 0x21, 0x30)
+        self.i2cbus.write(self.dev_addr, [0x21, 0x30])
         self.is_init = True
         time.sleep(0.01)
 
@@ -47,8 +47,9 @@ class SHT35:
 
     def ping(self):
         try:
-            self.i2cbus.write_byte_data(self.dev_addr, 0xF3, 0x2D)
-            data = self.i2cbus.read_i2c_block_data(self.dev_addr, 0x00, 3)
+            with self.i2cbus.transaction():
+                self.i2cbus.write(self.dev_addr, [0xF3, 0x2D])
+                data = self.i2cbus.read(self.dev_addr, 3, 0x00)
 
             return self.crc(data[0:2]) == data[2]
         except:
@@ -58,9 +59,10 @@ class SHT35:
         if not self.is_init:
             self.init()
 
-        self.i2cbus.write_byte_data(self.dev_addr, 0xE0, 0x00)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, [0xE0, 0x00])
     
-        data = self.i2cbus.read_i2c_block_data(self.dev_addr, 0x00, 6)
+            data = self.i2cbus.read(self.dev_addr, 6, 0x00)
 
         if (self.crc(data[0:2]) != data[2]) or (self.crc(data[3:5]) != data[5]):
             raise IOError("ERROR: CRC unmatch.")
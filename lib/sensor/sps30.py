@@ -16,26 +16,43 @@ if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir))
 
 import i2cbus
+import sensor.init_state
 
 class SPS30:
     NAME                = 'SPS30'
     DEV_ADDR		= 0x69 # 7bit
+    OUTPUT_FORMAT       = 0x03 # Big-endian IEEE754 float
     
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.is_init = False
+        self.is_restored = False # 保存された状態を使って計測の開始を省略したか
+        self.init_state = sensor.init_state.InitState(self.NAME, bus, dev_addr)
+        # NOTE: 計測値の読み出し用バッファは使い回す
+        self.data_buf = bytearray(60)
 
     def init(self):
+        # NOTE: 以前のプロセスで計測を開始済みで，チップも計測モードのままなら
+        # 開始し直さない (データが出ているかは，次の wait_measure() で確認する)
+        state = self.init_state.load()
+        if (state is not None) and (state['config'] == [self.OUTPUT_FORMAT]) and \
+           self.is_measuring():
+            self.is_init = True
+            self.is_restored = True
+            return
+
         self.start_measure()
+        self.init_state.save([self.OUTPUT_FORMAT])
         self.is_init = True
         time.sleep(0.1) 
 
     def ping(self):
         try:
-            self.i2cbus.write(self.dev_addr, [0xD1, 0x00])
-            data = self.i2cbus.read(self.dev_addr, 2)
+            with self.i2cbus.transaction():
+                self.i2cbus.write(self.dev_addr, [0xD1, 0x00])
+                data = self.i2cbus.read(self.dev_addr, 2)
 
             return int.from_bytes(data, byteorder='big') > 0x0200
         except:
@@ -60,7 +77,7 @@ class SPS30:
         return command + [self.__crc(command[2:])]
 
     def start_measure(self):
-        command = [0x00, 0x10, 0x03, 0x00 ]
+        command = [0x00, 0x10, self.OUTPUT_FORMAT, 0x00 ]
         command = self.__compose_command(command)
         self.i2cbus.write(self.dev_addr, command)
     
@@ -68,15 +85,28 @@ class SPS30:
         # Stop measurement
         self.i2cbus.write(self.dev_addr, [0x01, 0x04 ])
     
-    def wait_measure(self):
-        for i in range(10):
-            # Check data ready
+    def read_data_ready(self):
+        # Read data-ready flag
+        with self.i2cbus.transaction():
             self.i2cbus.write(self.dev_addr, [0x02, 0x02])
             data = self.i2cbus.read(self.dev_addr, 3)
-            if data[2] != self.__crc(list(data[0:2])):
-                raise IOError('CRC unmatch')
+        if data[2] != self.__crc(list(data[0:2])):
+            raise IOError('CRC unmatch')
+
+        return data[1] == 1
+
+    # 計測モードかどうかを返します．
+    # NOTE: Read data-ready flag は計測モードでしか受け付けない (アイドルモードでは NACK)
+    def is_measuring(self):
+        try:
+            self.read_data_ready()
+            return True
+        except IOError:
+            return False
 
-            if (data[1] == 1):
+    def wait_measure(self):
+        for i in range(10):
+            if self.read_data_ready():
                 return
 
             time.sleep(0.1) 
@@ -99,12 +129,23 @@ class SPS30:
         if not self.is_init:
             self.init()
 
-        self.wait_measure()
+        try:
+            self.wait_measure()
+        except IOError:
+            if not self.is_restored:
+                raise
+            # NOTE: 電源が切れる等で計測が止まっていたので，開始し直す
+            self.init_state.clear()
+            self.is_restored = False
+            self.init()
+            self.wait_measure()
+        self.is_restored = False
 
-        self.i2cbus.write(self.dev_addr, [0x03, 0x00])
-        data = self.i2cbus.read(self.dev_addr, 60)
+        with self.i2cbus.transaction():
+            self.i2cbus.write(self.dev_addr, [0x03, 0x00])
+            self.i2cbus.read_into(self.dev_addr, self.data_buf)
 
-        return self.parse_value(data)
+        return self.parse_value(self.data_buf)
 
     def get_value_map(self):
         value = self.get_value()
@@ -44,8 +44,9 @@ class TSL2561:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.is_init = False
+        self.ready_at = None
 
     def init(self):
         data = self.i2cbus.read(self.DEV_ADDR, 1, self.REG_TIMING)
@@ -75,13 +76,16 @@ class TSL2561:
         self.integ = integ
         self.is_init = False
 
-    def wait(self):
+    def get_integ_time(self):
         if self.integ == self.INTEG_13MS:
-            time.sleep(0.013 + 0.1)
+            return 0.013 + 0.1
         if self.integ == self.INTEG_101MS:
-            time.sleep(0.101 + 0.1)
+            return 0.101 + 0.1
         if self.integ == self.INTEG_402MS:
-            time.sleep(0.402 + 0.1)
+            return 0.402 + 0.1
+
+    def wait(self):
+        self.i2cbus.sleep(self.ready_at - time.monotonic())
 
     def ping(self):
         dev_id = 0
@@ -94,17 +98,26 @@ class TSL2561:
 
         return (dev_id >> 4) == 0x1
     
-    def get_value_impl(self):
-        if not self.is_init:
-            self.init()
+    # 変換を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
+        with self.i2cbus.transaction():
+            if not self.is_init:
+                self.init()
+
+            self.enable()
+        self.ready_at = time.monotonic() + self.get_integ_time()
 
-        self.enable()
-        self.wait()
+    def read_result(self):
+        return self.adjust_range(self.read_lux())
 
-        value0 = self.i2cbus.read(self.dev_addr, 2, self.REG_DATA0)
-        value1 = self.i2cbus.read(self.dev_addr, 2, self.REG_DATA1)
+    def read_lux(self):
+        with self.i2cbus.transaction():
+            (value0, value1) = self.i2cbus.transfer([
+                (self.dev_addr, self.REG_DATA0, 2),
+                (self.dev_addr, self.REG_DATA1, 2),
+            ])
 
-        self.disable()
+            self.disable()
 
         ch0 = int.from_bytes(value0, byteorder='little')
         ch1 = int.from_bytes(value1, byteorder='little')
@@ -134,10 +147,15 @@ class TSL2561:
         else:
             return [ 0.0 ];
 
+    def get_value_impl(self):
+        with self.i2cbus.transaction():
+            self.start_measurement()
+            self.wait()
 
-    def get_value(self):
-        value = self.get_value_impl()
+            return self.read_lux()
 
+    # NOTE: 暗い場合は積分時間を延ばして測り直す
+    def adjust_range(self, value):
         if (self.integ != self.INTEG_402MS) and (value[0] < 100):
             self.set_integ(self.INTEG_402MS)
             return self.get_value_impl()
@@ -147,9 +165,13 @@ class TSL2561:
         else:
             return value
 
+    def get_value(self):
+        return self.adjust_range(self.get_value_impl())
+
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return { 'lux': value[0] }
 
         
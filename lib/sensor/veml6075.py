@@ -45,12 +45,15 @@ class VEML6075:
     UVB_RESP_50MS       = (0.01 / 8) / 0.5016286645 # From SparkFun_VEML6075_Arduino_Library.cpp
     UVB_RESP_100MS      = (0.01 / 8)
 
+    CONV_TIME           = 1.1 # 変換時間 [sec]
+
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.it = self.CONF_IT_50MS
         self.is_init = False
+        self.ready_at = None
 
     def init(self):
         self.disable()
@@ -61,7 +64,6 @@ class VEML6075:
             self.dev_addr,
             [self.REG_UV_CONF, self.it|self.CONF_TRIG_ONE|self.CONF_AF_ENABLE|self.CONF_SD_POWERON, 0x00]
         )
-        time.sleep(1.1)
 
     def disable(self):
         self.i2cbus.write(
@@ -77,25 +79,29 @@ class VEML6075:
         except:
             return False
     
-    def get_value(self):
-        if not self.is_init:
-            self.init()
-
-        self.enable()
-
-        data = self.i2cbus.read(self.dev_addr, 2, self.REG_UVA)
-        uva = int.from_bytes(data, byteorder='little')
-
-        data = self.i2cbus.read(self.dev_addr, 2, self.REG_UVB)
-        uvb = int.from_bytes(data, byteorder='little')
-
-        data = self.i2cbus.read(self.dev_addr, 2, self.REG_UVCOMP1)
-        uvcomp1 = int.from_bytes(data, byteorder='little')
-
-        data = self.i2cbus.read(self.dev_addr, 2, self.REG_UVCOMP2)
-        uvcomp2 = int.from_bytes(data, byteorder='little')
-
-        self.disable()
+    # 変換を開始します．ready_at 以降に read_result() で結果を読み出せます．
+    def start_measurement(self):
+        with self.i2cbus.transaction():
+            if not self.is_init:
+                self.init()
+
+            self.enable()
+        self.ready_at = time.monotonic() + self.CONV_TIME
+
+    def read_result(self):
+        with self.i2cbus.transaction():
+            # NOTE: 4 つのレジスタを 1 回のトランザクションで読み出す
+            data_list = self.i2cbus.transfer([
+                (self.dev_addr, self.REG_UVA, 2),
+                (self.dev_addr, self.REG_UVB, 2),
+                (self.dev_addr, self.REG_UVCOMP1, 2),
+                (self.dev_addr, self.REG_UVCOMP2, 2),
+            ])
+            (uva, uvb, uvcomp1, uvcomp2) = [
+                int.from_bytes(data, byteorder='little') for data in data_list
+            ]
+
+            self.disable()
 
         uva_calc = uva - ((2.22 * 1.0 * uvcomp1) / 1.0) - ((1.33 * 1.0 * uvcomp2) / 1.0)
         uvb_calc = uvb - ((2.95 * 1.0 * uvcomp1) / 1.0) - ((1.75 * 1.0 * uvcomp2) / 1.0)
@@ -109,9 +115,16 @@ class VEML6075:
 
         return [ round(uva_calc, 2), round(uvb_calc, 1), round(uvi, 1) ]
 
+    def get_value(self):
+        with self.i2cbus.transaction():
+            self.start_measurement()
+            self.i2cbus.sleep(max(self.ready_at - time.monotonic(), 0))
+            return self.read_result()
+
     def get_value_map(self):
-        value = self.get_value()
+        return self.to_value_map(self.get_value())
 
+    def to_value_map(self, value):
         return {
             'uva': value[0],
             'uvb': value[1],
@@ -42,7 +42,7 @@ class VEML7700:
     def __init__(self, bus, dev_addr=DEV_ADDR):
         self.bus = bus
         self.dev_addr = dev_addr
-        self.i2cbus = i2cbus.I2CBus(bus)
+        self.i2cbus = i2cbus.get_bus(bus)
         self.gain = 0.125
         self.integ = 25
 
@@ -65,7 +65,7 @@ class VEML7700:
         self.gain = gain
 
     def wait(self):
-        time.sleep(self.integ/1000.0 + 0.1)
+        self.i2cbus.sleep(self.integ/1000.0 + 0.1)
 
     def ping(self):
         try:
@@ -77,12 +77,13 @@ class VEML7700:
         return False
     
     def get_value_impl(self):
-        self.enable()
-        self.wait()
+        with self.i2cbus.transaction():
+            self.enable()
+            self.wait()
 
-        value = self.i2cbus.read(self.dev_addr, 2, self.REG_ALS)
+            value = self.i2cbus.read(self.dev_addr, 2, self.REG_ALS)
 
-        self.disable()
+            self.disable()
 
         als = int.from_bytes(value, byteorder='little')
         als *= 0.0036 * (800 / self.integ) * (2 / self.gain)
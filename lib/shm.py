@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# キャッシュや状態のファイルを置くディレクトリを決めるライブラリです．
+#
+# 通常は /dev/shm ですが，環境変数 I2C_SIM を指定してシミュレータで
+# 動かす場合は，実機のスクリプトが使うセンサの初期化状態やリングバッファ等を
+# 偽物の値で上書きしないように，専用のディレクトリ (SIM_DIR) を使います．
+# SIM_DIR は環境変数 I2C_SIM_DIR で変えられます．
+#
+#   cache_path = shm.get_path('sense_env_sensor.json')
+
+import os
+import tempfile
+
+SHM_DIR         = '/dev/shm'
+SIM_DIR         = os.environ.get(
+    'I2C_SIM_DIR', os.path.join(tempfile.gettempdir(), 'i2c_sim_%d' % os.getuid())
+)
+
+def is_sim():
+    return bool(os.environ.get('I2C_SIM'))
+
+# キャッシュや状態のファイルを置くディレクトリを返します．
+def get_dir():
+    if not is_sim():
+        return SHM_DIR
+
+    # NOTE: 他のユーザから見えないようにする
+    os.makedirs(SIM_DIR, mode=0o700, exist_ok=True)
+    return SIM_DIR
+
+def get_path(name):
+    return os.path.join(get_dir(), name)
+
+if __name__ == '__main__':
+    # TEST Code
+    print(get_dir())
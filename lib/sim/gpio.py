@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# gpio.py 用の偽物のバックエンドです．
+#
+# 環境変数 GPIO_SIM=1 を指定すると，gpio.create_pwm() と gpio.create_output() が
+# このバックエンドを使います．実機と同じく状態がプロセスをまたいで残るように，
+# 状態は GPIO_SIM_PATH (デフォルトは /dev/shm/gpio_sim.json) に保存し，
+# 書き込みの度に write_count を増やします．
+#
+#   $ GPIO_SIM=1 python3 app/fan_control/fan_control.py on
+
+import os
+import json
+
+STATE_PATH      = os.environ.get('GPIO_SIM_PATH', '/dev/shm/gpio_sim.json')
+
+def load_state():
+    try:
+        with open(STATE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state):
+    tmp_path = '%s.%d' % (STATE_PATH, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, STATE_PATH)
+
+class SimBackend:
+    def __init__(self, key, default):
+        self.key = key
+        self.default = default
+
+    def get(self):
+        return load_state().get(self.key, dict(self.default))
+
+    def update(self, value_map):
+        state = load_state()
+        item = state.setdefault(self.key, dict(self.default))
+        item.update(value_map)
+        state['write_count'] = state.get('write_count', 0) + 1
+        save_state(state)
+
+class SimPWMBackend(SimBackend):
+    def __init__(self, chip, channel):
+        super().__init__(
+            'pwmchip%d/pwm%d' % (chip, channel),
+            {'period': 0, 'duty_cycle': 0, 'enable': 0}
+        )
+
+    def read(self, name):
+        return self.get()[name]
+
+    def write(self, name, value):
+        if (name == 'period') and (value < self.read('duty_cycle')):
+            raise OSError('period is shorter than duty_cycle')
+        if (name == 'duty_cycle') and (value > self.read('period')):
+            raise OSError('duty_cycle is longer than period')
+        self.update({name: value})
+
+class SimOutputBackend(SimBackend):
+    def __init__(self, line, chip=0):
+        super().__init__('gpiochip%d/%d' % (chip, line), {'value': 0, 'output': 0})
+
+    # NOTE: 実機と同じく，起動時は入力とする
+    def is_output(self):
+        return self.get().get('output', 0) == 1
+
+    def read(self):
+        return self.get()['value']
+
+    def write(self, value):
+        self.update({'output': 1, 'value': value})
+
+    def close(self):
+        pass
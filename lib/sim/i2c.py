@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# I2CBus 用のシミュレータバックエンドです．
+#
+# I2C_RDWR のメッセージを sim/i2c_device.py のデバイスモデルに振り分けます．
+# 環境変数 I2C_SIM に PROFILE_MAP のプロファイル名を指定すると，
+# i2cbus.I2CBus が自動的にこのバックエンドを使います．
+#
+# その場合，キャッシュや状態 (センサの初期化状態，リングバッファ，flock 等) は
+# /dev/shm ではなく専用のディレクトリに置くので，実機の状態は変わりません
+# (lib/shm.py を参照)．
+#
+#   $ I2C_SIM=env python3 app/sense_env/sense_env.py
+
+import os
+import errno
+import ctypes
+import time
+
+import i2cbus
+import sim.i2c_device as device
+
+def profile_env():
+    return {
+        0x1: [
+            device.K30(),
+            device.HDC1050(),
+            device.SHT3x(),
+            device.LPS25H(),
+            device.TSL2561(),
+            device.APDS9250(),
+            device.CCS811(),
+            device.SCD4x(),
+            device.VEML7700()
+        ],
+        0x0: [device.VEML6075()]
+    }
+
+def profile_solar():
+    return {
+        0x1: [
+            device.INA226(0x40, volt=18.0, curr=1.5),
+            device.INA226(0x41, volt=13.8, curr=1.8),
+            device.INA226(0x42, volt=13.2, curr=0.5)
+        ],
+        0x0: [
+            device.SHT3x(0x44),
+            device.SPS30(),
+            device.ADS1015(0x48, mvolt=3.49)
+        ]
+    }
+
+def profile_aqua():
+    return {
+        0x1: [
+            device.EZO_RTD(),
+            device.EZO_PH(),
+            device.EZO_DO(),
+            device.ADS1015(0x4A, mvolt=300.0)
+        ]
+    }
+
+PROFILE_MAP = {
+    'env': profile_env,
+    'solar': profile_solar,
+    'aqua': profile_aqua
+}
+
+class SimBackend:
+    # NOTE: 転送にかかる時間も再現する (None なら待たない)
+    BUS_SPEED       = 100000
+
+    def __init__(self, bus, device_list, bus_speed=BUS_SPEED):
+        if isinstance(device_list, str):
+            device_list = PROFILE_MAP[device_list]().get(bus, [])
+
+        self.bus = bus
+        self.bus_speed = bus_speed
+        self.dev_map = {dev.dev_addr: dev for dev in device_list}
+        # NOTE: True にすると，SDA が Low に張り付いた状態を再現する
+        self.stuck = False
+
+    def rdwr(self, rdwr_data):
+        if self.stuck:
+            raise OSError(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT))
+
+        bits = 0
+        try:
+            for i in range(rdwr_data.nmsgs):
+                msg = rdwr_data.msgs[i]
+                dev = self.dev_map.get(msg.addr)
+                # NOTE: START + アドレス + データで，1 byte あたり ACK 込みで 9bit
+                bits += 1 + 9 * (1 + msg.len)
+                if dev is None:
+                    device.nack()
+                if msg.len == 0:
+                    # NOTE: 長さ 0 の転送 (Quick Write) はアドレスの ACK だけ
+                    continue
+
+                if msg.flags & i2cbus.I2CBus.I2C_M_RD:
+                    data = dev.read(msg.len)
+                    ctypes.memmove(msg.buf, data, msg.len)
+                else:
+                    dev.write(ctypes.string_at(msg.buf, msg.len))
+        finally:
+            if self.bus_speed is not None:
+                time.sleep(bits / self.bus_speed)
+
+    def reset(self):
+        for dev in self.dev_map.values():
+            dev.reset()
+
+    def recover(self):
+        if not self.stuck:
+            return False
+        self.stuck = False
+        self.reset()
+        return True
+
+    def close(self):
+        pass
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# I2C シミュレータ用のデバイスモデルです．
+#
+# lib/sensor/ 以下のドライバが発行するコマンドやレジスタアクセスに
+# 応答し，変換時間中の NACK や CRC の付与も再現します．
+# 物理量 (温度や照度など) はコンストラクタの引数で指定し，
+# 属性を書き換えることで変更できます．
+
+import errno
+import os
+import struct
+import time
+
+def nack():
+    raise OSError(errno.EREMOTEIO, os.strerror(errno.EREMOTEIO))
+
+def sensirion_crc(data, init=0xFF):
+    crc = init
+    for d in data:
+        crc ^= d
+        for i in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x31) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+    return crc
+
+def sensirion_words(word_list, init=0xFF):
+    data = b''
+    for word in word_list:
+        word_data = struct.pack('>H', word & 0xFFFF)
+        data += word_data + bytes([sensirion_crc(word_data, init)])
+    return data
+
+def clip(value, min_value, max_value):
+    return max(min_value, min(max_value, int(round(value))))
+
+class I2CDevice:
+    def __init__(self, dev_addr):
+        self.dev_addr = dev_addr
+
+    def write(self, data):
+        nack()
+
+    def read(self, count):
+        nack()
+
+    # バスリセット (SCL のクロック送出) を受けたときの処理
+    def reset(self):
+        pass
+
+class WordRegDevice(I2CDevice):
+    # 8bit のポインタで 16bit のレジスタを指定するデバイス
+    BYTEORDER       = 'big'
+
+    def __init__(self, dev_addr, reg_map):
+        super().__init__(dev_addr)
+        self.reg_map = dict(reg_map)
+        self.ptr = 0x00
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        self.ptr = data[0]
+        if len(data) >= 3:
+            value = int.from_bytes(data[1:3], byteorder=self.BYTEORDER)
+            self.reg_map[self.ptr] = value
+            self.on_write(self.ptr, value)
+        else:
+            self.on_select(self.ptr)
+
+    def read(self, count):
+        if self.ptr not in self.reg_map:
+            nack()
+        value = self.get_reg(self.ptr)
+        data = value.to_bytes(2, byteorder=self.BYTEORDER)
+        return (data * ((count + 1) // 2))[0:count]
+
+    def get_reg(self, reg):
+        return self.reg_map[reg]
+
+    def on_write(self, reg, value):
+        pass
+
+    def on_select(self, reg):
+        pass
+
+class ByteRegDevice(I2CDevice):
+    # 8bit のポインタで 8bit のレジスタを指定するデバイス
+    AUTO_INC_BIT    = 0x00
+
+    def __init__(self, dev_addr, reg_map):
+        super().__init__(dev_addr)
+        self.reg = bytearray(256)
+        for reg, value in reg_map.items():
+            self.reg[reg] = value
+        self.ptr = 0x00
+        self.auto_inc = False
+
+    def select(self, ptr):
+        self.auto_inc = (ptr & self.AUTO_INC_BIT) != 0
+        self.ptr = ptr & ~self.AUTO_INC_BIT & 0xFF
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        self.select(data[0])
+        for value in data[1:]:
+            self.reg[self.ptr] = value
+            self.on_write(self.ptr, value)
+            self.ptr = (self.ptr + 1) & 0xFF
+
+    def read(self, count):
+        self.update()
+        data = bytearray()
+        for i in range(count):
+            data.append(self.reg[self.ptr])
+            if self.auto_inc:
+                self.ptr = (self.ptr + 1) & 0xFF
+        return bytes(data)
+
+    def on_write(self, reg, value):
+        pass
+
+    # 読み出し前に計測値のレジスタを更新する
+    def update(self):
+        pass
+
+class CommandDevice(I2CDevice):
+    # 16bit のコマンドを送ってから応答を読み出す Sensirion 系のデバイス
+    def __init__(self, dev_addr):
+        super().__init__(dev_addr)
+        self.resp = None
+        self.ready_at = 0
+
+    def write(self, data):
+        # NOTE: 1 byte だけの書き込みは無視する (SHT35 のドライバは
+        # 読み出し前にレジスタ 0x00 を書き込む)
+        if len(data) < 2:
+            return
+        if time.monotonic() < self.ready_at:
+            nack()
+        self.resp = None
+        self.command((data[0] << 8) | data[1], data[2:])
+
+    def read(self, count):
+        if (time.monotonic() < self.ready_at) or (self.resp is None):
+            nack()
+        return (self.resp + bytes(count))[0:count]
+
+    def command(self, cmd, arg):
+        nack()
+
+    def respond(self, resp, delay=0):
+        self.resp = resp
+        self.ready_at = time.monotonic() + delay
+
+class HDC1050(WordRegDevice):
+    CONV_TIME       = 0.015
+
+    def __init__(self, dev_addr=0x40, temp=25.0, humi=50.0):
+        super().__init__(dev_addr, {0x00: 0, 0x01: 0, 0x02: 0x1000, 0xFE: 0x5449, 0xFF: 0x1050})
+        self.temp = temp
+        self.humi = humi
+        self.conv_at = None
+
+    def on_select(self, reg):
+        if reg == 0x00:
+            self.conv_at = time.monotonic()
+
+    def read(self, count):
+        if self.ptr != 0x00:
+            return super().read(count)
+        if (self.conv_at is None) or (time.monotonic() < self.conv_at + self.CONV_TIME):
+            nack()
+        temp = clip((self.temp + 40) / 165 * 65536, 0, 0xFFFF)
+        humi = clip(self.humi / 100 * 65536, 0, 0xFFFF)
+        return struct.pack('>HH', temp, humi)[0:count]
+
+class SHT3x(CommandDevice):
+    CONV_TIME       = 0.0155
+
+    def __init__(self, dev_addr=0x44, temp=25.0, humi=50.0):
+        super().__init__(dev_addr)
+        self.temp = temp
+        self.humi = humi
+        self.periodic_at = None
+
+    def measurement(self):
+        return sensirion_words([
+            clip((self.temp + 45) / 175 * 65535, 0, 0xFFFF),
+            clip(self.humi / 100 * 65535, 0, 0xFFFF)
+        ])
+
+    def command(self, cmd, arg):
+        if cmd == 0xF32D: # read status
+            self.respond(sensirion_words([0x0000]))
+        elif cmd == 0x30A2: # soft reset
+            self.periodic_at = None
+            self.respond(None, 0.0015)
+        elif cmd == 0x2400: # single shot, high repeatability
+            self.respond(self.measurement(), self.CONV_TIME)
+        elif (cmd & 0xFF00) in (0x2000, 0x2100, 0x2200, 0x2300, 0x2700): # periodic
+            if self.periodic_at is None:
+                self.periodic_at = time.monotonic() + self.CONV_TIME
+        elif cmd == 0xE000: # fetch data
+            if (self.periodic_at is not None) and (time.monotonic() >= self.periodic_at):
+                self.respond(self.measurement())
+        elif cmd == 0x3093: # break
+            self.periodic_at = None
+        else:
+            nack()
+
+    def reset(self):
+        self.resp = None
+        self.ready_at = 0
+
+class SHT21(I2CDevice):
+    def __init__(self, dev_addr=0x40, temp=25.0, humi=50.0):
+        super().__init__(dev_addr)
+        self.temp = temp
+        self.humi = humi
+        self.resp = None
+        self.ready_at = 0
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        now = time.monotonic()
+        if data[0] == 0xE7: # read user register
+            self.resp = bytes([0x02])
+            self.ready_at = now
+        elif data[0] == 0xF3: # temperature, no hold master
+            raw = clip((self.temp + 46.85) / 175.72 * 65536, 0, 0xFFFF) & 0xFFFC
+            self.resp = sensirion_words([raw], 0x00)
+            self.ready_at = now + 0.085
+        elif data[0] == 0xF5: # humidity, no hold master
+            raw = clip((self.humi + 6) / 125.0 * 65536, 0, 0xFFFF) & 0xFFFC
+            self.resp = sensirion_words([raw | 0x02], 0x00)
+            self.ready_at = now + 0.029
+        else:
+            nack()
+
+    def read(self, count):
+        if (self.resp is None) or (time.monotonic() < self.ready_at):
+            nack()
+        return (self.resp + bytes(count))[0:count]
+
+class LPS25H(ByteRegDevice):
+    AUTO_INC_BIT    = 0x80
+    WHO_AM_I        = 0xBD
+    REG_CTRL1       = 0x20
+    REG_CTRL2       = 0x21
+    POWER_ON        = 0x80
+    CONV_TIME       = 0.04
+
+    def __init__(self, dev_addr=0x5C, press=1013.0):
+        super().__init__(dev_addr, {0x0F: self.WHO_AM_I})
+        self.press = press
+        self.ready_at = None
+
+    def on_write(self, reg, value):
+        if reg == self.REG_CTRL1:
+            self.ready_at = time.monotonic() + self.CONV_TIME if value & self.POWER_ON else None
+        elif (reg == self.REG_CTRL2) and (value & 0x04): # SWRESET
+            self.reg[self.REG_CTRL1] = 0x00
+            self.ready_at = None
+
+    def update(self):
+        if (self.ready_at is not None) and (time.monotonic() >= self.ready_at):
+            raw = clip(self.press * 4096, 0, 0xFFFFFF)
+        else:
+            raw = 0
+        self.reg[0x28:0x2B] = raw.to_bytes(3, byteorder='little')
+
+class LPS22HB(LPS25H):
+    AUTO_INC_BIT    = 0x00
+    WHO_AM_I        = 0xB1
+    REG_CTRL1       = 0x10
+    REG_CTRL2       = 0x11
+    POWER_ON        = 0x70 # ODR が 0 以外なら連続変換
+
+    def __init__(self, dev_addr=0x5C, press=1013.0):
+        super().__init__(dev_addr, press)
+
+    def select(self, ptr):
+        # NOTE: IF_ADD_INC がデフォルトで有効なので常にインクリメントする
+        super().select(ptr)
+        self.auto_inc = True
+
+class TSL2561(ByteRegDevice):
+    INTEG_TIME      = {0x00: 0.0137, 0x01: 0.101, 0x02: 0.402}
+    INTEG_SCALE     = {0x00: 322.0 / 11, 0x01: 322.0 / 81, 0x02: 1.0}
+    INTEG_MAX       = {0x00: 5047, 0x01: 37177, 0x02: 65535}
+
+    def __init__(self, dev_addr=0x39, lux=500.0):
+        super().__init__(dev_addr, {0x01: 0x02, 0x0A: 0x10})
+        self.lux = lux
+        self.ready_at = None
+
+    def select(self, ptr):
+        # COMMAND (bit7) / WORD (bit5) を除いたアドレスを指す
+        self.ptr = ptr & 0x0F
+        self.auto_inc = True
+
+    def on_write(self, reg, value):
+        if reg == 0x00:
+            if (value & 0x03) == 0x03:
+                integ = self.reg[0x01] & 0x03
+                self.ready_at = time.monotonic() + self.INTEG_TIME.get(integ, 0.402)
+            else:
+                self.ready_at = None
+
+    def update(self):
+        ch0 = ch1 = 0
+        if (self.ready_at is not None) and (time.monotonic() >= self.ready_at):
+            integ = self.reg[0x01] & 0x03
+            gain = 1 if (self.reg[0x01] & 0x10) else 16
+            # NOTE: CH1/CH0 = 0.3 として，ドライバの換算式を逆算する
+            ch0 = self.lux / (0.0304 - 0.062 * (0.3**1.4))
+            ch0 = clip(ch0 / gain / self.INTEG_SCALE[integ], 0, self.INTEG_MAX[integ])
+            ch1 = clip(ch0 * 0.3, 0, self.INTEG_MAX[integ])
+        self.reg[0x0C:0x10] = struct.pack('<HH', ch0, ch1)
+
+class APDS9250(ByteRegDevice):
+    def __init__(self, dev_addr=0x52, lux=500.0):
+        super().__init__(dev_addr, {0x06: 0xB2})
+        self.lux = lux
+
+    def select(self, ptr):
+        super().select(ptr)
+        self.auto_inc = True
+
+    def update(self):
+        als = clip(self.lux * 400 / 46.0, 0, 0xFFFFF)
+        ir = als // 2
+        self.reg[0x0A:0x10] = ir.to_bytes(3, 'little') + als.to_bytes(3, 'little')
+
+class K30(I2CDevice):
+    PROC_TIME       = 0.01
+
+    def __init__(self, dev_addr=0x68, co2=600):
+        super().__init__(dev_addr)
+        self.co2 = co2
+        self.resp = None
+        self.ready_at = 0
+
+    def write(self, data):
+        if (len(data) < 4) or ((sum(data[0:-1]) & 0xFF) != data[-1]):
+            nack()
+        count = data[0] & 0x0F
+        if data[2] == 0x08: # CO2
+            value = clip(self.co2, 0, 0xFFFF).to_bytes(2, 'big')
+        else:
+            value = bytes([0x00] * count)
+        resp = bytes([0x21]) + value[0:count]
+        self.resp = resp + bytes([sum(resp) & 0xFF])
+        self.ready_at = time.monotonic() + self.PROC_TIME
+
+    def read(self, count):
+        if (self.resp is None) or (time.monotonic() < self.ready_at):
+            nack()
+        resp = self.resp
+        self.resp = None
+        return (resp + bytes(count))[0:count]
+
+class SCD4x(CommandDevice):
+    INTERVAL        = 5.0
+
+    def __init__(self, dev_addr=0x62, co2=600, temp=25.0, humi=50.0, running=True):
+        super().__init__(dev_addr)
+        self.co2 = co2
+        self.temp = temp
+        self.humi = humi
+        self.start_at = (time.monotonic() - self.INTERVAL) if running else None
+        self.read_count = 0
+
+    def data_count(self):
+        if self.start_at is None:
+            return 0
+        return int((time.monotonic() - self.start_at) / self.INTERVAL)
+
+    def command(self, cmd, arg):
+        if cmd == 0xE4B8: # get_data_ready_status
+            ready = self.data_count() > self.read_count
+            self.respond(sensirion_words([0x8006 if ready else 0x8000]))
+        elif cmd == 0xEC05: # read_measurement
+            self.read_count = self.data_count()
+            self.respond(sensirion_words([
+                clip(self.co2, 0, 0xFFFF),
+                clip((self.temp + 45) / 175 * 65535, 0, 0xFFFF),
+                clip(self.humi / 100 * 65535, 0, 0xFFFF)
+            ]))
+        elif cmd == 0x21B1: # start_periodic_measurement
+            if self.start_at is None:
+                self.start_at = time.monotonic()
+                self.read_count = 0
+        elif cmd == 0x3F86: # stop_periodic_measurement
+            self.start_at = None
+            self.respond(None, 0.5)
+        elif cmd == 0x3646: # reinit
+            self.respond(None, 0.02)
+        else:
+            nack()
+
+class SPS30(CommandDevice):
+    INTERVAL        = 1.0
+    FIRST_DATA      = 0.5
+    LABEL           = [
+        'pm10', 'pm25', 'pm40', 'pm100',
+        'num_pm5', 'num_pm10', 'num_pm25', 'num_pm40', 'num_pm100',
+        'typ_size'
+    ]
+
+    def __init__(self, dev_addr=0x69, value_map=None, running=False):
+        super().__init__(dev_addr)
+        self.value_map = {label: 1.0 for label in self.LABEL}
+        if value_map is not None:
+            self.value_map.update(value_map)
+        self.start_at = (time.monotonic() - self.INTERVAL) if running else None
+        self.read_count = 0
+
+    def data_count(self):
+        if self.start_at is None:
+            return 0
+        elapsed = time.monotonic() - self.start_at
+        return int((elapsed + self.INTERVAL - self.FIRST_DATA) / self.INTERVAL)
+
+    def command(self, cmd, arg):
+        if cmd == 0x0010: # start measurement
+            if (len(arg) != 3) or (sensirion_crc(arg[0:2]) != arg[2]):
+                nack()
+            self.start_at = time.monotonic()
+            self.read_count = 0
+        elif cmd == 0x0104: # stop measurement
+            self.start_at = None
+        elif cmd == 0x0202: # read data-ready flag
+            # NOTE: 実機と同じく，アイドルモードでは NACK を返す
+            if self.start_at is None:
+                nack()
+            ready = self.data_count() > self.read_count
+            self.respond(sensirion_words([0x0001 if ready else 0x0000]))
+        elif cmd == 0x0300: # read measured values
+            self.read_count = self.data_count()
+            word_list = []
+            for label in self.LABEL:
+                raw = struct.unpack('>HH', struct.pack('>f', self.value_map[label]))
+                word_list.extend(raw)
+            self.respond(sensirion_words(word_list))
+        elif cmd == 0xD100: # read firmware version
+            self.respond(sensirion_words([0x0202]))
+        else:
+            nack()
+
+class INA226(WordRegDevice):
+    def __init__(self, dev_addr=0x40, volt=12.0, curr=0.5):
+        super().__init__(dev_addr, {
+            0x00: 0x4127, 0x01: 0, 0x02: 0, 0x03: 0, 0x04: 0, 0x05: 0,
+            0xFE: 0x5449, 0xFF: 0x2260
+        })
+        self.volt = volt
+        self.curr = curr
+
+    # NOTE: 実機と同じく，設定レジスタの bit 14-12 (予約済み) は書き込んだ値に
+    # 関係なく 100b，bit 15 (RST) は 0 が読める
+    def on_write(self, reg, value):
+        if reg == 0x00:
+            self.reg_map[0x00] = (value & 0x0FFF) | 0x4000
+
+    def get_reg(self, reg):
+        # NOTE: シャント抵抗 25mΩ，Current_LSB = 0.1mA (= CAL 0x0800) を前提とする
+        cal = self.reg_map[0x05]
+        if reg == 0x02:
+            return clip(self.volt / 1.25e-3, 0, 0x7FFF)
+        elif reg == 0x04:
+            if cal == 0:
+                return 0
+            return clip(self.curr / 1e-4, -0x8000, 0x7FFF) & 0xFFFF
+        elif reg == 0x03:
+            if cal == 0:
+                return 0
+            return clip(self.volt * abs(self.curr) / 2.5e-3, 0, 0xFFFF)
+        elif reg == 0x01:
+            return clip(self.curr * 0.025 / 2.5e-6, -0x8000, 0x7FFF) & 0xFFFF
+        return super().get_reg(reg)
+
+class ADS1015(WordRegDevice):
+    DATA_RATE       = [128, 250, 490, 920, 1600, 2400, 3300, 3300]
+    FSR             = [6.144, 4.096, 2.048, 1.024, 0.512, 0.256, 0.256, 0.256]
+
+    def __init__(self, dev_addr=0x48, mvolt=0.0):
+        super().__init__(dev_addr, {0x00: 0x0000, 0x01: 0x8583, 0x02: 0x8000, 0x03: 0x7FFF})
+        self.mvolt = mvolt
+        self.pending = 0
+        self.ready_at = 0
+
+    def on_write(self, reg, value):
+        if (reg == 0x01) and (value & 0x8000):
+            pga = (value >> 9) & 0x07
+            rate = self.DATA_RATE[(value >> 5) & 0x07]
+            raw = clip(self.mvolt / (self.FSR[pga] * 1000 / 2048), -2048, 2047)
+            self.pending = (raw << 4) & 0xFFFF
+            self.ready_at = time.monotonic() + 1.0 / rate
+            self.reg_map[0x01] = value & 0x7FFF
+
+    def get_reg(self, reg):
+        if (self.ready_at != 0) and (time.monotonic() >= self.ready_at):
+            self.reg_map[0x00] = self.pending
+            self.reg_map[0x01] |= 0x8000
+            self.ready_at = 0
+        return super().get_reg(reg)
+
+class CCS811(I2CDevice):
+    def __init__(self, dev_addr=0x5A, eco2=400, tvoc=0):
+        super().__init__(dev_addr)
+        self.eco2 = eco2
+        self.tvoc = tvoc
+        self.ptr = 0x00
+        self.app_mode = False
+        self.meas_mode = 0x00
+        self.meas_at = None
+
+    def status(self):
+        status = 0x10 # APP_VALID
+        if self.app_mode:
+            status |= 0x80 # FW_MODE
+        if (self.meas_at is not None) and (time.monotonic() >= self.meas_at):
+            status |= 0x08 # DATA_READY
+        return status
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        self.ptr = data[0]
+        if self.ptr == 0xF4: # APP_START
+            self.app_mode = True
+        elif (self.ptr == 0x01) and (len(data) >= 2):
+            if not self.app_mode:
+                nack()
+            self.meas_mode = data[1]
+            self.meas_at = time.monotonic() + 1.0 if self.meas_mode & 0x70 else None
+
+    def read(self, count):
+        if self.ptr == 0x00:
+            data = bytes([self.status()])
+        elif self.ptr == 0x01:
+            data = bytes([self.meas_mode])
+        elif self.ptr == 0x20:
+            data = bytes([0x81])
+        elif self.ptr == 0x02:
+            if self.meas_at is None:
+                data = bytes(8)
+            else:
+                data = struct.pack('>HHBB', self.eco2, self.tvoc, self.status(), 0)
+        else:
+            nack()
+        return (data + bytes(count))[0:count]
+
+class VEML6075(WordRegDevice):
+    BYTEORDER       = 'little'
+    IT_TIME         = [0.05, 0.1, 0.2, 0.4, 0.8]
+
+    def __init__(self, dev_addr=0x10, uva=300, uvb=300):
+        super().__init__(dev_addr, {0x00: 0x01, 0x07: 0, 0x09: 0, 0x0A: 0, 0x0B: 0, 0x0C: 0x0026})
+        self.uva = uva
+        self.uvb = uvb
+        self.ready_at = None
+
+    def on_write(self, reg, value):
+        if (reg == 0x00) and ((value & 0x01) == 0) and (value & 0x04):
+            it = (value >> 4) & 0x07
+            self.ready_at = time.monotonic() + self.IT_TIME[min(it, 4)]
+
+    def get_reg(self, reg):
+        if (self.ready_at is not None) and (time.monotonic() >= self.ready_at):
+            self.reg_map[0x07] = clip(self.uva, 0, 0xFFFF)
+            self.reg_map[0x09] = clip(self.uvb, 0, 0xFFFF)
+            self.ready_at = None
+        return super().get_reg(reg)
+
+class VEML7700(WordRegDevice):
+    BYTEORDER       = 'little'
+    GAIN            = {0x0: 1, 0x1: 2, 0x2: 0.125, 0x3: 0.25}
+    IT              = {0x0: 100, 0x1: 200, 0x2: 400, 0x3: 800, 0x8: 50, 0xC: 25}
+
+    def __init__(self, dev_addr=0x10, lux=500.0):
+        super().__init__(dev_addr, {0x00: 0x0001, 0x04: 0, 0x05: 0})
+        self.lux = lux
+        self.ready_at = None
+
+    def on_write(self, reg, value):
+        if reg == 0x00:
+            if value & 0x01:
+                self.ready_at = None
+            else:
+                it = self.IT.get((value >> 6) & 0x0F, 100)
+                self.ready_at = time.monotonic() + it / 1000.0
+
+    def get_reg(self, reg):
+        if (reg == 0x04) and (self.ready_at is not None):
+            if time.monotonic() < self.ready_at:
+                return 0
+            conf = self.reg_map[0x00]
+            gain = self.GAIN[(conf >> 11) & 0x3]
+            it = self.IT.get((conf >> 6) & 0x0F, 100)
+            return clip(self.lux / (0.0036 * (800 / it) * (2 / gain)), 0, 0xFFFF)
+        return super().get_reg(reg)
+
+class EZO(I2CDevice):
+    # Atlas Scientific の EZO シリーズ (ASCII コマンド)
+    TYPE            = 'EZO'
+    READ_TIME       = 0.6
+
+    def __init__(self, dev_addr, value):
+        super().__init__(dev_addr)
+        self.value = value
+        self.resp = None
+        self.ready_at = 0
+
+    def format_value(self):
+        return '{:.3f}'.format(self.value)
+
+    def write(self, data):
+        cmd = data.decode(errors='replace').upper()
+        now = time.monotonic()
+        if cmd == 'I':
+            self.resp = '?I,{},2.10'.format(self.TYPE)
+            self.ready_at = now + 0.3
+        elif cmd == 'R':
+            self.resp = self.format_value()
+            self.ready_at = now + self.READ_TIME
+        else:
+            self.resp = ''
+            self.ready_at = now + 0.3
+
+    def read(self, count):
+        if self.resp is None:
+            data = bytes([255])
+        elif time.monotonic() < self.ready_at:
+            data = bytes([254])
+        else:
+            data = bytes([1]) + self.resp.encode()
+        return (data + bytes(count))[0:count]
+
+class EZO_RTD(EZO):
+    TYPE            = 'RTD'
+
+    def __init__(self, dev_addr=0x66, temp=25.0):
+        super().__init__(dev_addr, temp)
+
+class EZO_PH(EZO):
+    TYPE            = 'pH'
+    READ_TIME       = 0.9
+
+    def __init__(self, dev_addr=0x64, ph=7.0):
+        super().__init__(dev_addr, ph)
+
+class EZO_DO(EZO):
+    TYPE            = 'DO'
+
+    def __init__(self, dev_addr=0x68, do=8.0):
+        super().__init__(dev_addr, do)
+
+    def format_value(self):
+        return '{:.2f}'.format(self.value)
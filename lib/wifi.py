@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Wi-Fi の受信強度とチャンネルを取得するライブラリです．
+#
+# 以前は計測の度に sudo iwconfig / sudo iwlist をパイプでつないで
+# 実行していましたが，Pi Zero ではプロセスの起動の方がセンサの
+# 読み出しより重いので，カーネルから直接取得します．
+#
+# - 受信強度: /proc/net/wireless の level (dBm)
+# - チャンネル: SIOCGIWFREQ で取得した周波数から計算 (iwlist と同じ ioctl)
+#
+# どちらも root 権限は不要です．常駐する場合に何度も呼ばれても
+# 大丈夫なように，結果は CACHE_TTL の間使い回します．
+
+import time
+import fcntl
+import socket
+import struct
+
+INTERFACE       = 'wlan0'
+CACHE_TTL       = 5 # 結果を使い回す期間 [sec]
+
+WIRELESS_PATH   = '/proc/net/wireless'
+SIOCGIWFREQ     = 0x8B05 # linux/wireless.h
+IFNAMSIZ        = 16
+
+_cache_map = {}
+
+# 受信強度 [dBm] を返します．接続していない場合は None です．
+def get_rssi(ifname=INTERFACE):
+    try:
+        with open(WIRELESS_PATH, 'r') as f:
+            # NOTE: 先頭の 2 行はヘッダ
+            for line in f.readlines()[2:]:
+                (name, stat) = line.split(':', 1)
+                if name.strip() != ifname:
+                    continue
+                # status link level noise ...
+                level = int(float(stat.split()[2]))
+                # NOTE: 古いドライバは 8bit の符号無しで返す
+                if level > 0:
+                    level -= 256
+                if level == 0:
+                    return None
+                return level
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+# 周波数 [MHz] を返します．取得できない場合は None です．
+def get_freq(ifname=INTERFACE):
+    # struct iwreq { char ifr_name[IFNAMSIZ]; struct iw_freq { __s32 m; __s16 e; __u8 i; __u8 flags; }; }
+    req = struct.pack('%dsihBB4x' % IFNAMSIZ, ifname.encode(), 0, 0, 0, 0)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        res = fcntl.ioctl(sock.fileno(), SIOCGIWFREQ, req)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+    (m, e) = struct.unpack_from('ih', res, IFNAMSIZ)
+    freq = m * (10 ** e)
+    if freq <= 0:
+        return None
+
+    # NOTE: ドライバによってはチャンネル番号がそのまま返ってくる
+    if freq < 1000:
+        return channel_to_freq(freq)
+    return int(round(freq / 1000000.0))
+
+def channel_to_freq(ch):
+    if ch == 14:
+        return 2484
+    elif ch < 14:
+        return 2407 + ch * 5
+    else:
+        return 5000 + ch * 5
+
+# 周波数からチャンネルを返します．5GHz 帯は以前の iwlist を使った実装に
+# 合わせて 0 を返します．
+def freq_to_channel(freq):
+    if freq == 2484:
+        return 14
+    elif 2412 <= freq < 2484:
+        return int(round((freq - 2407) / 5.0))
+    else:
+        return 0
+
+# { 'wifi_rssi': 受信強度, 'wifi_ch': チャンネル } を返します．
+# 接続していない場合は空の辞書です．
+def get_stat(ifname=INTERFACE):
+    now = time.monotonic()
+    cache = _cache_map.get(ifname)
+    if (cache is not None) and ((now - cache[0]) < CACHE_TTL):
+        return dict(cache[1])
+
+    value_map = {}
+    rssi = get_rssi(ifname)
+    if rssi is not None:
+        freq = get_freq(ifname)
+        value_map['wifi_rssi'] = rssi
+        value_map['wifi_ch'] = 0 if freq is None else freq_to_channel(freq)
+
+    _cache_map[ifname] = (now, value_map)
+
+    return dict(value_map)
+
+if __name__ == '__main__':
+    # TEST Code
+    import pprint
+
+    print('FREQ: %s' % get_freq())
+    pprint.pprint(get_stat())